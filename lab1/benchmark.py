@@ -0,0 +1,440 @@
+import io
+import json
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+from array import array
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import redirect_stdout
+from datetime import datetime, date, timedelta
+from typing import Iterable
+
+from models import *
+from data_manager import DataManager, XmlStreamWriter
+from columnar import ColumnarStore
+from schema import PASSENGER, TRIP, transport_to_dict
+from wal import ChangeLog
+
+
+def make_large_system(trips: int = 100_000, passengers: int = 20_000, tickets_per_passenger: int = 5,
+                      seed: int = 42) -> TransportSystem:
+    """Создает систему с заданным числом рейсов, пассажиров и билетов"""
+    rnd = random.Random(seed)
+    system = TransportSystem()
+    classes = [(Bus, "101"), (Train, 8), (Tram, "3")]
+
+    for i in range(1, trips // 100 + 2):
+        cls, extra = classes[i % 3]
+        system.company.transports.append(cls(i, f"Модель {i % 17}", 50 + i % 100, 40.0 + i % 60, extra))
+
+    start = datetime(2024, 1, 1, 5, 0)
+    for i in range(1, trips + 1):
+        departure = start + timedelta(minutes=rnd.randrange(0, 60 * 24 * 90))
+        arrival = departure + timedelta(minutes=rnd.randrange(15, 180))
+        system.trips.append(Trip(i, departure.date(), departure, arrival))
+
+    for i in range(1, trips // 50 + 2):
+        driver = Driver(i, f"Водитель {i}", f"AB{i:06d}")
+        driver.assigned_trips.extend(system.trips[(i - 1) * 50:i * 50])
+        system.company.drivers.append(driver)
+
+    stop_names = [f"Остановка {i}" for i in range(500)]
+    for i in range(1, trips // 200 + 2):
+        route = Route(i, str(i), 5.0 + i % 30)
+        route.stops = rnd.sample(stop_names, 12)
+        system.routes.append(route)
+
+    ticket_date = date(2024, 1, 1)
+    for i in range(1, passengers + 1):
+        passenger = Passenger(i, f"Пассажир {i}", f"+7999{i:07d}")
+        for j in range(1, tickets_per_passenger + 1):
+            ticket = Ticket(j, 20.0 + rnd.randrange(0, 300), ticket_date + timedelta(days=rnd.randrange(0, 90)))
+            ticket.passenger_id = i
+            passenger.tickets.append(ticket)
+        system.passengers.append(passenger)
+
+    return system
+
+
+def timed(func, *args) -> float:
+    started = time.perf_counter()
+    with redirect_stdout(io.StringIO()):
+        func(*args)
+    return time.perf_counter() - started
+
+
+def bench_persistence(system: TransportSystem):
+    """Сравнивает время сохранения и загрузки JSON и бинарного снимка"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        json_file = os.path.join(tmpdir, "system.json")
+        binary_file = os.path.join(tmpdir, "system.bin")
+
+        json_save = timed(DataManager.save_to_json, system, json_file)
+        json_load = timed(DataManager.load_from_json, json_file, TransportSystem())
+        binary_save = timed(DataManager.save_to_binary, system, binary_file)
+        binary_load = timed(DataManager.load_from_binary, binary_file, TransportSystem())
+
+        print("Формат      сохранение  загрузка   размер")
+        print(f"JSON        {json_save:9.3f}s {json_load:8.3f}s {os.path.getsize(json_file) / 2**20:7.1f} MB")
+        print(f"binary      {binary_save:9.3f}s {binary_load:8.3f}s {os.path.getsize(binary_file) / 2**20:7.1f} MB")
+        print(f"Ускорение:  {json_save / binary_save:9.1f}x {json_load / binary_load:8.1f}x")
+
+        started = time.perf_counter()
+        with DataManager.open_snapshot(binary_file) as snapshot:
+            opened = time.perf_counter() - started
+            trips = [snapshot.trips[i] for i in range(0, len(snapshot.trips), len(snapshot.trips) // 10)]
+            touched = time.perf_counter() - started
+        print(f"open_snapshot: открытие {opened * 1000:.3f} ms, {len(trips)} рейсов {touched * 1000:.3f} ms")
+
+
+def bench_time_codec(system: TransportSystem):
+    """Сравнивает JSON с датами в ISO и числами от эпохи"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for epoch in (False, True):
+            filename = os.path.join(tmpdir, f"system-{epoch}.json")
+            save = timed(DataManager.save_to_json, system, filename, epoch)
+            with open(filename, encoding="utf-8") as f:
+                data = json.load(f)
+
+            def by_columns():
+                return (DataManager._trips_from_dicts(data["trips"]),
+                        DataManager._passengers_from_dicts(data["passengers"]))
+
+            def one_by_one():
+                return ([DataManager._trip_from_dict(trip_data) for trip_data in data["trips"]],
+                        [DataManager._passenger_from_dict(passenger_data) for passenger_data in data["passengers"]])
+
+            build = min(timed(by_columns) for _ in range(3))
+            single = min(timed(one_by_one) for _ in range(3))
+            load = timed(DataManager.load_from_json, filename, TransportSystem())
+            print(f"{'epoch' if epoch else 'ISO':5}  сохранение {save:6.3f}s  загрузка {load:6.3f}s  "
+                  f"размер {os.path.getsize(filename) / 2**20:5.1f} MB  "
+                  f"объекты: по колонкам {build:.3f}s, по одному {single:.3f}s")
+
+
+def bench_shards(system: TransportSystem):
+    """Сравнивает один JSON файл и шарды, сохраняемые и загружаемые пулом процессов
+
+    Для системы из 10M билетов: make_large_system(passengers=2_000_000).
+    """
+    cores = os.cpu_count() or 1
+    with tempfile.TemporaryDirectory() as tmpdir:
+        json_file = os.path.join(tmpdir, "system.json")
+        json_save = timed(DataManager.save_to_json, system, json_file)
+        json_load = timed(DataManager.load_from_json, json_file, TransportSystem())
+        print(f"Ядер: {cores}")
+        print(f"Один файл         сохранение {json_save:7.3f}s  загрузка {json_load:7.3f}s")
+        for workers in sorted({1, 2, 4, cores}):
+            directory = os.path.join(tmpdir, f"shards-{workers}")
+            save = timed(DataManager.save_to_shards, system, directory, max(workers, 4), workers)
+            load = timed(DataManager.load_from_shards, directory, TransportSystem(), workers)
+            print(f"Шарды, {workers:2} проц.   сохранение {save:7.3f}s  загрузка {load:7.3f}s  "
+                  f"({json_save / save:.1f}x / {json_load / load:.1f}x)")
+
+
+def walker_to_dict(system: TransportSystem) -> dict:
+    """Прежний рукописный обход для сравнения: цепочка isinstance по видам транспорта"""
+    transports = []
+    for transport in system.company.transports:
+        base = {"id": transport.id, "model": transport.model, "capacity": transport.capacity,
+                "speed": transport.speed, "status": transport.status}
+        if isinstance(transport, Bus):
+            base.update({"type": "bus", "route_number": transport.route_number})
+        elif isinstance(transport, Train):
+            base.update({"type": "train", "wagons": transport.wagons})
+        elif isinstance(transport, Tram):
+            base.update({"type": "tram", "line_number": transport.line_number})
+        transports.append(base)
+    trips = [{"id": trip.id, "date": trip.date.isoformat(), "departure_time": trip.departure_time.isoformat(),
+              "arrival_time": trip.arrival_time.isoformat(), "status": trip.status, "transport_id": trip.transport_id}
+             for trip in system.trips]
+    passengers = [{"id": passenger.id, "full_name": passenger.full_name, "phone": passenger.phone,
+                   "tickets": [{"id": ticket.id, "price": ticket.price, "issue_date": ticket.issue_date.isoformat(),
+                                "status": ticket.status, "trip_id": ticket.trip_id} for ticket in passenger.tickets]}
+                  for passenger in system.passengers]
+    return {"transports": transports, "trips": trips, "passengers": passengers}
+
+
+def schema_to_dict(system: TransportSystem) -> dict:
+    return {"transports": list(map(transport_to_dict, system.company.transports)),
+            "trips": TRIP.to_dicts(system.trips),
+            "passengers": PASSENGER.to_dicts(system.passengers)}
+
+
+def walker_to_xml(system: TransportSystem) -> str:
+    """Прежний рукописный вывод рейсов и пассажиров через XmlStreamWriter"""
+    f = io.StringIO()
+    writer = XmlStreamWriter(f)
+    for trip in system.trips:
+        writer.start("trip", {"id": str(trip.id), "date": trip.date.isoformat(), "status": trip.status})
+        writer.element("departure_time", text=trip.departure_time.isoformat())
+        writer.element("arrival_time", text=trip.arrival_time.isoformat())
+        writer.end("trip")
+    for passenger in system.passengers:
+        writer.start("passenger", {"id": str(passenger.id), "full_name": passenger.full_name, "phone": passenger.phone})
+        writer.start("tickets")
+        for ticket in passenger.tickets:
+            writer.element("ticket", {"id": str(ticket.id), "price": str(ticket.price),
+                                      "issue_date": ticket.issue_date.isoformat(), "status": ticket.status})
+        writer.end("tickets")
+        writer.end("passenger")
+    return f.getvalue()
+
+
+def schema_to_xml(system: TransportSystem) -> str:
+    f = io.StringIO()
+    writer = XmlStreamWriter(f)
+    for trip in system.trips:
+        writer.write(TRIP.to_xml(trip))
+    for passenger in system.passengers:
+        writer.write(PASSENGER.to_xml(passenger))
+    return f.getvalue()
+
+
+def bench_serializers(system: TransportSystem):
+    """Сравнивает функции, сгенерированные по схеме (schema.py), с рукописным обходом"""
+    assert walker_to_dict(system) == schema_to_dict(system)
+    assert walker_to_xml(system) == schema_to_xml(system)
+    for name, walker, generated in [("JSON-словарь", walker_to_dict, schema_to_dict),
+                                    ("XML", walker_to_xml, schema_to_xml)]:
+        before = min(timed(walker, system) for _ in range(3))
+        after = min(timed(generated, system) for _ in range(3))
+        print(f"{name:13} рукописный {before:.3f}s  по схеме {after:.3f}s  ({before / after:.1f}x)")
+
+
+def bench_queries(system: TransportSystem, repeat: int = 100):
+    """Сравнивает запросы по вторичным индексам с перебором коллекций"""
+    day = date(2024, 2, 1)
+    week = (date(2024, 2, 5), date(2024, 2, 11))
+    started = system.company.transports[::7]
+    with event_sink(NullSink()):
+        for transport in started:
+            transport.start()
+    cases = [
+        ("работающие трамваи",
+         lambda: [t for t in system.company.transports if t.status == "running" and type(t) is Tram],
+         lambda: system.query("transports").where(status="running", type=Tram).all()),
+        ("активные билеты за день",
+         lambda: [t for p in system.passengers for t in p.tickets if t.issue_date == day and t.status == "active"],
+         lambda: system.query("tickets").where(issue_date=day, status="active").all()),
+        ("рейсы за неделю",
+         lambda: [t for t in system.trips if week[0] <= t.date <= week[1]],
+         lambda: system.query("trips").between("date", *week).all()),
+    ]
+    for name, scan, indexed in cases:
+        assert sorted(map(id, scan())) == sorted(map(id, indexed()))
+        before = timed(lambda: [scan() for _ in range(repeat)]) / repeat
+        after = timed(lambda: [indexed() for _ in range(repeat)]) / repeat
+        print(f"{name:25} перебор {before * 1000:7.3f} ms  индекс {after * 1000:7.3f} ms  ({before / after:.0f}x)")
+    with event_sink(NullSink()):
+        for transport in started:
+            transport.stop()
+
+
+def box_office_system(trips: int, passengers: int, capacity: int = 30) -> TransportSystem:
+    """Система с рейсами, на которые назначены автобусы, и пассажирами без билетов"""
+    system = TransportSystem()
+    with event_sink(NullSink()):
+        for i in range(1, trips // 10 + 1):
+            system.company.add_transport(Bus(i, f"Модель {i % 17}", capacity, 60.0, str(i)))
+        for i in range(1, trips + 1):
+            departure = datetime(2024, 3, 1, 5, 0) + timedelta(minutes=i)
+            trip = Trip(i, departure.date(), departure, departure + timedelta(minutes=40))
+            system.add_trip(trip)
+            system.assign_transport(trip, system.company.transports[i % len(system.company.transports)])
+        for i in range(1, passengers + 1):
+            system.add_passenger(Passenger(i, f"Пассажир {i}", f"+7999{i:07d}"))
+    return system
+
+
+def bench_box_office(trips: int = 10_000, passengers: int = 20_000, sales: int = 200_000):
+    """Время продажи и отмены билета через журнал билетов системы"""
+    rnd = random.Random(7)
+    system = box_office_system(trips, passengers)
+    with event_sink(NullSink()):
+        buyers = [system.passengers[rnd.randrange(passengers)] for _ in range(sales)]
+        targets = [system.trips[rnd.randrange(trips)] for _ in range(sales)]
+
+        started = time.perf_counter()
+        sold = []
+        for passenger, trip in zip(buyers, targets):
+            try:
+                sold.append(system.sell_ticket(passenger, trip, 50.0))
+            except ValueError:
+                pass
+        sell = time.perf_counter() - started
+
+        cancelled = [ticket.id for ticket in sold[::2]]
+        started = time.perf_counter()
+        for ticket_id in cancelled:
+            system.cancel_ticket(ticket_id)
+        cancel = time.perf_counter() - started
+    seats = sum(system.ledger.sold_seats(trip.id) for trip in system.trips)
+    print(f"Продано {len(sold)} из {sales} ({sell / sales * 1e6:.1f} мкс на попытку), "
+          f"отменено {len(cancelled)} ({cancel / len(cancelled) * 1e6:.1f} мкс на билет); занято мест {seats}")
+
+
+def bench_concurrent_sales(workers: Iterable[int] = (1, 4, 16), trips: int = 2_000, passengers: int = 20_000,
+                           attempts: int = 120_000):
+    """Продажи в секунду из нескольких потоков и проверка отсутствия овербукинга
+
+    Попыток вдвое больше, чем мест, поэтому потоки одновременно
+    разбирают последние места одних и тех же рейсов.
+    """
+    for count in workers:
+        rnd = random.Random(11)
+        system = box_office_system(trips, passengers)
+        purchases = [(system.passengers[rnd.randrange(passengers)], system.trips[rnd.randrange(trips)])
+                     for _ in range(attempts)]
+
+        def sell(chunk):
+            sold = 0
+            for passenger, trip in chunk:
+                try:
+                    system.sell_ticket(passenger, trip, 50.0)
+                    sold += 1
+                except ValueError:
+                    pass
+            return sold
+
+        with event_sink(NullSink()), ThreadPoolExecutor(count) as pool:
+            started = time.perf_counter()
+            sold = sum(pool.map(sell, [purchases[i::count] for i in range(count)]))
+            elapsed = time.perf_counter() - started
+        active = Counter(ticket.trip_id for ticket in system.query("tickets").where(status="active"))
+        overbooked = sum(active[trip.id] > system.trip_capacity(trip) for trip in system.trips)
+        consistent = all(active[trip.id] == system.ledger.sold_seats(trip.id) for trip in system.trips)
+        print(f"Потоков {count:>2}: {attempts / elapsed:,.0f} попыток/с, продано {sold} "
+              f"({sold / elapsed:,.0f} билетов/с); переполненных рейсов {overbooked}, "
+              f"счетчики {'сходятся' if consistent else 'НЕ сходятся'}")
+
+
+def bench_change_log(system: TransportSystem, changes: int = 1_000):
+    """Сравнивает журнал изменений с полным сохранением после каждого изменения"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        log = ChangeLog(os.path.join(tmpdir, "wal"), system, snapshot_every=changes + 1)
+        snapshot = timed(log.start)
+        tickets = [passenger.tickets[0] for passenger in system.passengers[:changes]]
+        started = time.perf_counter()
+        with event_sink(NullSink()):
+            for ticket in tickets:
+                ticket.update_price(ticket.price + 1)
+        logged = time.perf_counter() - started
+        log.stop()
+        full = timed(DataManager.save_to_binary, system, os.path.join(tmpdir, "system.bin"))
+        recover = timed(ChangeLog(log.directory, TransportSystem()).recover)
+    print(f"Начальный снимок {snapshot:.3f}s; {changes} изменений в журнал {logged:.3f}s "
+          f"({logged / changes * 1e6:.0f} мкс на изменение, полный снимок {full:.3f}s); восстановление {recover:.3f}s")
+
+
+def attribute_names(cls) -> list:
+    return [name for klass in reversed(cls.__mro__) for name in getattr(klass, "__slots__", ())]
+
+
+def bytes_per_object(cls, names: list, values: list, count: int) -> float:
+    """Средний объем памяти на экземпляр cls с заданными атрибутами"""
+    tracemalloc.start()
+    objects = []
+    for _ in range(count):
+        obj = cls.__new__(cls)
+        for name, value in zip(names, values):
+            setattr(obj, name, value)
+        objects.append(obj)
+    allocated, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return allocated / count
+
+
+def bench_memory(count: int = 100_000):
+    """Сравнивает память на объект со __slots__ и с __dict__ (как до их введения)"""
+    day = date(2024, 1, 1)
+    moment = datetime(2024, 1, 1, 8, 0)
+    samples = [
+        Trip(1, day, moment, moment),
+        Ticket(1, 45.5, day),
+        Bus(1, "Mercedes Citaro", 50, 60.0, "101"),
+        Train(2, "Ласточка", 400, 120.0, 5),
+        Tram(3, "Tatra T3", 80, 40.0, "3"),
+    ]
+    print("Класс     __dict__  __slots__  (байт на объект, значения атрибутов общие)")
+    for obj in samples:
+        cls = type(obj)
+        names = attribute_names(cls)
+        values = [getattr(obj, name) for name in names]
+        plain = type(cls.__name__, (), {})
+        before = bytes_per_object(plain, names, values, count)
+        after = bytes_per_object(cls, names, values, count)
+        print(f"{cls.__name__:8} {before:9.0f} {after:10.0f}")
+
+
+def bench_columnar(system: TransportSystem):
+    """Сравнивает агрегаты по объектам и по колоночному хранилищу"""
+    def by_objects():
+        revenue = {}
+        for passenger in system.passengers:
+            for ticket in passenger.tickets:
+                if ticket.status == "active":
+                    revenue[ticket.issue_date] = revenue.get(ticket.issue_date, 0.0) + ticket.price
+        total = sum((trip.get_duration() for trip in system.trips), timedelta(0))
+        return revenue, total / len(system.trips)
+
+    def by_columns():
+        return store.revenue_by_day(), store.mean_trip_duration()
+
+    started = time.perf_counter()
+    store = ColumnarStore.from_system(system)
+    build = time.perf_counter() - started
+    objects = timed(by_objects)
+    columns = timed(by_columns)
+    columns_size = sum(column.itemsize * len(column) for column in vars(store).values() if isinstance(column, array))
+    print(f"Построение хранилища: {build:.3f}s, колонки занимают {columns_size / 2**20:.1f} MB")
+    print(f"Выручка по дням + средняя длительность: объекты {objects:.3f}s, колонки {columns:.3f}s ({objects / columns:.1f}x)")
+
+
+def bench_assignment(trips: int = 300_000, drivers: int = 3_000):
+    """Время автоматического назначения рейсов и отчета о конфликтах"""
+    rnd = random.Random(1)
+    system = TransportSystem()
+    start = datetime(2024, 1, 1, 5, 0)
+    for i in range(1, trips + 1):
+        departure = start + timedelta(minutes=rnd.randrange(0, 60 * 24 * 30))
+        system.trips.append(Trip(i, departure.date(), departure, departure + timedelta(minutes=rnd.randrange(15, 180))))
+    with redirect_stdout(io.StringIO()):
+        system.company.hire_drivers(Driver(i, f"Водитель {i}", f"AB{i:06d}") for i in range(1, drivers + 1))
+
+    started = time.perf_counter()
+    with redirect_stdout(io.StringIO()):
+        result = system.auto_assign_trips(min_rest=timedelta(minutes=20))
+    assign = time.perf_counter() - started
+    report = timed(system.find_driver_conflicts, timedelta(minutes=20))
+    print(f"{trips} рейсов, {drivers} водителей: назначено {result.assigned_count} за {assign:.3f}s, "
+          f"без водителя {len(result.unassigned)}; отчет о конфликтах {report:.3f}s")
+
+
+if __name__ == "__main__":
+    system = make_large_system()
+    print("\n=== СОХРАНЕНИЕ И ЗАГРУЗКА ===")
+    bench_persistence(system)
+    print("\n=== СЕРИАЛИЗАЦИЯ ПО СХЕМЕ ===")
+    bench_serializers(system)
+    print("\n=== КОДИРОВАНИЕ ДАТ ===")
+    bench_time_codec(system)
+    print("\n=== ШАРДЫ ===")
+    bench_shards(system)
+    print("\n=== ЗАПРОСЫ ===")
+    bench_queries(system)
+    print("\n=== КАССА ===")
+    bench_box_office()
+    print("\n=== ПАРАЛЛЕЛЬНЫЕ ПРОДАЖИ ===")
+    bench_concurrent_sales()
+    print("\n=== ЖУРНАЛ ИЗМЕНЕНИЙ ===")
+    bench_change_log(system)
+    print("\n=== ПАМЯТЬ ===")
+    bench_memory()
+    print("\n=== КОЛОНОЧНОЕ ХРАНИЛИЩЕ ===")
+    bench_columnar(system)
+    print("\n=== НАЗНАЧЕНИЕ РЕЙСОВ ===")
+    bench_assignment()
@@ -0,0 +1,167 @@
+import operator
+from array import array
+from collections import Counter, defaultdict
+from datetime import date
+from itertools import compress
+from typing import Dict, Iterable, List, Optional
+from models import *
+from snapshot import NONE_ID
+from timecodec import from_epoch_us, to_epoch_us
+
+
+class StatusCodes:
+    """Двусторонняя таблица статус <-> код для колонок статусов"""
+    def __init__(self, statuses: Iterable[str] = ()):
+        self.names: List[str] = []
+        self.codes: Dict[str, int] = {}
+        for status in statuses:
+            self.code(status)
+
+    def code(self, status: str) -> int:
+        code = self.codes.get(status)
+        if code is None:
+            code = self.codes[status] = len(self.names)
+            self.names.append(status)
+        return code
+
+
+class ColumnarStore:
+    """Колоночное хранилище рейсов и билетов на массивах модуля array
+
+    Каждое поле хранится в отдельном типизированном массиве, поэтому
+    агрегаты считаются проходом по массивам чисел без обращения
+    к атрибутам объектов Trip и Ticket.
+    """
+    def __init__(self):
+        self.trip_statuses = StatusCodes(["scheduled", "in_progress", "completed"])
+        self.trip_ids = array("q")
+        self.trip_dates = array("l")        # date.toordinal()
+        self.departures = array("q")        # микросекунды от 1970-01-01
+        self.arrivals = array("q")
+        self.trip_status = array("b")
+        self.trip_transport_ids = array("q")    # NONE_ID без транспорта
+
+        self.ticket_statuses = StatusCodes(["active", "cancelled"])
+        self.ticket_ids = array("q")
+        self.ticket_passenger_ids = array("q")
+        self.ticket_prices = array("d")
+        self.ticket_dates = array("l")      # date.toordinal()
+        self.ticket_status = array("b")
+        self.ticket_trip_ids = array("q")       # NONE_ID без рейса
+
+    @classmethod
+    def from_system(cls, system: 'TransportSystem') -> 'ColumnarStore':
+        store = cls()
+        store.add_trips(system.trips)
+        for passenger in system.passengers:
+            store.add_tickets(passenger.id, passenger.tickets)
+        return store
+
+    def add_trips(self, trips: Iterable['Trip']):
+        code = self.trip_statuses.code
+        for trip in trips:
+            self.trip_ids.append(trip.id)
+            self.trip_dates.append(trip.date.toordinal())
+            self.departures.append(to_epoch_us(trip.departure_time))
+            self.arrivals.append(to_epoch_us(trip.arrival_time))
+            self.trip_status.append(code(trip.status))
+            self.trip_transport_ids.append(NONE_ID if trip.transport_id is None else trip.transport_id)
+
+    def add_tickets(self, passenger_id: int, tickets: Iterable['Ticket']):
+        code = self.ticket_statuses.code
+        for ticket in tickets:
+            self.ticket_ids.append(ticket.id)
+            self.ticket_passenger_ids.append(passenger_id)
+            self.ticket_prices.append(ticket.price)
+            self.ticket_dates.append(ticket.issue_date.toordinal())
+            self.ticket_status.append(code(ticket.status))
+            self.ticket_trip_ids.append(NONE_ID if ticket.trip_id is None else ticket.trip_id)
+
+    def to_trips(self) -> List['Trip']:
+        """Восстанавливает объекты Trip из колонок"""
+        trips = []
+        names = self.trip_statuses.names
+        for trip_id, day, departure, arrival, status, transport_id in zip(
+                self.trip_ids, self.trip_dates, self.departures, self.arrivals, self.trip_status,
+                self.trip_transport_ids):
+            trip = Trip(trip_id, date.fromordinal(day), from_epoch_us(departure), from_epoch_us(arrival))
+            trip.status = names[status]
+            trip.transport_id = None if transport_id == NONE_ID else transport_id
+            trips.append(trip)
+        return trips
+
+    def to_tickets(self) -> Dict[int, List['Ticket']]:
+        """Восстанавливает объекты Ticket, сгруппированные по id пассажира"""
+        tickets: Dict[int, List[Ticket]] = defaultdict(list)
+        names = self.ticket_statuses.names
+        for ticket_id, passenger_id, price, day, status, trip_id in zip(
+                self.ticket_ids, self.ticket_passenger_ids, self.ticket_prices, self.ticket_dates, self.ticket_status,
+                self.ticket_trip_ids):
+            ticket = Ticket(ticket_id, price, date.fromordinal(day))
+            ticket.status = names[status]
+            ticket.passenger_id = passenger_id
+            ticket.trip_id = None if trip_id == NONE_ID else trip_id
+            tickets[passenger_id].append(ticket)
+        return dict(tickets)
+
+    # --- фильтры ---
+
+    def _mask(self, column: array, statuses: StatusCodes, status: Optional[str]) -> Optional[bytes]:
+        """Флаги "статус совпадает" по одному байту на строку; None, если фильтра нет"""
+        if status is None:
+            return None
+        code = statuses.codes.get(status)
+        return bytes(map((-1 if code is None else code).__eq__, column))
+
+    def filter_trip_ids(self, status: str) -> array:
+        return array("q", compress(self.trip_ids, self._mask(self.trip_status, self.trip_statuses, status)))
+
+    def filter_ticket_ids(self, status: str) -> array:
+        return array("q", compress(self.ticket_ids, self._mask(self.ticket_status, self.ticket_statuses, status)))
+
+    # --- агрегаты ---
+
+    def revenue(self, status: Optional[str] = "active") -> float:
+        """Сумма цен билетов с заданным статусом (все билеты при status=None)"""
+        mask = self._mask(self.ticket_status, self.ticket_statuses, status)
+        return sum(self.ticket_prices if mask is None else compress(self.ticket_prices, mask))
+
+    def mean_ticket_price(self, status: Optional[str] = "active") -> float:
+        mask = self._mask(self.ticket_status, self.ticket_statuses, status)
+        count = len(self.ticket_prices) if mask is None else mask.count(1)
+        return self.revenue(status) / count if count else 0.0
+
+    def revenue_by_day(self, status: Optional[str] = "active") -> Dict[date, float]:
+        """Выручка по дням выдачи билетов"""
+        totals: Dict[int, float] = {}
+        get = totals.get
+        pairs = zip(self.ticket_dates, self.ticket_prices)
+        mask = self._mask(self.ticket_status, self.ticket_statuses, status)
+        for day, price in (pairs if mask is None else compress(pairs, mask)):
+            totals[day] = get(day, 0.0) + price
+        return {date.fromordinal(day): total for day, total in sorted(totals.items())}
+
+    def trips_by_day(self, status: Optional[str] = None) -> Dict[date, int]:
+        mask = self._mask(self.trip_status, self.trip_statuses, status)
+        counts = Counter(self.trip_dates if mask is None else compress(self.trip_dates, mask))
+        return {date.fromordinal(day): count for day, count in sorted(counts.items())}
+
+    def mean_trip_duration(self, status: Optional[str] = None) -> timedelta:
+        durations = map(operator.sub, self.arrivals, self.departures)
+        mask = self._mask(self.trip_status, self.trip_statuses, status)
+        if mask is None:
+            count = len(self.trip_ids)
+        else:
+            durations, count = compress(durations, mask), mask.count(1)
+        return timedelta(microseconds=sum(durations) / count) if count else timedelta(0)
+
+    def count_trips_by_status(self) -> Dict[str, int]:
+        return self._count_codes(self.trip_status, self.trip_statuses)
+
+    def count_tickets_by_status(self) -> Dict[str, int]:
+        return self._count_codes(self.ticket_status, self.ticket_statuses)
+
+    @staticmethod
+    def _count_codes(column: array, statuses: StatusCodes) -> Dict[str, int]:
+        counts = {name: column.count(code) for code, name in enumerate(statuses.names)}
+        return {name: count for name, count in counts.items() if count}
@@ -1,200 +1,375 @@
+import gc
 import json
+import multiprocessing
+import os
+import re
+import threading
 import xml.etree.ElementTree as ET
-from datetime import datetime, date
-from typing import Dict, Any
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from operator import itemgetter
+from typing import Dict, Any, List, Optional, Union
+from xml.sax.saxutils import escape
 from models import *
+from snapshot import SnapshotLayout, SnapshotReader, read_snapshot, write_snapshot
+from schema import (DRIVER, PASSENGER, ROUTE, TICKET, TRIP, XML_ATTRIB_ENTITIES, transport_from_dict,
+                    transport_from_xml, transport_to_dict, transport_to_xml)
+from timecodec import decode_dates, decode_datetimes
+
+
+# Sharded collections, the DataManager helper that serializes an item and
+# the one that restores a whole shard
+SHARD_KINDS = {
+    "transports": ("_transport_to_dict", "_transports_from_dicts"),
+    "trips": ("_trip_to_dict", "_trips_from_dicts"),
+    "passengers": ("_passenger_to_dict", "_passengers_from_dicts"),
+}
+SHARD_MANIFEST = "manifest.json"
+# Every save writes shards under a new generation number, so the files the
+# current manifest points to are never overwritten
+SHARD_FILE = re.compile(r"(transports|trips|passengers)-(\d{6}-)?\d{3}\.json$")
+_shard_collections: Dict[str, List[Any]] = {}
+
+
+def _shard_context() -> multiprocessing.context.BaseContext:
+    """Способ запуска процессов для шардов
+
+    Процессы, запущенные через fork, получают сохраняемые коллекции без
+    копирования. Но fork из многопоточного процесса может унаследовать
+    блокировку, захваченную другим потоком (например, при продаже
+    билетов), и зависнуть, поэтому fork используется, только если в
+    процессе один поток, а иначе - forkserver или spawn.
+    """
+    methods = multiprocessing.get_all_start_methods()
+    if "fork" in methods and threading.active_count() == 1:
+        return multiprocessing.get_context("fork")
+    return multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+
+
+def _write_json_atomic(data: Any, filename: str):
+    """Пишет JSON во временный файл и атомарно заменяет им filename"""
+    with open(filename + ".tmp", 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(filename + ".tmp", filename)
 
 
 class DataManager:
     @staticmethod
-    def to_dict(system: 'TransportSystem') -> Dict[str, Any]:
-        """Конвертирует всю систему в словарь для JSON"""
+    def to_dict(system: 'TransportSystem', epoch: bool = False) -> Dict[str, Any]:
+        """Конвертирует всю систему в словарь для JSON
+        
+        При epoch=True даты записываются числом дней, а время - числом
+        микросекунд от 1970-01-01 (см. timecodec.py).
+        """
         return {
             "company": {
                 "id": system.company.id,
                 "name": system.company.name,
                 "address": system.company.address,
-                "transports": [DataManager._transport_to_dict(t) for t in system.company.transports],
-                "drivers": [DataManager._driver_to_dict(d) for d in system.company.drivers]
+                "transports": list(map(transport_to_dict, system.company.transports)),
+                "drivers": DRIVER.to_dicts(system.company.drivers)
             },
-            "routes": [DataManager._route_to_dict(r) for r in system.routes],
-            "trips": [DataManager._trip_to_dict(t) for t in system.trips],
-            "passengers": [DataManager._passenger_to_dict(p) for p in system.passengers]
+            "routes": ROUTE.to_dicts(system.routes),
+            "trips": TRIP.batch_encoder(epoch)(system.trips),
+            "passengers": PASSENGER.batch_encoder(epoch)(system.passengers)
         }
     
+    # Per-entity converters are generated from the declarations in schema.py
+    _transport_to_dict = staticmethod(transport_to_dict)
+    _driver_to_dict = staticmethod(DRIVER.to_dict)
+    _route_to_dict = staticmethod(ROUTE.to_dict)
+    
     @staticmethod
-    def _transport_to_dict(transport: 'Transport') -> Dict[str, Any]:
-        base = {
-            "id": transport.id,
-            "model": transport.model,
-            "capacity": transport.capacity,
-            "speed": transport.speed,
-            "status": transport.status
-        }
-        if isinstance(transport, Bus):
-            base.update({"type": "bus", "route_number": transport.route_number})
-        elif isinstance(transport, Train):
-            base.update({"type": "train", "wagons": transport.wagons})
-        elif isinstance(transport, Tram):
-            base.update({"type": "tram", "line_number": transport.line_number})
-        return base
+    def _trip_to_dict(trip: 'Trip', epoch: bool = False) -> Dict[str, Any]:
+        return TRIP.encoder(epoch)(trip)
     
     @staticmethod
-    def _driver_to_dict(driver: 'Driver') -> Dict[str, Any]:
-        return {
-            "id": driver.id,
-            "name": driver.name,
-            "license_number": driver.license_number,
-            "assigned_trips": [t.id for t in driver.assigned_trips]
-        }
+    def _passenger_to_dict(passenger: 'Passenger', epoch: bool = False) -> Dict[str, Any]:
+        return PASSENGER.encoder(epoch)(passenger)
     
     @staticmethod
-    def _route_to_dict(route: 'Route') -> Dict[str, Any]:
-        return {
-            "id": route.id,
-            "number": route.number,
-            "length_km": route.length_km,
-            "stops": route.stops
-        }
+    def _ticket_to_dict(ticket: 'Ticket', epoch: bool = False) -> Dict[str, Any]:
+        return TICKET.encoder(epoch)(ticket)
     
     @staticmethod
-    def _trip_to_dict(trip: 'Trip') -> Dict[str, Any]:
-        return {
-            "id": trip.id,
-            "date": trip.date.isoformat(),
-            "departure_time": trip.departure_time.isoformat(),
-            "arrival_time": trip.arrival_time.isoformat(),
-            "status": trip.status
-        }
+    def save_to_json(system: 'TransportSystem', filename: str, epoch: bool = False):
+        """Сохраняет систему в JSON файл
+        
+        epoch=True записывает даты и время числами от эпохи: так быстрее
+        и компактнее. load_from_json читает оба варианта.
+        """
+        data = DataManager.to_dict(system, epoch)
+        with open(filename, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2, default=str)
+        print(f"Данные сохранены в {filename}")
     
     @staticmethod
-    def _passenger_to_dict(passenger: 'Passenger') -> Dict[str, Any]:
-        return {
-            "id": passenger.id,
-            "full_name": passenger.full_name,
-            "phone": passenger.phone,
-            "tickets": [{
-                "id": t.id,
-                "price": t.price,
-                "issue_date": t.issue_date.isoformat(),
-                "status": t.status
-            } for t in passenger.tickets]
+    def load_from_json(filename: str, system: 'TransportSystem', streaming: bool = False):
+        """Загружает систему из JSON файла
+        
+        При streaming=True массивы разбираются поэлементно, и пиковая память
+        остается близкой к размеру готового графа объектов.
+        """
+        with open(filename, 'r', encoding='utf-8') as f:
+            if streaming:
+                DataManager._load_from_json_stream(f, system)
+            else:
+                data = json.load(f)
+                DataManager._load_from_dict(data, system)
+        print(f"Данные загружены из {filename}")
+    
+    @staticmethod
+    def save_to_binary(system: 'TransportSystem', filename: str):
+        """Сохраняет систему в компактный бинарный файл (см. snapshot.py)"""
+        with open(filename, 'wb') as f:
+            write_snapshot(system, f)
+        print(f"Данные сохранены в {filename}")
+    
+    @staticmethod
+    def load_from_binary(filename: str, system: 'TransportSystem'):
+        """Загружает систему из бинарного файла"""
+        with open(filename, 'rb') as f:
+            data = f.read()
+        # A damaged or truncated file is rejected before the system is cleared
+        SnapshotLayout(data)
+        DataManager._clear_system(system)
+        read_snapshot(data, system)
+        print(f"Данные загружены из {filename}")
+    
+    @staticmethod
+    def open_snapshot(filename: str) -> SnapshotReader:
+        """Открывает бинарный снимок только для чтения без загрузки в память
+        
+        Возвращаемый объект можно использовать вместо TransportSystem,
+        заполненной через load_from_json, если система нужна только для чтения.
+        """
+        return SnapshotReader(filename)
+    
+    @staticmethod
+    def save_to_shards(system: 'TransportSystem', directory: str, shards: Optional[int] = None,
+                       workers: Optional[int] = None, epoch: bool = False):
+        """Сохраняет систему в каталог из манифеста и JSON-шардов
+        
+        Транспорт, рейсы и пассажиры (с билетами) делятся на shards частей,
+        которые пишутся параллельно пулом из workers процессов (по умолчанию
+        по числу ядер). Компания, водители и маршруты хранятся в манифесте;
+        водители ссылаются на рейсы по id. epoch - как в save_to_json.
+        
+        Шарды пишутся в новые файлы, а манифест заменяется атомарно
+        последним, поэтому сбой во время сохранения оставляет прежнюю
+        согласованную копию. Файлы прежних сохранений удаляются после
+        замены манифеста.
+        """
+        workers = workers or os.cpu_count() or 1
+        shards = shards or workers
+        os.makedirs(directory, exist_ok=True)
+        manifest_path = os.path.join(directory, SHARD_MANIFEST)
+        try:
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                generation = json.load(f).get("generation", 0) + 1
+        except (OSError, ValueError):
+            generation = 1
+        
+        collections = {
+            "transports": list(system.company.transports),
+            "trips": list(system.trips),
+            "passengers": list(system.passengers),
+        }
+        jobs = []
+        files: Dict[str, List[str]] = {}
+        for kind, items in collections.items():
+            files[kind] = []
+            for index in range(shards):
+                part = range(index * len(items) // shards, (index + 1) * len(items) // shards)
+                if part:
+                    name = f"{kind}-{generation:06d}-{index:03d}.json"
+                    files[kind].append(name)
+                    jobs.append((kind, part, os.path.join(directory, name), epoch))
+        
+        # Forked workers see the collections as they are; otherwise each job
+        # carries its slice of objects
+        context = _shard_context()
+        if workers > 1 and context.get_start_method() != "fork":
+            jobs = [(kind, collections[kind][part.start:part.stop], filename, epoch)
+                    for kind, part, filename, epoch in jobs]
+        _shard_collections.update(collections)
+        try:
+            DataManager._run_shard_jobs(DataManager._write_shard, jobs, workers, context)
+        except BaseException:
+            for job in jobs:
+                if os.path.exists(job[2]):
+                    os.remove(job[2])
+            raise
+        finally:
+            _shard_collections.clear()
+        
+        manifest = {
+            "company": {
+                "id": system.company.id,
+                "name": system.company.name,
+                "address": system.company.address
+            },
+            "drivers": [DataManager._driver_to_dict(d) for d in system.company.drivers],
+            "routes": [DataManager._route_to_dict(r) for r in system.routes],
+            "generation": generation,
+            "shards": files
         }
+        _write_json_atomic(manifest, manifest_path)
+        
+        # Shards of earlier saves and of interrupted ones
+        current = {name for names in files.values() for name in names}
+        for name in os.listdir(directory):
+            if SHARD_FILE.match(name) and name not in current:
+                os.remove(os.path.join(directory, name))
+        print(f"Данные сохранены в {directory}")
     
     @staticmethod
-    def save_to_json(system: 'TransportSystem', filename: str):
-        """Сохраняет систему в JSON файл"""
-        data = DataManager.to_dict(system)
+    def load_from_shards(directory: str, system: 'TransportSystem', workers: Optional[int] = None):
+        """Загружает систему, сохраненную save_to_shards
+        
+        Шарды разбираются параллельно пулом процессов, готовые объекты
+        передаются в основной процесс. Ссылки водителей на рейсы из любых
+        шардов разрешаются после загрузки всех рейсов.
+        """
+        with open(os.path.join(directory, SHARD_MANIFEST), 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        jobs = [(kind, os.path.join(directory, name)) for kind in SHARD_KINDS for name in manifest["shards"][kind]]
+        
+        # The cyclic GC would repeatedly rescan the objects arriving from workers
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            parts = DataManager._run_shard_jobs(DataManager._read_shard, jobs, workers or os.cpu_count() or 1,
+                                                _shard_context())
+            
+            DataManager._clear_system(system)
+            company_data = manifest["company"]
+            system.company.id = company_data["id"]
+            system.company.name = company_data["name"]
+            system.company.address = company_data["address"]
+            
+            collections = {
+                "transports": system.company.transports,
+                "trips": system.trips,
+                "passengers": system.passengers,
+            }
+            for (kind, _), items in zip(jobs, parts):
+                collections[kind].extend(items)
+            
+            for driver_data in manifest["drivers"]:
+                driver = DataManager._driver_from_dict(driver_data)
+                for trip_id in driver_data["assigned_trips"]:
+                    trip = system.get_trip_by_id(trip_id)
+                    if trip is not None:
+                        driver.assigned_trips.append(trip)
+                system.company.drivers.append(driver)
+            
+            for route_data in manifest["routes"]:
+                system.routes.append(DataManager._route_from_dict(route_data))
+        finally:
+            if gc_enabled:
+                gc.enable()
+        print(f"Данные загружены из {directory}")
+    
+    @staticmethod
+    def _run_shard_jobs(func, jobs: List[tuple], workers: int,
+                        context: multiprocessing.context.BaseContext) -> List[Any]:
+        """Выполняет задания по шардам в пуле процессов, сохраняя порядок результатов"""
+        if workers <= 1 or len(jobs) <= 1:
+            return [func(*job) for job in jobs]
+        with ProcessPoolExecutor(max_workers=min(workers, len(jobs)), mp_context=context,
+                                 initializer=gc.disable) as pool:
+            return list(pool.map(func, *zip(*jobs)))
+    
+    @staticmethod
+    def _write_shard(kind: str, items: Union[range, List[Any]], filename: str, epoch: bool = False):
+        if isinstance(items, range):
+            items = _shard_collections[kind][items.start:items.stop]
+        to_dict = getattr(DataManager, SHARD_KINDS[kind][0])
+        if kind != "transports":
+            to_dict = partial(to_dict, epoch=epoch)
         with open(filename, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2, default=str)
-        print(f"Данные сохранены в {filename}")
+            json.dump([to_dict(item) for item in items], f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
     
     @staticmethod
-    def load_from_json(filename: str, system: 'TransportSystem'):
-        """Загружает систему из JSON файла"""
+    def _read_shard(kind: str, filename: str) -> List[Any]:
+        from_dicts = getattr(DataManager, SHARD_KINDS[kind][1])
         with open(filename, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        DataManager._load_from_dict(data, system)
-        print(f"Данные загружены из {filename}")
+            return from_dicts(json.load(f))
     
     @staticmethod
     def save_to_xml(system: 'TransportSystem', filename: str):
-        """Сохраняет систему в XML файл"""
-        root = ET.Element("transport_system")
-        
-        # Company
-        company_elem = ET.SubElement(root, "company")
-        company_elem.set("id", str(system.company.id))
-        company_elem.set("name", system.company.name)
-        company_elem.set("address", system.company.address)
-        
-        # Transports
-        transports_elem = ET.SubElement(company_elem, "transports")
-        for transport in system.company.transports:
-            transport_elem = ET.SubElement(transports_elem, "transport")
-            transport_elem.set("id", str(transport.id))
-            transport_elem.set("model", transport.model)
-            transport_elem.set("capacity", str(transport.capacity))
-            transport_elem.set("speed", str(transport.speed))
-            transport_elem.set("status", transport.status)
+        """Сохраняет систему в XML файл
+        
+        Элементы пишутся в файл по мере обхода системы, без построения
+        ElementTree; результат побайтно совпадает с выводом ElementTree.write.
+        """
+        with open(filename, 'w', encoding='utf-8', errors='xmlcharrefreplace') as f:
+            writer = XmlStreamWriter(f)
+            writer.declaration()
+            writer.start("transport_system")
             
-            if isinstance(transport, Bus):
-                transport_elem.set("type", "bus")
-                transport_elem.set("route_number", transport.route_number)
-            elif isinstance(transport, Train):
-                transport_elem.set("type", "train")
-                transport_elem.set("wagons", str(transport.wagons))
-            elif isinstance(transport, Tram):
-                transport_elem.set("type", "tram")
-                transport_elem.set("line_number", transport.line_number)
-        
-        # Drivers
-        drivers_elem = ET.SubElement(company_elem, "drivers")
-        for driver in system.company.drivers:
-            driver_elem = ET.SubElement(drivers_elem, "driver")
-            driver_elem.set("id", str(driver.id))
-            driver_elem.set("name", driver.name)
-            driver_elem.set("license_number", driver.license_number)
+            # Company
+            writer.start("company", {
+                "id": str(system.company.id),
+                "name": system.company.name,
+                "address": system.company.address
+            })
+            
+            # Transports
+            writer.start("transports")
+            for transport in system.company.transports:
+                writer.write(transport_to_xml(transport))
+            writer.end("transports")
             
-            trips_elem = ET.SubElement(driver_elem, "assigned_trips")
-            for trip in driver.assigned_trips:
-                ET.SubElement(trips_elem, "trip_id").text = str(trip.id)
-        
-        # Routes
-        routes_elem = ET.SubElement(root, "routes")
-        for route in system.routes:
-            route_elem = ET.SubElement(routes_elem, "route")
-            route_elem.set("id", str(route.id))
-            route_elem.set("number", route.number)
-            route_elem.set("length_km", str(route.length_km))
+            # Drivers
+            writer.start("drivers")
+            for driver in system.company.drivers:
+                writer.write(DRIVER.to_xml(driver))
+            writer.end("drivers")
+            writer.end("company")
             
-            stops_elem = ET.SubElement(route_elem, "stops")
-            for stop in route.stops:
-                ET.SubElement(stops_elem, "stop").text = stop
-        
-        # Trips
-        trips_elem = ET.SubElement(root, "trips")
-        for trip in system.trips:
-            trip_elem = ET.SubElement(trips_elem, "trip")
-            trip_elem.set("id", str(trip.id))
-            trip_elem.set("date", trip.date.isoformat())
-            trip_elem.set("status", trip.status)
+            # Routes
+            writer.start("routes")
+            for route in system.routes:
+                writer.write(ROUTE.to_xml(route))
+            writer.end("routes")
             
-            ET.SubElement(trip_elem, "departure_time").text = trip.departure_time.isoformat()
-            ET.SubElement(trip_elem, "arrival_time").text = trip.arrival_time.isoformat()
-        
-        # Passengers
-        passengers_elem = ET.SubElement(root, "passengers")
-        for passenger in system.passengers:
-            passenger_elem = ET.SubElement(passengers_elem, "passenger")
-            passenger_elem.set("id", str(passenger.id))
-            passenger_elem.set("full_name", passenger.full_name)
-            passenger_elem.set("phone", passenger.phone)
+            # Trips
+            writer.start("trips")
+            for trip in system.trips:
+                writer.write(TRIP.to_xml(trip))
+            writer.end("trips")
             
-            tickets_elem = ET.SubElement(passenger_elem, "tickets")
-            for ticket in passenger.tickets:
-                ticket_elem = ET.SubElement(tickets_elem, "ticket")
-                ticket_elem.set("id", str(ticket.id))
-                ticket_elem.set("price", str(ticket.price))
-                ticket_elem.set("issue_date", ticket.issue_date.isoformat())
-                ticket_elem.set("status", ticket.status)
-        
-        tree = ET.ElementTree(root)
-        tree.write(filename, encoding='utf-8', xml_declaration=True)
+            # Passengers
+            writer.start("passengers")
+            for passenger in system.passengers:
+                writer.write(PASSENGER.to_xml(passenger))
+            writer.end("passengers")
+            
+            writer.end("transport_system")
         print(f"Данные сохранены в {filename}")
     
     @staticmethod
-    def load_from_xml(filename: str, system: 'TransportSystem'):
-        """Загружает систему из XML файла"""
+    def load_from_xml(filename: str, system: 'TransportSystem', streaming: bool = False):
+        """Загружает систему из XML файла
+        
+        При streaming=True документ разбирается через iterparse, и каждый
+        элемент освобождается сразу после создания объекта.
+        """
+        if streaming:
+            DataManager._load_from_xml_stream(filename, system)
+            print(f"Данные загружены из {filename}")
+            return
+        
         tree = ET.parse(filename)
         root = tree.getroot()
         
-        # Clear existing data
-        system.company.transports.clear()
-        system.company.drivers.clear()
-        system.routes.clear()
-        system.trips.clear()
-        system.passengers.clear()
+        DataManager._clear_system(system)
         
         # Load company
         company_elem = root.find("company")
@@ -203,97 +378,135 @@ class DataManager:
         system.company.address = company_elem.get("address")
         
         # Load transports
-        for transport_elem in company_elem.find("transports"):
-            transport_type = transport_elem.get("type")
-            transport_id = int(transport_elem.get("id"))
-            model = transport_elem.get("model")
-            capacity = int(transport_elem.get("capacity"))
-            speed = float(transport_elem.get("speed"))
-            
-            if transport_type == "bus":
-                route_number = transport_elem.get("route_number")
-                transport = Bus(transport_id, model, capacity, speed, route_number)
-            elif transport_type == "train":
-                wagons = int(transport_elem.get("wagons"))
-                transport = Train(transport_id, model, capacity, speed, wagons)
-            elif transport_type == "tram":
-                line_number = transport_elem.get("line_number")
-                transport = Tram(transport_id, model, capacity, speed, line_number)
-            
-            transport.status = transport_elem.get("status")
-            system.company.transports.append(transport)
+        system.company.transports.extend(map(DataManager._transport_from_xml, company_elem.find("transports")))
         
         # Load drivers and trips first (need trips for assignment)
-        temp_trips = {}
-        for trip_elem in root.find("trips"):
-            trip_id = int(trip_elem.get("id"))
-            trip_date = date.fromisoformat(trip_elem.get("date"))
-            departure_time = datetime.fromisoformat(trip_elem.find("departure_time").text)
-            arrival_time = datetime.fromisoformat(trip_elem.find("arrival_time").text)
-            
-            trip = Trip(trip_id, trip_date, departure_time, arrival_time)
-            trip.status = trip_elem.get("status")
-            system.trips.append(trip)
-            temp_trips[trip_id] = trip
+        system.trips.extend(map(DataManager._trip_from_xml, root.find("trips")))
         
         # Load drivers
         for driver_elem in company_elem.find("drivers"):
-            driver_id = int(driver_elem.get("id"))
-            name = driver_elem.get("name")
-            license_number = driver_elem.get("license_number")
-            
-            driver = Driver(driver_id, name, license_number)
+            driver = DataManager._driver_from_xml(driver_elem)
             
             # Assign trips
-            for trip_id_elem in driver_elem.find("assigned_trips"):
-                trip_id = int(trip_id_elem.text)
-                if trip_id in temp_trips:
-                    driver.assigned_trips.append(temp_trips[trip_id])
+            for trip_id in DataManager._assigned_trip_ids_from_xml(driver_elem):
+                trip = system.get_trip_by_id(trip_id)
+                if trip is not None:
+                    driver.assigned_trips.append(trip)
             
             system.company.drivers.append(driver)
         
         # Load routes
         for route_elem in root.find("routes"):
-            route_id = int(route_elem.get("id"))
-            number = route_elem.get("number")
-            length_km = float(route_elem.get("length_km"))
-            
-            route = Route(route_id, number, length_km)
-            for stop_elem in route_elem.find("stops"):
-                route.stops.append(stop_elem.text)
-            
-            system.routes.append(route)
+            system.routes.append(DataManager._route_from_xml(route_elem))
         
         # Load passengers
-        for passenger_elem in root.find("passengers"):
-            passenger_id = int(passenger_elem.get("id"))
-            full_name = passenger_elem.get("full_name")
-            phone = passenger_elem.get("phone")
+        system.passengers.extend(map(DataManager._passenger_from_xml, root.find("passengers")))
+        
+        print(f"Данные загружены из {filename}")
+    
+    @staticmethod
+    def _load_from_xml_stream(filename: str, system: 'TransportSystem'):
+        """Загружает систему из XML через iterparse, не удерживая дерево документа"""
+        DataManager._clear_system(system)
+        
+        # Drivers precede trips in the document, so trip ids are resolved at the end
+        pending_assignments = []
+        stack = []
+        
+        for event, elem in ET.iterparse(filename, events=("start", "end")):
+            if event == "start":
+                if elem.tag == "company":
+                    system.company.id = int(elem.get("id"))
+                    system.company.name = elem.get("name")
+                    system.company.address = elem.get("address")
+                stack.append(elem)
+                continue
             
-            passenger = Passenger(passenger_id, full_name, phone)
+            stack.pop()
+            if not stack:
+                continue
+            parent = stack[-1]
             
-            for ticket_elem in passenger_elem.find("tickets"):
-                ticket_id = int(ticket_elem.get("id"))
-                price = float(ticket_elem.get("price"))
-                issue_date = date.fromisoformat(ticket_elem.get("issue_date"))
-                
-                ticket = Ticket(ticket_id, price, issue_date)
-                ticket.status = ticket_elem.get("status")
-                passenger.tickets.append(ticket)
+            if elem.tag == "transport" and parent.tag == "transports":
+                system.company.transports.append(DataManager._transport_from_xml(elem))
+            elif elem.tag == "driver" and parent.tag == "drivers":
+                driver = DataManager._driver_from_xml(elem)
+                pending_assignments.append((driver, DataManager._assigned_trip_ids_from_xml(elem)))
+                system.company.drivers.append(driver)
+            elif elem.tag == "route" and parent.tag == "routes":
+                system.routes.append(DataManager._route_from_xml(elem))
+            elif elem.tag == "trip" and parent.tag == "trips":
+                system.trips.append(DataManager._trip_from_xml(elem))
+            elif elem.tag == "passenger" and parent.tag == "passengers":
+                system.passengers.append(DataManager._passenger_from_xml(elem))
+            else:
+                continue
             
-            system.passengers.append(passenger)
+            # The record is the parent's only child at this point, so removal is O(1)
+            elem.clear()
+            parent.remove(elem)
         
-        print(f"Данные загружены из {filename}")
+        for driver, trip_ids in pending_assignments:
+            for trip_id in trip_ids:
+                trip = system.get_trip_by_id(trip_id)
+                if trip is not None:
+                    driver.assigned_trips.append(trip)
+    
+    _transport_from_xml = staticmethod(transport_from_xml)
+    _trip_from_xml = staticmethod(TRIP.from_xml)
+    _driver_from_xml = staticmethod(DRIVER.from_xml)
     
     @staticmethod
-    def _load_from_dict(data: Dict[str, Any], system: 'TransportSystem'):
-        """Загружает данные из словаря в систему"""
-        # Clear existing data
+    def _assigned_trip_ids_from_xml(driver_elem: ET.Element) -> List[int]:
+        return [int(trip_id_elem.text) for trip_id_elem in driver_elem.find("assigned_trips")]
+    
+    _route_from_xml = staticmethod(ROUTE.from_xml)
+    _passenger_from_xml = staticmethod(PASSENGER.from_xml)
+    
+    @staticmethod
+    def _clear_system(system: 'TransportSystem'):
+        """Очищает все коллекции системы перед загрузкой"""
         system.company.transports.clear()
         system.company.drivers.clear()
         system.routes.clear()
         system.trips.clear()
         system.passengers.clear()
+    
+    _transport_from_dict = staticmethod(transport_from_dict)
+    
+    @staticmethod
+    def _transports_from_dicts(transports_data: List[Dict[str, Any]]) -> List['Transport']:
+        return list(map(transport_from_dict, transports_data))
+    
+    _trip_from_dict = staticmethod(TRIP.from_dict)
+    
+    @staticmethod
+    def _trips_from_dicts(trips_data: List[Dict[str, Any]]) -> List['Trip']:
+        """Создает пакет рейсов, декодируя даты и время по колонкам"""
+        def column(key: str) -> List[Any]:
+            return list(map(itemgetter(key), trips_data))
+        return list(map(Trip._restore, column("id"), decode_dates(column("date")),
+                        decode_datetimes(column("departure_time")), decode_datetimes(column("arrival_time")),
+                        column("status"), [trip_data.get("transport_id") for trip_data in trips_data]))
+    
+    _driver_from_dict = staticmethod(DRIVER.from_dict)
+    _route_from_dict = staticmethod(ROUTE.from_dict)
+    _passenger_from_dict = staticmethod(PASSENGER.from_dict)
+    
+    @staticmethod
+    def _ticket_from_dict(ticket_data: Dict[str, Any], passenger_id: Optional[int] = None) -> 'Ticket':
+        ticket = TICKET.from_dict(ticket_data)
+        ticket.passenger_id = passenger_id
+        return ticket
+    
+    @staticmethod
+    def _passengers_from_dicts(passengers_data: List[Dict[str, Any]]) -> List['Passenger']:
+        return list(map(PASSENGER.from_dict, passengers_data))
+    
+    @staticmethod
+    def _load_from_dict(data: Dict[str, Any], system: 'TransportSystem'):
+        """Загружает данные из словаря в систему"""
+        DataManager._clear_system(system)
         
         # Load company info
         company_data = data["company"]
@@ -303,88 +516,216 @@ class DataManager:
         
         # Load transports
         for transport_data in company_data["transports"]:
-            transport_type = transport_data["type"]
-            if transport_type == "bus":
-                transport = Bus(
-                    transport_data["id"],
-                    transport_data["model"],
-                    transport_data["capacity"],
-                    transport_data["speed"],
-                    transport_data["route_number"]
-                )
-            elif transport_type == "train":
-                transport = Train(
-                    transport_data["id"],
-                    transport_data["model"],
-                    transport_data["capacity"],
-                    transport_data["speed"],
-                    transport_data["wagons"]
-                )
-            elif transport_type == "tram":
-                transport = Tram(
-                    transport_data["id"],
-                    transport_data["model"],
-                    transport_data["capacity"],
-                    transport_data["speed"],
-                    transport_data["line_number"]
-                )
-            
-            transport.status = transport_data["status"]
-            system.company.transports.append(transport)
+            system.company.transports.append(DataManager._transport_from_dict(transport_data))
         
         # Load trips first (need them for driver assignment)
-        temp_trips = {}
-        for trip_data in data["trips"]:
-            trip = Trip(
-                trip_data["id"],
-                date.fromisoformat(trip_data["date"]),
-                datetime.fromisoformat(trip_data["departure_time"]),
-                datetime.fromisoformat(trip_data["arrival_time"])
-            )
-            trip.status = trip_data["status"]
-            system.trips.append(trip)
-            temp_trips[trip.id] = trip
+        system.trips.extend(DataManager._trips_from_dicts(data["trips"]))
         
         # Load drivers
         for driver_data in company_data["drivers"]:
-            driver = Driver(
-                driver_data["id"],
-                driver_data["name"],
-                driver_data["license_number"]
-            )
+            driver = DataManager._driver_from_dict(driver_data)
             
             # Assign trips to driver
             for trip_id in driver_data["assigned_trips"]:
-                if trip_id in temp_trips:
-                    driver.assigned_trips.append(temp_trips[trip_id])
+                trip = system.get_trip_by_id(trip_id)
+                if trip is not None:
+                    driver.assigned_trips.append(trip)
             
             system.company.drivers.append(driver)
         
         # Load routes
         for route_data in data["routes"]:
-            route = Route(
-                route_data["id"],
-                route_data["number"],
-                route_data["length_km"]
-            )
-            route.stops = route_data["stops"]
-            system.routes.append(route)
+            system.routes.append(DataManager._route_from_dict(route_data))
         
         # Load passengers
-        for passenger_data in data["passengers"]:
-            passenger = Passenger(
-                passenger_data["id"],
-                passenger_data["full_name"],
-                passenger_data["phone"]
-            )
-            
-            for ticket_data in passenger_data["tickets"]:
-                ticket = Ticket(
-                    ticket_data["id"],
-                    ticket_data["price"],
-                    date.fromisoformat(ticket_data["issue_date"])
-                )
-                ticket.status = ticket_data["status"]
-                passenger.tickets.append(ticket)
-            
-            system.passengers.append(passenger)
\ No newline at end of file
+        system.passengers.extend(DataManager._passengers_from_dicts(data["passengers"]))
+    
+    @staticmethod
+    def _load_from_json_stream(f, system: 'TransportSystem', chunk_size: int = 65536):
+        """Загружает систему из JSON потоком, создавая объекты по одному элементу массива"""
+        DataManager._clear_system(system)
+        reader = JsonStreamReader(f, chunk_size)
+        
+        # Drivers precede trips in the document, so trip ids are resolved at the end
+        pending_assignments = []
+        
+        for key in reader.iter_object():
+            if key == "company":
+                for company_key in reader.iter_object():
+                    if company_key == "transports":
+                        for transport_data in reader.iter_array():
+                            system.company.transports.append(DataManager._transport_from_dict(transport_data))
+                    elif company_key == "drivers":
+                        for driver_data in reader.iter_array():
+                            driver = DataManager._driver_from_dict(driver_data)
+                            pending_assignments.append((driver, driver_data["assigned_trips"]))
+                            system.company.drivers.append(driver)
+                    elif company_key in ("id", "name", "address"):
+                        setattr(system.company, company_key, reader.value())
+                    else:
+                        reader.value()
+            elif key == "routes":
+                for route_data in reader.iter_array():
+                    system.routes.append(DataManager._route_from_dict(route_data))
+            elif key == "trips":
+                for trip_data in reader.iter_array():
+                    system.trips.append(DataManager._trip_from_dict(trip_data))
+            elif key == "passengers":
+                for passenger_data in reader.iter_array():
+                    system.passengers.append(DataManager._passenger_from_dict(passenger_data))
+            else:
+                reader.value()
+        
+        for driver, trip_ids in pending_assignments:
+            for trip_id in trip_ids:
+                trip = system.get_trip_by_id(trip_id)
+                if trip is not None:
+                    driver.assigned_trips.append(trip)
+
+
+class JsonStreamReader:
+    """Инкрементальный разбор JSON из файла без чтения документа целиком.
+    
+    Объекты и массивы верхних уровней обходятся по ключам и элементам,
+    а отдельные значения декодируются через json.JSONDecoder.raw_decode.
+    """
+    WHITESPACE = " \t\n\r"
+    
+    def __init__(self, f, chunk_size: int = 65536):
+        self._f = f
+        self._chunk_size = chunk_size
+        self._buf = ""
+        self._pos = 0
+        self._eof = False
+        self._decoder = json.JSONDecoder()
+    
+    def _fill(self, size: int = 0) -> bool:
+        """Дочитывает следующий фрагмент файла, отбрасывая уже разобранную часть"""
+        if self._eof:
+            return False
+        chunk = self._f.read(max(size, self._chunk_size))
+        if not chunk:
+            self._eof = True
+            return False
+        self._buf = self._buf[self._pos:] + chunk
+        self._pos = 0
+        return True
+    
+    def peek(self) -> str:
+        while True:
+            while self._pos < len(self._buf) and self._buf[self._pos] in self.WHITESPACE:
+                self._pos += 1
+            if self._pos < len(self._buf):
+                return self._buf[self._pos]
+            if not self._fill():
+                return ""
+    
+    def expect(self, char: str):
+        found = self.peek()
+        if found != char:
+            raise ValueError(f"Ожидался символ '{char}', найден '{found}'")
+        self._pos += 1
+    
+    def value(self) -> Any:
+        """Декодирует одно JSON-значение целиком"""
+        self.peek()
+        size = self._chunk_size
+        while True:
+            try:
+                obj, end = self._decoder.raw_decode(self._buf, self._pos)
+            except json.JSONDecodeError:
+                if not self._fill(size):
+                    raise
+                size *= 2
+                continue
+            # A number at the very end of the buffer may continue in the next chunk
+            if end == len(self._buf) and self._fill(size):
+                continue
+            self._pos = end
+            return obj
+    
+    def iter_object(self):
+        """Перебирает ключи объекта; значение каждого ключа должен прочитать вызывающий"""
+        self.expect("{")
+        if self.peek() == "}":
+            self._pos += 1
+            return
+        while True:
+            key = self.value()
+            self.expect(":")
+            yield key
+            if self.peek() == ",":
+                self._pos += 1
+                continue
+            self.expect("}")
+            return
+    
+    def iter_array(self):
+        """Перебирает элементы массива, декодируя их по одному"""
+        self.expect("[")
+        if self.peek() == "]":
+            self._pos += 1
+            return
+        while True:
+            yield self.value()
+            if self.peek() == ",":
+                self._pos += 1
+                continue
+            self.expect("]")
+            return
+
+
+
+class XmlStreamWriter:
+    """Пишет XML напрямую в файл в том же виде, что и ElementTree.write.
+    
+    Открывающий тег остается незакрытым до первого дочернего элемента,
+    чтобы пустые элементы записывались как <tag />.
+    """
+    
+    def __init__(self, f):
+        self._f = f
+        self._open_pending = False
+    
+    @staticmethod
+    def _escape_attrib(text: str) -> str:
+        return escape(text, XML_ATTRIB_ENTITIES)
+    
+    @staticmethod
+    def _format_attrib(attrib: Optional[Dict[str, str]]) -> str:
+        if not attrib:
+            return ""
+        return "".join(f' {key}="{XmlStreamWriter._escape_attrib(value)}"' for key, value in attrib.items())
+    
+    def _close_pending(self):
+        if self._open_pending:
+            self._f.write(">")
+            self._open_pending = False
+    
+    def declaration(self):
+        self._f.write("<?xml version='1.0' encoding='utf-8'?>\n")
+    
+    def start(self, tag: str, attrib: Optional[Dict[str, str]] = None):
+        self._close_pending()
+        self._f.write(f"<{tag}{self._format_attrib(attrib)}")
+        self._open_pending = True
+    
+    def end(self, tag: str):
+        if self._open_pending:
+            self._f.write(" />")
+            self._open_pending = False
+        else:
+            self._f.write(f"</{tag}>")
+    
+    def write(self, text: str):
+        """Пишет готовый фрагмент XML, например результат Schema.to_xml"""
+        self._close_pending()
+        self._f.write(text)
+    
+    def element(self, tag: str, attrib: Optional[Dict[str, str]] = None, text: Optional[str] = None):
+        """Пишет элемент без дочерних элементов"""
+        self._close_pending()
+        if text:
+            self._f.write(f"<{tag}{self._format_attrib(attrib)}>{escape(text)}</{tag}>")
+        else:
+            self._f.write(f"<{tag}{self._format_attrib(attrib)} />")
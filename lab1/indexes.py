@@ -0,0 +1,152 @@
+from bisect import bisect_left, bisect_right
+from operator import attrgetter
+from typing import Any, Callable, Collection, Dict, Hashable, List, Optional
+
+
+class AttributeIndex:
+    """Вторичный индекс: значение ключа -> объекты в порядке добавления
+
+    Объекты одного значения хранятся в словаре без значений, поэтому
+    добавление и удаление выполняются за O(1). Отсортированный список
+    значений для range() строится при первом запросе после появления
+    или исчезновения значения.
+    """
+
+    def __init__(self, key: Callable[[Any], Hashable]):
+        self.key = key
+        self._buckets: Dict[Hashable, Dict[Any, None]] = {}
+        self._sorted: Optional[List[Hashable]] = None
+
+    def _insert(self, value: Hashable, obj: Any):
+        bucket = self._buckets.get(value)
+        if bucket is None:
+            bucket = self._buckets[value] = {}
+            self._sorted = None
+        bucket[obj] = None
+
+    def _discard(self, value: Hashable, obj: Any):
+        bucket = self._buckets.get(value)
+        if bucket is not None:
+            bucket.pop(obj, None)
+            if not bucket:
+                del self._buckets[value]
+                self._sorted = None
+
+    def add(self, obj: Any):
+        self._insert(self.key(obj), obj)
+
+    def add_many(self, objs: List[Any]):
+        buckets = self._buckets
+        for value, obj in zip(map(self.key, objs), objs):
+            bucket = buckets.get(value)
+            if bucket is None:
+                bucket = buckets[value] = {}
+            bucket[obj] = None
+        self._sorted = None
+
+    def remove(self, obj: Any):
+        self._discard(self.key(obj), obj)
+
+    def move(self, obj: Any, old: Hashable):
+        """Переносит объект, у которого значение ключа сменилось с old"""
+        self._discard(old, obj)
+        self._insert(self.key(obj), obj)
+
+    def get(self, value: Hashable) -> Collection[Any]:
+        return self._buckets.get(value, {}).keys()
+
+    def range(self, low: Hashable, high: Hashable) -> List[Collection[Any]]:
+        """Группы объектов со значениями low <= value <= high по возрастанию"""
+        if self._sorted is None:
+            self._sorted = sorted(self._buckets)
+        first = bisect_left(self._sorted, low)
+        last = bisect_right(self._sorted, high)
+        return [self._buckets[value].keys() for value in self._sorted[first:last]]
+
+    def counts(self) -> Dict[Hashable, int]:
+        return {value: len(bucket) for value, bucket in self._buckets.items()}
+
+    def clear(self):
+        self._buckets.clear()
+        self._sorted = None
+
+
+class IndexSet:
+    """Индексы одного вида объектов по именованным ключам
+
+    Объект, добавленный через attach, хранит ссылку на набор в _indexes
+    и сообщает об изменении индексируемого атрибута (см.
+    Indexed._reindex и indexed_attribute), в том числе при прямом
+    присваивании.
+    """
+
+    def __init__(self, **keys: Callable[[Any], Hashable]):
+        self.indexes: Dict[str, AttributeIndex] = {name: AttributeIndex(key) for name, key in keys.items()}
+
+    def get(self, name: str) -> Optional[AttributeIndex]:
+        return self.indexes.get(name)
+
+    def attach(self, obj: 'Indexed'):
+        obj._indexes = self
+        for index in self.indexes.values():
+            index.add(obj)
+
+    def attach_many(self, objs: List['Indexed']):
+        for obj in objs:
+            obj._indexes = self
+        for index in self.indexes.values():
+            index.add_many(objs)
+
+    def detach(self, obj: 'Indexed'):
+        if obj._indexes is self:
+            obj._indexes = None
+            for index in self.indexes.values():
+                index.remove(obj)
+
+    def move(self, obj: Any, name: str, old: Hashable):
+        index = self.indexes.get(name)
+        if index is not None:
+            index.move(obj, old)
+
+    def clear(self):
+        for index in self.indexes.values():
+            index.clear()
+
+
+class Indexed:
+    """Основа моделей, которые поддерживают индексы своего реестра"""
+    __slots__ = ("_indexes",)
+
+    def _reindex(self, name: str, old: Hashable):
+        if self._indexes is not None:
+            self._indexes.move(self, name, old)
+
+    def __getstate__(self):
+        # The indexes belong to the registry the object is in, so a pickled
+        # or copied object leaves them behind
+        slots = {name: getattr(self, name) for cls in type(self).__mro__ for name in getattr(cls, "__slots__", ())
+                 if name != "_indexes" and hasattr(self, name)}
+        return None, slots
+
+    def __setstate__(self, state):
+        self._indexes = None
+        for name, value in state[1].items():
+            setattr(self, name, value)
+
+
+def indexed_attribute(name: str) -> property:
+    """Свойство name поверх слота _name: присваивание обновляет индексы объекта
+
+    Чтение идет через attrgetter без Python-вызова. В __init__ модели
+    значение пишется прямо в слот, пока объект еще не в реестре.
+    """
+    slot = "_" + name
+    get_value = attrgetter(slot)
+
+    def set_value(obj: Indexed, value: Hashable):
+        old = get_value(obj)
+        setattr(obj, slot, value)
+        if old != value:
+            obj._reindex(name, old)
+
+    return property(get_value, set_value)
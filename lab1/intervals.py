@@ -0,0 +1,144 @@
+import math
+from datetime import datetime, timedelta
+from typing import TYPE_CHECKING, Dict, List, Optional, Set, Tuple
+
+if TYPE_CHECKING:
+    from models import Trip
+
+
+# Intervals are half-open: a trip is running at T when departure <= T < arrival,
+# so a trip that arrives at 9:00 does not overlap one that departs at 9:00.
+Interval = Tuple[datetime, datetime, 'Trip']
+
+MICROSECOND = timedelta(microseconds=1)
+
+
+class _Node:
+    """Узел центрированного дерева интервалов"""
+    __slots__ = ("center", "by_start", "by_end", "left", "right")
+
+    def __init__(self, center: datetime, by_start: List[Interval], by_end: List[Interval],
+                 left: Optional['_Node'], right: Optional['_Node']):
+        self.center = center
+        self.by_start = by_start
+        self.by_end = by_end
+        self.left = left
+        self.right = right
+
+
+def _build(intervals: List[Interval]) -> Optional[_Node]:
+    """Строит дерево по списку интервалов, отсортированному по началу"""
+    if not intervals:
+        return None
+    center = intervals[len(intervals) // 2][0]
+    left, middle, right = [], [], []
+    for interval in intervals:
+        if interval[1] < center:
+            left.append(interval)
+        elif interval[0] > center:
+            right.append(interval)
+        else:
+            middle.append(interval)
+    by_end = sorted(middle, key=lambda interval: interval[1], reverse=True)
+    return _Node(center, middle, by_end, _build(left), _build(right))
+
+
+def _query(node: Optional[_Node], lo: datetime, hi: datetime, found: List[Interval]):
+    """Собирает интервалы с start < hi и end > lo"""
+    while node is not None:
+        if hi <= node.center:
+            for interval in node.by_start:
+                if interval[0] >= hi:
+                    break
+                found.append(interval)
+            node = node.left
+        elif lo >= node.center:
+            for interval in node.by_end:
+                if interval[1] <= lo:
+                    break
+                found.append(interval)
+            node = node.right
+        else:
+            found.extend(node.by_start)
+            _query(node.left, lo, hi, found)
+            node = node.right
+
+
+class TripIntervalIndex:
+    """Индекс рейсов по интервалам [departure_time, arrival_time)
+
+    Основа индекса - центрированное дерево интервалов: запросы выполняются
+    за O(log n + k). Добавленные и измененные рейсы сначала попадают в
+    небольшой буфер, который просматривается линейно; дерево
+    перестраивается при запросе, когда буфер превышает ~sqrt(n). Поэтому
+    массовая загрузка и частые update_times не требуют перестройки
+    на каждое изменение.
+    """
+
+    def __init__(self):
+        self._intervals: Dict[int, Interval] = {}
+        self._tree: Optional[_Node] = None
+        self._tree_ids: Set[int] = set()
+        self._pending: Dict[int, Interval] = {}
+        self._stale: Set[int] = set()
+
+    def __len__(self) -> int:
+        return len(self._intervals)
+
+    def add(self, trip: 'Trip'):
+        interval = (trip.departure_time, trip.arrival_time, trip)
+        self._intervals[trip.id] = interval
+        self._pending[trip.id] = interval
+        if trip.id in self._tree_ids:
+            self._stale.add(trip.id)
+
+    def update(self, trip: 'Trip'):
+        """Переиндексирует рейс после изменения его времени"""
+        if self._intervals.get(trip.id, (None, None, None))[2] is trip:
+            self.add(trip)
+
+    def remove(self, trip: 'Trip'):
+        if self._intervals.get(trip.id, (None, None, None))[2] is not trip:
+            return
+        del self._intervals[trip.id]
+        self._pending.pop(trip.id, None)
+        if trip.id in self._tree_ids:
+            self._stale.add(trip.id)
+
+    def clear(self):
+        self.__init__()
+
+    def _refresh(self):
+        threshold = 32 + math.isqrt(len(self._intervals))
+        if len(self._pending) + len(self._stale) > threshold:
+            intervals = sorted(self._intervals.values(), key=lambda interval: (interval[0], interval[2].id))
+            self._tree = _build(intervals)
+            self._tree_ids = set(self._intervals)
+            self._pending.clear()
+            self._stale.clear()
+
+    def _search(self, lo: datetime, hi: datetime) -> List['Trip']:
+        self._refresh()
+        found: List[Interval] = []
+        _query(self._tree, lo, hi, found)
+        if self._stale:
+            found = [interval for interval in found if interval[2].id not in self._stale]
+        for interval in self._pending.values():
+            if interval[0] < hi and interval[1] > lo:
+                found.append(interval)
+        found.sort(key=lambda interval: (interval[0], interval[2].id))
+        return [interval[2] for interval in found]
+
+    def running_at(self, moment: datetime) -> List['Trip']:
+        """Рейсы, которые выполняются в момент moment"""
+        return self._search(moment, moment + MICROSECOND)
+
+    def overlapping(self, start: datetime, end: datetime) -> List['Trip']:
+        """Рейсы, пересекающиеся с интервалом [start, end)"""
+        if end <= start:
+            return []
+        return self._search(start, end)
+
+    def overlaps(self, trip: 'Trip') -> List['Trip']:
+        """Другие рейсы, пересекающиеся с рейсом trip"""
+        return [other for other in self.overlapping(trip.departure_time, trip.arrival_time) if other is not trip]
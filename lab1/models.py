@@ -1,55 +1,392 @@
+import logging
+from abc import ABC, abstractmethod
+from array import array
+from collections import deque
+from contextlib import contextmanager, nullcontext
 from datetime import datetime, date, timedelta
-from typing import List, Optional
+from functools import partial
+from itertools import chain
+from operator import attrgetter, is_not
+from threading import Lock
+from typing import Any, Callable, Dict, Generic, Hashable, Iterable, Iterator, List, Optional, Set, Tuple, TypeVar
+from indexes import Indexed, IndexSet, indexed_attribute
+from intervals import TripIntervalIndex
+from query import Query
+from scheduling import AssignmentResult, Conflict, find_conflicts, plan_assignments
+from route_graph import StopGraph
+
+T = TypeVar("T")
+
+class EventSink(ABC):
+    """Получатель сообщений о действиях с моделями"""
+    @abstractmethod
+    def emit(self, message: str):
+        pass
+
+class StdoutSink(EventSink):
+    """Печатает сообщения в stdout (поведение по умолчанию)"""
+    def emit(self, message: str):
+        print(message)
+
+class LoggingSink(EventSink):
+    """Передает сообщения в модуль logging"""
+    def __init__(self, logger: Optional[logging.Logger] = None, level: int = logging.INFO):
+        self.logger = logger or logging.getLogger("transport")
+        self.level = level
+    
+    def emit(self, message: str):
+        self.logger.log(self.level, message)
+
+class CountingSink(EventSink):
+    """Только считает сообщения, не выводя их"""
+    def __init__(self):
+        self.count = 0
+    
+    def emit(self, message: str):
+        self.count += 1
+
+class NullSink(EventSink):
+    """Отбрасывает все сообщения"""
+    def emit(self, message: str):
+        pass
+
+_event_sink: EventSink = StdoutSink()
+
+def set_event_sink(sink: EventSink) -> EventSink:
+    """Устанавливает получателя сообщений и возвращает предыдущего"""
+    global _event_sink
+    previous, _event_sink = _event_sink, sink
+    return previous
+
+@contextmanager
+def event_sink(sink: EventSink):
+    """Временно переключает получателя сообщений"""
+    previous = set_event_sink(sink)
+    try:
+        yield sink
+    finally:
+        set_event_sink(previous)
+
+def emit_event(message: str):
+    _event_sink.emit(message)
+
+_change_recorder = None
+
+def set_change_recorder(recorder) -> Optional[object]:
+    """Устанавливает получателя изменений моделей (см. wal.ChangeLog)
+    
+    Получатель должен иметь метод record(target, action, args) и
+    атрибут lock (см. change_lock); None отключает запись. Возвращает
+    предыдущего получателя.
+    """
+    global _change_recorder
+    previous, _change_recorder = _change_recorder, recorder
+    return previous
+
+def change_lock():
+    """Блокировка получателя изменений для мутации вместе с ее записью
+    
+    Мутации, которые выполняются из нескольких потоков (продажа и отмена
+    билетов), держат ее от изменения до record_change, поэтому журнал не
+    может записать снимок между ними. Без получателя ничего не блокирует.
+    """
+    recorder = _change_recorder
+    return nullcontext() if recorder is None else recorder.lock
+
+def record_change(target, action: str, *args):
+    """Сообщает получателю изменений об уже выполненной мутации модели"""
+    if _change_recorder is not None:
+        _change_recorder.record(target, action, args)
+
+def _collect_unique(items: Iterable[T], registry: 'Registry[T]', cls: type, kind: str) -> Dict[int, T]:
+    """Проверяет тип и уникальность id пакета объектов за один проход"""
+    batch: Dict[int, T] = {}
+    for item in items:
+        if not isinstance(item, cls):
+            raise TypeError(f"{kind}: ожидался {cls.__name__}, получен {type(item).__name__}")
+        if item.id in batch or registry.get_by_id(item.id) is not None:
+            raise ValueError(f"{kind}: ID {item.id} уже используется")
+        batch[item.id] = item
+    return batch
+
+_is_present = partial(is_not, None)
+_get_id = attrgetter("id")
+
+class Registry(Generic[T]):
+    """Упорядоченная коллекция объектов с индексом по id
+    
+    Поддерживает операции списка (append, extend, insert, pop, remove,
+    index, clear, итерация, индексация и срезы, сравнение со списком),
+    а поиск по id выполняется за O(1). id в коллекции уникальны:
+    добавление объекта с уже существующим id вызывает ValueError.
+    Присваивание по индексу и сортировка на месте не поддерживаются.
+    
+    Для каждого id хранится позиция объекта, поэтому remove и
+    remove_by_id выполняются за O(1): место удаленного объекта
+    помечается, а список уплотняется при обращении по индексу или когда
+    помеченных мест становится больше половины. insert и pop(i) из
+    середины, как и у списка, - за O(n).
+    """
+    def __init__(self, items: Iterable[T] = ()):
+        self._items: Dict[int, T] = {}
+        self._positions: Dict[int, int] = {}
+        self._list: List[Optional[T]] = []
+        self._removed = 0
+        if items:
+            self.extend(items)
+    
+    def _check_new(self, ids: List[int]):
+        unique = set(ids)
+        if len(unique) == len(ids) and self._items.keys().isdisjoint(unique):
+            return
+        seen = set()
+        for id in ids:
+            if id in seen or id in self._items:
+                raise ValueError(f"ID {id} уже используется")
+            seen.add(id)
+    
+    def _compact(self):
+        if self._removed:
+            self._list = [item for item in self._list if item is not None]
+            self._removed = 0
+            self._renumber(0)
+    
+    def _renumber(self, start: int):
+        """Заново записывает позиции объектов начиная с start"""
+        positions = self._positions
+        for position in range(start, len(self._list)):
+            positions[self._list[position].id] = position
+    
+    def append(self, item: T):
+        if item.id in self._items:
+            raise ValueError(f"ID {item.id} уже используется")
+        self._items[item.id] = item
+        self._positions[item.id] = len(self._list)
+        self._list.append(item)
+    
+    def extend(self, items: Iterable[T]):
+        """Добавляет объекты; если какой-то id повторяется, ничего не добавляется"""
+        items = list(items)
+        if not items:
+            return
+        ids = list(map(_get_id, items))
+        self._check_new(ids)
+        self._items.update(zip(ids, items))
+        self._positions.update(zip(ids, range(len(self._list), len(self._list) + len(ids))))
+        self._list.extend(items)
+    
+    def insert(self, index: int, item: T):
+        if item.id in self._items:
+            raise ValueError(f"ID {item.id} уже используется")
+        self._compact()
+        start = min(max(index + len(self._list), 0) if index < 0 else index, len(self._list))
+        self._items[item.id] = item
+        self._list.insert(start, item)
+        self._renumber(start)
+    
+    def pop(self, index: int = -1) -> T:
+        self._compact()
+        item = self._list.pop(index)
+        del self._items[item.id]
+        position = self._positions.pop(item.id)
+        if position < len(self._list):
+            self._renumber(position)
+        return item
+    
+    def remove(self, item: T):
+        if self._items.get(item.id) is not item:
+            raise ValueError(f"Объект с ID {item.id} отсутствует в коллекции")
+        del self._items[item.id]
+        self._list[self._positions.pop(item.id)] = None
+        self._removed += 1
+        if self._removed * 2 > len(self._list):
+            self._compact()
+    
+    def remove_by_id(self, id: int) -> Optional[T]:
+        """Удаляет объект по id и возвращает его (None, если не найден)"""
+        item = self._items.get(id)
+        if item is not None:
+            self.remove(item)
+        return item
+    
+    def index(self, item: T) -> int:
+        if self._items.get(getattr(item, "id", None)) is not item:
+            raise ValueError(f"{item!r} отсутствует в коллекции")
+        self._compact()
+        return self._positions[item.id]
+    
+    def get_by_id(self, id: int) -> Optional[T]:
+        return self._items.get(id)
+    
+    def clear(self):
+        self._items.clear()
+        self._positions.clear()
+        self._list.clear()
+        self._removed = 0
+    
+    def __contains__(self, item: T) -> bool:
+        return self._items.get(getattr(item, "id", None)) is item
+    
+    def __iter__(self) -> Iterator[T]:
+        # Skips the places of removed objects, also of ones removed while iterating
+        return filter(_is_present, self._list)
+    
+    def __len__(self) -> int:
+        return len(self._items)
+    
+    def __getitem__(self, index):
+        self._compact()
+        return self._list[index]
+    
+    def __eq__(self, other) -> bool:
+        if isinstance(other, Registry):
+            return list(self) == list(other)
+        if isinstance(other, list):
+            return list(self) == other
+        return NotImplemented
+    
+    __hash__ = None
+    
+    def __repr__(self) -> str:
+        return f"Registry({list(self)!r})"
+
+class IndexedRegistry(Registry[T]):
+    """Реестр, который поддерживает вторичные индексы своих объектов
+    
+    keys - имя индекса -> функция ключа. Добавленный объект получает
+    ссылку на индексы и сообщает им об изменениях (см. indexes.py).
+    """
+    def __init__(self, items: Iterable[T] = (), **keys: Callable[[Any], Hashable]):
+        self.indexes = IndexSet(**keys)
+        super().__init__(items)
+    
+    def _attach(self, item: T):
+        self.indexes.attach(item)
+    
+    def _attach_many(self, items: List[T]):
+        self.indexes.attach_many(items)
+    
+    def _detach(self, item: Optional[T]):
+        if item is not None:
+            self.indexes.detach(item)
+    
+    def _release(self, item: T):
+        """Отвязывает объект при clear, индексы очищаются целиком"""
+        item._indexes = None
+    
+    def append(self, item: T):
+        super().append(item)
+        self._attach(item)
+    
+    def extend(self, items: Iterable[T]):
+        batch = list(items)
+        super().extend(batch)
+        self._attach_many(batch)
+    
+    def insert(self, index: int, item: T):
+        super().insert(index, item)
+        self._attach(item)
+    
+    def pop(self, index: int = -1) -> T:
+        item = super().pop(index)
+        self._detach(item)
+        return item
+    
+    def remove(self, item: T):
+        super().remove(item)
+        self._detach(item)
+    
+    def clear(self):
+        for item in self:
+            self._release(item)
+        super().clear()
+        self.indexes.clear()
 
 class Company:
     def __init__(self, id: int, name: str, address: str):
         self.id = id
         self.name = name
         self.address = address
-        self.transports: List[Transport] = []
-        self.drivers: List[Driver] = []
+        self.transports: IndexedRegistry[Transport] = IndexedRegistry(status=attrgetter("status"), type=type)
+        self.drivers: Registry[Driver] = Registry()
     
     def add_transport(self, t: 'Transport'):
         self.transports.append(t)
-        print(f"Транспорт {t.model} добавлен в компанию")
+        record_change(self, "add_transport", t)
+        emit_event(f"Транспорт {t.model} добавлен в компанию")
+    
+    def add_transports(self, transports: Iterable['Transport']) -> int:
+        """Добавляет пакет транспорта; при ошибке проверки ничего не добавляется"""
+        batch = _collect_unique(transports, self.transports, Transport, "Транспорт")
+        self.transports.extend(batch.values())
+        record_change(self, "add_transports", list(batch.values()))
+        emit_event(f"В компанию добавлено транспорта: {len(batch)}")
+        return len(batch)
     
     def remove_transport(self, id: int):
-        self.transports = [t for t in self.transports if t.id != id]
-        print(f"Транспорт с ID {id} удален")
+        self.transports.remove_by_id(id)
+        record_change(self, "remove_transport", id)
+        emit_event(f"Транспорт с ID {id} удален")
+    
+    def get_transport_by_id(self, id: int) -> Optional['Transport']:
+        return self.transports.get_by_id(id)
     
     def hire_driver(self, d: 'Driver'):
         self.drivers.append(d)
-        print(f"Водитель {d.name} нанят")
+        record_change(self, "hire_driver", d)
+        emit_event(f"Водитель {d.name} нанят")
+    
+    def hire_drivers(self, drivers: Iterable['Driver']) -> int:
+        """Нанимает пакет водителей; при ошибке проверки никто не нанимается"""
+        batch = _collect_unique(drivers, self.drivers, Driver, "Водитель")
+        self.drivers.extend(batch.values())
+        record_change(self, "hire_drivers", list(batch.values()))
+        emit_event(f"Нанято водителей: {len(batch)}")
+        return len(batch)
     
     def fire_driver(self, id: int):
-        self.drivers = [d for d in self.drivers if d.id != id]
-        print(f"Водитель с ID {id} уволен")
+        self.drivers.remove_by_id(id)
+        record_change(self, "fire_driver", id)
+        emit_event(f"Водитель с ID {id} уволен")
+    
+    def get_driver_by_id(self, id: int) -> Optional['Driver']:
+        return self.drivers.get_by_id(id)
 
-class Transport:
+class Transport(Indexed):
+    __slots__ = ("id", "model", "capacity", "speed", "_status")
+    
+    status = indexed_attribute("status")
+    
     def __init__(self, id: int, model: str, capacity: int, speed: float):
         self.id = id
         self.model = model
         self.capacity = capacity
         self.speed = speed
-        self.status = "stopped"
+        self._status = "stopped"
+        self._indexes: Optional[IndexSet] = None
     
     def start(self):
         self.status = "running"
-        print(f"Транспорт {self.model} запущен")
+        record_change(self, "start")
+        emit_event(f"Транспорт {self.model} запущен")
     
     def stop(self):
         self.status = "stopped"
-        print(f"Транспорт {self.model} остановлен")
+        record_change(self, "stop")
+        emit_event(f"Транспорт {self.model} остановлен")
     
     def update_info(self, model: str, capacity: int):
         self.model = model
         self.capacity = capacity
-        print(f"Информация транспорта обновлена: {model}, вместимость {capacity}")
+        record_change(self, "update_info", model, capacity)
+        emit_event(f"Информация транспорта обновлена: {model}, вместимость {capacity}")
     
     def get_info(self) -> str:
         return f"Транспорт ID: {self.id}, Модель: {self.model}, Вместимость: {self.capacity}, Скорость: {self.speed}, Статус: {self.status}"
 
 class Bus(Transport):
+    __slots__ = ("route_number",)
+    
     def __init__(self, id: int, model: str, capacity: int, speed: float, route_number: str):
         if capacity <= 0:
             raise ValueError("Вместимость автобуса должна быть положительной")
@@ -59,6 +396,8 @@ class Bus(Transport):
         self.route_number = route_number
 
 class Train(Transport):
+    __slots__ = ("wagons",)
+    
     def __init__(self, id: int, model: str, capacity: int, speed: float, wagons: str):
         if capacity <= 0:
             raise ValueError("Вместимость поезда должна быть положительной")
@@ -71,6 +410,8 @@ class Train(Transport):
         return "Поезд"
 
 class Tram(Transport):
+    __slots__ = ("line_number",)
+    
     def __init__(self, id: int, model: str, capacity: int, speed: float, line_number: str):
         if capacity <= 0:
             raise ValueError("Вместимость трамвая должна быть положительной")
@@ -87,65 +428,325 @@ class Driver:
         self.id = id
         self.name = name
         self.license_number = license_number
-        self.assigned_trips: List[Trip] = []
+        self.assigned_trips: Registry[Trip] = Registry()
     
     def assign_trip(self, trip: 'Trip'):
         self.assigned_trips.append(trip)
-        print(f"Рейс {trip.id} назначен водителю {self.name}")
+        record_change(self, "assign_trip", trip.id)
+        emit_event(f"Рейс {trip.id} назначен водителю {self.name}")
+    
+    def assign_trips(self, trips: Iterable['Trip']) -> int:
+        """Назначает пакет рейсов; при ошибке проверки ничего не назначается"""
+        batch = _collect_unique(trips, self.assigned_trips, Trip, "Рейс")
+        self.assigned_trips.extend(batch.values())
+        record_change(self, "assign_trips", list(batch))
+        emit_event(f"Водителю {self.name} назначено рейсов: {len(batch)}")
+        return len(batch)
     
     def remove_trip(self, trip_id: int):
-        self.assigned_trips = [t for t in self.assigned_trips if t.id != trip_id]
-        print(f"Рейс {trip_id} удален у водителя {self.name}")
+        self.assigned_trips.remove_by_id(trip_id)
+        record_change(self, "remove_trip", trip_id)
+        emit_event(f"Рейс {trip_id} удален у водителя {self.name}")
+    
+    def get_trip_by_id(self, trip_id: int) -> Optional['Trip']:
+        return self.assigned_trips.get_by_id(trip_id)
     
     def update_license(self, new_license: str):
         self.license_number = new_license
-        print(f"Лицензия водителя {self.name} обновлена")
+        record_change(self, "update_license", new_license)
+        emit_event(f"Лицензия водителя {self.name} обновлена")
+
+class StopNames:
+    """Общий справочник названий остановок: каждое название хранится один раз
+
+    Для каждого названия считается число вхождений во все StopSequence;
+    название, которое больше нигде не используется, удаляется, а его id
+    переиспользуется, поэтому справочник не растет бесконечно.
+    """
+    def __init__(self):
+        self.names: List[Optional[str]] = []
+        self.ids: Dict[str, int] = {}
+        self._refs: List[int] = []
+        self._free: List[int] = []
+    
+    def intern(self, name: str) -> int:
+        stop_id = self.ids.get(name)
+        if stop_id is None:
+            if self._free:
+                stop_id = self._free.pop()
+                self.names[stop_id] = name
+            else:
+                stop_id = len(self.names)
+                self.names.append(name)
+                self._refs.append(0)
+            self.ids[name] = stop_id
+        self._refs[stop_id] += 1
+        return stop_id
+    
+    def release(self, stop_id: int):
+        self._refs[stop_id] -= 1
+        if not self._refs[stop_id]:
+            del self.ids[self.names[stop_id]]
+            self.names[stop_id] = None
+            self._free.append(stop_id)
+    
+    def __len__(self) -> int:
+        return len(self.ids)
+
+STOP_NAMES = StopNames()
+
+class StopSequence:
+    """Упорядоченный список остановок маршрута в виде id из StopNames
+    
+    Ведет себя как список названий. Для каждого id хранятся позиции его
+    вхождений, поэтому проверка "in" и remove выполняются за O(1):
+    удаленная позиция помечается, а массив уплотняется, когда помеченных
+    становится больше половины. append и pop() с конца выполняются за
+    O(1), а insert, pop(i) и присваивание по индексу, как и у списка, -
+    за O(n). Присваивание срезу, del и sort не поддерживаются.
+    """
+    REMOVED = -1
+    
+    def __init__(self, names: Iterable[str] = (), registry: StopNames = STOP_NAMES):
+        self._registry = registry
+        self._ids = array("l")
+        self._positions: Dict[int, deque] = {}
+        self._removed = 0
+        self.extend(names)
+    
+    def __del__(self):
+        for stop_id in getattr(self, "_ids", ()):
+            if stop_id != self.REMOVED:
+                self._registry.release(stop_id)
+    
+    def __reduce__(self):
+        # The ids are only meaningful in this process's StopNames
+        return StopSequence, (list(self),)
+    
+    def append(self, name: str):
+        stop_id = self._registry.intern(name)
+        positions = self._positions.get(stop_id)
+        if positions is None:
+            positions = self._positions[stop_id] = deque()
+        positions.append(len(self._ids))
+        self._ids.append(stop_id)
+    
+    def extend(self, names: Iterable[str]):
+        for name in names:
+            self.append(name)
+    
+    def insert(self, index: int, name: str):
+        if self._removed:
+            self._compact()
+        ids = self._ids.tolist()
+        ids.insert(index, self._registry.intern(name))
+        self._rebuild(ids)
+    
+    def pop(self, index: int = -1) -> str:
+        if self._removed:
+            self._compact()
+        if not self._ids:
+            raise IndexError("pop из пустого списка остановок")
+        if index == -1 or index == len(self._ids) - 1:
+            stop_id = self._ids.pop()
+            positions = self._positions[stop_id]
+            positions.pop()
+            if not positions:
+                del self._positions[stop_id]
+        else:
+            ids = self._ids.tolist()
+            stop_id = ids.pop(index)
+            self._rebuild(ids)
+        name = self._registry.names[stop_id]
+        self._registry.release(stop_id)
+        return name
+    
+    def remove(self, name: str):
+        """Удаляет первое вхождение остановки, как list.remove"""
+        stop_id = self._registry.ids.get(name)
+        positions = self._positions.get(stop_id)
+        if not positions:
+            raise ValueError(f"Остановка {name!r} отсутствует в маршруте")
+        self._ids[positions.popleft()] = self.REMOVED
+        if not positions:
+            del self._positions[stop_id]
+        self._removed += 1
+        self._registry.release(stop_id)
+        if self._removed * 2 > len(self._ids):
+            self._compact()
+    
+    def _compact(self):
+        self._rebuild([stop_id for stop_id in self._ids if stop_id != self.REMOVED])
+    
+    def _rebuild(self, ids: Iterable[int]):
+        """Заново строит массив и позиции; счетчики в StopNames не меняются"""
+        self._ids = array("l", ids)
+        self._positions.clear()
+        self._removed = 0
+        for position, stop_id in enumerate(self._ids):
+            positions = self._positions.get(stop_id)
+            if positions is None:
+                positions = self._positions[stop_id] = deque()
+            positions.append(position)
+    
+    def count(self, name: str) -> int:
+        return len(self._positions.get(self._registry.ids.get(name), ()))
+    
+    def __contains__(self, name: str) -> bool:
+        return self._registry.ids.get(name) in self._positions
+    
+    def __iter__(self) -> Iterator[str]:
+        names = self._registry.names
+        for stop_id in self._ids:
+            if stop_id != self.REMOVED:
+                yield names[stop_id]
+    
+    def __len__(self) -> int:
+        return len(self._ids) - self._removed
+    
+    def __getitem__(self, index):
+        if self._removed:
+            self._compact()
+        names = self._registry.names
+        if isinstance(index, slice):
+            return [names[stop_id] for stop_id in self._ids[index]]
+        return names[self._ids[index]]
+    
+    def __setitem__(self, index: int, name: str):
+        if isinstance(index, slice):
+            raise TypeError("StopSequence не поддерживает присваивание срезу")
+        if self._removed:
+            self._compact()
+        old_id = self._ids[index]
+        self._ids[index] = self._registry.intern(name)
+        self._rebuild(self._ids)
+        self._registry.release(old_id)
+    
+    def __eq__(self, other) -> bool:
+        try:
+            return list(self) == list(other)
+        except TypeError:
+            return NotImplemented
+    
+    def __repr__(self) -> str:
+        return f"StopSequence({list(self)!r})"
 
 class Route:
     def __init__(self, id: int, number: str, length_km: float):
         self.id = id
         self.number = number
         self.length_km = length_km
-        self.stops: List[str] = []
+        self.stops = []
+    
+    @property
+    def stops(self) -> StopSequence:
+        return self._stops
+    
+    @stops.setter
+    def stops(self, names: Iterable[str]):
+        self._stops = StopSequence(names)
+    
+    @staticmethod
+    def _check_stop_name(stop_name: str):
+        if not isinstance(stop_name, str) or not stop_name:
+            raise ValueError(f"Некорректное название остановки: {stop_name!r}")
     
     def add_stop(self, stop_name: str):
+        self._check_stop_name(stop_name)
         self.stops.append(stop_name)
-        print(f"Остановка '{stop_name}' добавлена к маршруту {self.number}")
+        record_change(self, "add_stop", stop_name)
+        emit_event(f"Остановка '{stop_name}' добавлена к маршруту {self.number}")
+    
+    def add_stops(self, stop_names: Iterable[str]) -> int:
+        """Добавляет пакет остановок; при ошибке проверки ничего не добавляется"""
+        batch = []
+        for stop_name in stop_names:
+            self._check_stop_name(stop_name)
+            batch.append(stop_name)
+        self.stops.extend(batch)
+        record_change(self, "add_stops", batch)
+        emit_event(f"К маршруту {self.number} добавлено остановок: {len(batch)}")
+        return len(batch)
     
     def remove_stop(self, stop_name: str):
         if stop_name in self.stops:
             self.stops.remove(stop_name)
-            print(f"Остановка '{stop_name}' удалена из маршруту {self.number}")
+            record_change(self, "remove_stop", stop_name)
+            emit_event(f"Остановка '{stop_name}' удалена из маршруту {self.number}")
         else:
-            print(f"Остановка '{stop_name}' не найдена в маршруте {self.number}")
+            emit_event(f"Остановка '{stop_name}' не найдена в маршруте {self.number}")
     
     def update_length(self, km: float):
         self.length_km = km
-        print(f"Длина маршрута {self.number} обновлена: {km} км")
+        record_change(self, "update_length", km)
+        emit_event(f"Длина маршрута {self.number} обновлена: {km} км")
     
     def get_stops_info(self) -> str:
         return f"Маршрут {self.number}: {', '.join(self.stops)}"
 
-class Trip:
+def _trip_time(name: str) -> property:
+    """Время рейса поверх слота _name: присваивание обновляет индекс интервалов"""
+    slot = "_" + name
+    
+    def set_value(trip: 'Trip', value: datetime):
+        setattr(trip, slot, value)
+        if trip._interval_index is not None:
+            trip._interval_index.update(trip)
+    
+    return property(attrgetter(slot), set_value)
+
+class Trip(Indexed):
+    __slots__ = ("id", "_date", "_departure_time", "_arrival_time", "_status", "transport_id", "_interval_index")
+    
+    date = indexed_attribute("date")
+    status = indexed_attribute("status")
+    departure_time = _trip_time("departure_time")
+    arrival_time = _trip_time("arrival_time")
+    
     def __init__(self, id: int, trip_date: date, departure_time: datetime, arrival_time: datetime):
         self.id = id
-        self.date = trip_date
-        self.departure_time = departure_time
-        self.arrival_time = arrival_time
-        self.status = "scheduled"
+        self._date = trip_date
+        self._departure_time = departure_time
+        self._arrival_time = arrival_time
+        self._status = "scheduled"
+        self.transport_id: Optional[int] = None
+        self._interval_index: Optional[TripIntervalIndex] = None
+        self._indexes: Optional[IndexSet] = None
+    
+    def __reduce__(self):
+        # The interval and secondary indexes belong to the registry the trip
+        # is in, so a pickled or copied trip leaves them behind
+        return Trip._restore, (self.id, self.date, self.departure_time, self.arrival_time, self.status,
+                               self.transport_id)
+    
+    @staticmethod
+    def _restore(id: int, trip_date: date, departure_time: datetime, arrival_time: datetime, status: str,
+                 transport_id: Optional[int] = None) -> 'Trip':
+        trip = Trip(id, trip_date, departure_time, arrival_time)
+        trip._status = status
+        trip.transport_id = transport_id
+        return trip
     
     def start_trip(self):
         self.status = "in_progress"
-        print(f"Рейс {self.id} начат")
+        record_change(self, "start_trip")
+        emit_event(f"Рейс {self.id} начат")
     
     def finish_trip(self):
         self.status = "completed"
-        print(f"Рейс {self.id} завершен")
+        record_change(self, "finish_trip")
+        emit_event(f"Рейс {self.id} завершен")
     
     def update_times(self, new_departure: datetime, new_arrival: datetime):
-        self.departure_time = new_departure
+        self._departure_time = new_departure
         self.arrival_time = new_arrival
-        print(f"Время рейса {self.id} обновлено: отправление {new_departure}, прибытие {new_arrival}")
+        record_change(self, "update_times", new_departure, new_arrival)
+        emit_event(f"Время рейса {self.id} обновлено: отправление {new_departure}, прибытие {new_arrival}")
+    
+    def assign_transport(self, transport: 'Transport'):
+        self.transport_id = transport.id
+        record_change(self, "assign_transport", transport.id)
+        emit_event(f"Рейсу {self.id} назначен транспорт {transport.model}")
     
     def get_duration(self) -> timedelta:
         return self.arrival_time - self.departure_time
@@ -155,52 +756,462 @@ class Trip:
         return f"Рейс ID: {self.id}, Дата: {self.date}, Статус: {self.status}, Отправление: {self.departure_time}, Прибытие: {self.arrival_time}, Длительность: {duration}"
 
 class Passenger:
+    # Ledger of the tickets of all passengers in the system (see PassengerRegistry)
+    _ledger: Optional['TicketLedger'] = None
+    
     def __init__(self, id: int, full_name: str, phone: str):
         self.id = id
         self.full_name = full_name
         self.phone = phone
-        self.tickets: List[Ticket] = []
+        self.tickets = []
     
-    def buy_ticket(self, trip: Trip, price: float) -> 'Ticket':
-        ticket = Ticket(len(self.tickets) + 1, price, date.today())
+    @property
+    def tickets(self) -> Registry['Ticket']:
+        """Билеты пассажира по номеру: поиск и удаление за O(1)"""
+        return self._tickets
+    
+    @tickets.setter
+    def tickets(self, tickets: Iterable['Ticket']):
+        self._tickets = Registry(tickets)
+    
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop("_ledger", None)
+        return state
+    
+    def _append_tickets(self, tickets: Iterable['Ticket']):
+        """Добавляет билеты и вносит их в журнал билетов системы"""
+        tickets = list(tickets)
+        self.tickets.extend(tickets)
+        if self._ledger is not None:
+            self._ledger.attach_many(tickets)
+    
+    def _append_ticket(self, ticket: 'Ticket'):
         self.tickets.append(ticket)
-        print(f"Билет куплен пассажиром {self.full_name} на рейс {trip.id}")
+        if self._ledger is not None:
+            self._ledger.attach(ticket)
+    
+    def _allocate_ticket_ids(self, count: int) -> int:
+        """Первый из count новых номеров билетов"""
+        if self._ledger is not None:
+            return self._ledger.allocate(count)
+        return max((ticket.id for ticket in self.tickets), default=0) + 1
+    
+    def buy_ticket(self, trip: Trip, price: float) -> 'Ticket':
+        ticket = Ticket(self._allocate_ticket_ids(1), price, date.today())
+        ticket.passenger_id = self.id
+        ticket.trip_id = trip.id
+        with change_lock():
+            self._append_ticket(ticket)
+            record_change(self, "add_ticket", ticket)
+        emit_event(f"Билет куплен пассажиром {self.full_name} на рейс {trip.id}")
         return ticket
     
+    def buy_tickets(self, purchases: Iterable[Tuple[Trip, float]]) -> List['Ticket']:
+        """Покупает пакет билетов по парам (рейс, цена)
+        
+        Билеты создаются до добавления, поэтому некорректная цена
+        не оставляет пассажиру часть пакета.
+        """
+        purchases = list(purchases)
+        issue_date = date.today()
+        first_id = self._allocate_ticket_ids(len(purchases))
+        batch = [Ticket(first_id + i, price, issue_date) for i, (trip, price) in enumerate(purchases)]
+        for ticket, (trip, price) in zip(batch, purchases):
+            ticket.passenger_id = self.id
+            ticket.trip_id = trip.id
+        with change_lock():
+            self._append_tickets(batch)
+            record_change(self, "add_tickets", batch)
+        emit_event(f"Пассажиром {self.full_name} куплено билетов: {len(batch)}")
+        return batch
+    
+    def find_ticket(self, ticket_id: int) -> Optional['Ticket']:
+        """Билет пассажира по номеру: через журнал системы за O(1), иначе перебором"""
+        if self._ledger is not None:
+            ticket = self._ledger.get(ticket_id)
+            if ticket is not None and ticket.passenger_id == self.id and ticket._indexes is self._ledger:
+                return ticket
+        # Tickets loaded from older files may repeat ids across passengers
+        return self.tickets.get_by_id(ticket_id)
+    
     def cancel_ticket(self, ticket_id: int):
-        for ticket in self.tickets:
-            if ticket.id == ticket_id:
-                ticket.cancel()
-                self.tickets.remove(ticket)
-                print(f"Билет {ticket_id} отменен пассажиром {self.full_name}")
-                return
-        print(f"Билет {ticket_id} не найден")
+        ticket = self.find_ticket(ticket_id)
+        if ticket is None:
+            emit_event(f"Билет {ticket_id} не найден")
+            return
+        self._cancel(ticket)
+    
+    def _cancel(self, ticket: 'Ticket'):
+        # One entry for the whole cancellation: replaying it also removes the ticket
+        with change_lock():
+            ticket._set_cancelled()
+            self.tickets.remove(ticket)
+            if self._ledger is not None:
+                self._ledger.detach(ticket)
+            record_change(self, "cancel_ticket", ticket.id)
+        emit_event(f"Билет {ticket.id} отменен пассажиром {self.full_name}")
     
     def update_contact(self, phone: str):
         self.phone = phone
-        print(f"Контактные данные пассажира {self.full_name} обновлены")
+        record_change(self, "update_contact", phone)
+        emit_event(f"Контактные данные пассажира {self.full_name} обновлены")
 
-class Ticket:
+class Ticket(Indexed):
+    __slots__ = ("id", "price", "_issue_date", "_status", "passenger_id", "trip_id")
+    
+    issue_date = indexed_attribute("issue_date")
+    status = indexed_attribute("status")
+    
     def __init__(self, id: int, price: float, issue_date: date):
         if price <= 0:
             raise ValueError("Цена билета должна быть положительной")
         self.id = id
         self.price = price
-        self.issue_date = issue_date
-        self.status = "active"
+        self._issue_date = issue_date
+        self._status = "active"
+        self.passenger_id: Optional[int] = None
+        self.trip_id: Optional[int] = None
+        self._indexes: Optional[IndexSet] = None
 
-    def cancel(self):
+    def _set_cancelled(self):
         self.status = "cancelled"
-        print(f"Билет {self.id} отменен")
+    
+    def cancel(self):
+        self._set_cancelled()
+        record_change(self, "cancel")
+        emit_event(f"Билет {self.id} отменен")
     
     def update_price(self, price: float):
         self.price = price
-        print(f"Цена билета {self.id} обновлена: {price}")
+        record_change(self, "update_price", price)
+        emit_event(f"Цена билета {self.id} обновлена: {price}")
+
+class TicketLedger(IndexSet):
+    """Билеты всех пассажиров системы: индексы, сквозные номера и проданные места
+    
+    Выдает номера билетов по возрастанию, находит билет по номеру и
+    считает активные билеты каждого рейса; все операции за O(1).
+    Номера загруженных билетов повторно не выдаются.
+    
+    Изменения журнала защищены общей короткой блокировкой, поэтому
+    билеты можно продавать и отменять из нескольких потоков. Проверка
+    свободного места и продажа выполняются под блокировкой своего рейса
+    (trip_lock), и продажи на разные рейсы не ждут друг друга.
+    """
+    def __init__(self):
+        super().__init__(status=attrgetter("status"), issue_date=attrgetter("issue_date"))
+        self.next_id = 1
+        self._by_id: Dict[int, Ticket] = {}
+        self._sold: Dict[int, int] = {}
+        # Ids that tickets loaded from older files repeat across passengers
+        self._shared_ids: Set[int] = set()
+        self._lock = Lock()
+        self._trip_locks: Dict[int, Lock] = {}
+    
+    def trip_lock(self, trip_id: int) -> Lock:
+        """Блокировка мест рейса, создается при первом обращении"""
+        lock = self._trip_locks.get(trip_id)
+        if lock is None:
+            # setdefault is atomic, so racing threads end up with the same lock
+            lock = self._trip_locks.setdefault(trip_id, Lock())
+        return lock
+    
+    def allocate(self, count: int = 1) -> int:
+        """Резервирует count номеров подряд и возвращает первый"""
+        with self._lock:
+            first = self.next_id
+            self.next_id += count
+        return first
+    
+    def get(self, ticket_id: int) -> Optional[Ticket]:
+        return self._by_id.get(ticket_id)
+    
+    def is_shared(self, ticket_id: int) -> bool:
+        """Был ли номер выдан нескольким загруженным билетам"""
+        return ticket_id in self._shared_ids
+    
+    def sold_seats(self, trip_id: int) -> int:
+        return self._sold.get(trip_id, 0)
+    
+    def _count_seat(self, ticket: Ticket, delta: int):
+        if ticket.trip_id is not None:
+            self._sold[ticket.trip_id] = self._sold.get(ticket.trip_id, 0) + delta
+    
+    def _track(self, ticket: Ticket):
+        if self._by_id.get(ticket.id, ticket) is not ticket:
+            self._shared_ids.add(ticket.id)
+        self._by_id[ticket.id] = ticket
+        if ticket.id >= self.next_id:
+            self.next_id = ticket.id + 1
+        if ticket.status == "active":
+            self._count_seat(ticket, 1)
+    
+    def attach(self, ticket: Ticket):
+        with self._lock:
+            super().attach(ticket)
+            self._track(ticket)
+    
+    def attach_many(self, tickets: List[Ticket]):
+        with self._lock:
+            super().attach_many(tickets)
+            for ticket in tickets:
+                self._track(ticket)
+    
+    def detach(self, ticket: Ticket):
+        with self._lock:
+            if ticket._indexes is not self:
+                return
+            super().detach(ticket)
+            if self._by_id.get(ticket.id) is ticket:
+                del self._by_id[ticket.id]
+            if ticket.status == "active":
+                self._count_seat(ticket, -1)
+    
+    def move(self, ticket: Ticket, name: str, old: Hashable):
+        with self._lock:
+            super().move(ticket, name, old)
+            if name == "status" and (old == "active") != (ticket.status == "active"):
+                self._count_seat(ticket, 1 if ticket.status == "active" else -1)
+    
+    def clear(self):
+        with self._lock:
+            super().clear()
+            self._by_id.clear()
+            self._sold.clear()
+            self._shared_ids.clear()
+
+class TripRegistry(IndexedRegistry[Trip]):
+    """Реестр рейсов с индексами по дате и статусу и индексом интервалов времени
+    
+    Рейс, добавленный в реестр, сообщает индексу интервалов об update_times.
+    """
+    def __init__(self, items: Iterable[Trip] = ()):
+        self.intervals = TripIntervalIndex()
+        super().__init__(items, date=attrgetter("date"), status=attrgetter("status"))
+    
+    def _attach(self, trip: Trip):
+        super()._attach(trip)
+        trip._interval_index = self.intervals
+        self.intervals.add(trip)
+    
+    def _attach_many(self, trips: List[Trip]):
+        super()._attach_many(trips)
+        for trip in trips:
+            trip._interval_index = self.intervals
+            self.intervals.add(trip)
+    
+    def _detach(self, trip: Optional[Trip]):
+        if trip is not None and trip._interval_index is self.intervals:
+            trip._interval_index = None
+            self.intervals.remove(trip)
+        super()._detach(trip)
+    
+    def _release(self, trip: Trip):
+        super()._release(trip)
+        trip._interval_index = None
+    
+    def clear(self):
+        super().clear()
+        self.intervals.clear()
+
+class PassengerRegistry(IndexedRegistry[Passenger]):
+    """Реестр пассажиров, который ведет журнал всех их билетов (TicketLedger)
+    
+    Билеты, купленные через buy_ticket/buy_tickets, и отмена через
+    cancel_ticket обновляют журнал; изменения списка tickets напрямую - нет.
+    """
+    def __init__(self, items: Iterable[Passenger] = ()):
+        self.ledger = TicketLedger()
+        super().__init__(items)
+    
+    def _attach(self, passenger: Passenger):
+        passenger._ledger = self.ledger
+        self.ledger.attach_many(passenger.tickets)
+    
+    def _attach_many(self, passengers: List[Passenger]):
+        for passenger in passengers:
+            passenger._ledger = self.ledger
+        self.ledger.attach_many([ticket for passenger in passengers for ticket in passenger.tickets])
+    
+    def _detach(self, passenger: Optional[Passenger]):
+        if passenger is not None and passenger._ledger is self.ledger:
+            passenger._ledger = None
+            for ticket in passenger.tickets:
+                self.ledger.detach(ticket)
+    
+    def _release(self, passenger: Passenger):
+        passenger._ledger = None
+        for ticket in passenger.tickets:
+            ticket._indexes = None
+    
+    def clear(self):
+        super().clear()
+        self.ledger.clear()
 
 class TransportSystem:
     """Класс для управления всей транспортной системой"""
     def __init__(self):
         self.company = Company(1, "Городской транспорт", "ул. Центральная, 1")
-        self.routes: List[Route] = []
-        self.trips: List[Trip] = []
-        self.passengers: List[Passenger] = []
\ No newline at end of file
+        self.routes: Registry[Route] = Registry()
+        self.trips: TripRegistry = TripRegistry()
+        self.passengers: PassengerRegistry = PassengerRegistry()
+    
+    def add_route(self, route: Route):
+        self.routes.append(route)
+        record_change(self, "add_route", route)
+        emit_event(f"Маршрут {route.number} добавлен")
+    
+    def add_trip(self, trip: Trip):
+        self.trips.append(trip)
+        record_change(self, "add_trip", trip)
+        emit_event(f"Рейс {trip.id} добавлен")
+    
+    def add_passenger(self, passenger: Passenger):
+        self.passengers.append(passenger)
+        record_change(self, "add_passenger", passenger)
+        emit_event(f"Пассажир {passenger.full_name} добавлен")
+    
+    def get_route_by_id(self, id: int) -> Optional[Route]:
+        return self.routes.get_by_id(id)
+    
+    def query(self, entity: str) -> Query:
+        """Запрос к transports, drivers, routes, trips, passengers или tickets
+        
+        Индексированные поля: transports - status и type, trips - date и
+        status, tickets - status и issue_date (см. query.Query).
+        """
+        if entity == "transports":
+            return Query(lambda: self.company.transports, self.company.transports.indexes)
+        if entity == "drivers":
+            return Query(lambda: self.company.drivers)
+        if entity == "routes":
+            return Query(lambda: self.routes)
+        if entity == "trips":
+            return Query(lambda: self.trips, self.trips.indexes)
+        if entity == "passengers":
+            return Query(lambda: self.passengers)
+        if entity == "tickets":
+            return Query(lambda: chain.from_iterable(passenger.tickets for passenger in self.passengers),
+                         self.ledger)
+        raise ValueError(f"Неизвестный вид объектов: {entity}")
+    
+    def get_trip_by_id(self, id: int) -> Optional[Trip]:
+        return self.trips.get_by_id(id)
+    
+    def build_stop_graph(self, hot_stops: Iterable[str] = ()) -> StopGraph:
+        """Строит граф остановок по всем маршрутам для поиска путей
+        
+        Для остановок из hot_stops заранее считаются расстояния до всех остальных.
+        """
+        graph = StopGraph(self.routes)
+        graph.precompute(hot_stops)
+        return graph
+    
+    def trips_running_at(self, moment: datetime) -> List[Trip]:
+        return self.trips.intervals.running_at(moment)
+    
+    def trips_overlapping(self, start: datetime, end: datetime) -> List[Trip]:
+        return self.trips.intervals.overlapping(start, end)
+    
+    def get_overlapping_trips(self, trip: Trip) -> List[Trip]:
+        return self.trips.intervals.overlaps(trip)
+    
+    def get_unassigned_trips(self) -> List[Trip]:
+        """Запланированные рейсы, не назначенные ни одному водителю"""
+        assigned = {trip.id for driver in self.company.drivers for trip in driver.assigned_trips}
+        return [trip for trip in self.trips if trip.id not in assigned and trip.status == "scheduled"]
+    
+    def auto_assign_trips(self, min_rest: timedelta = timedelta(0), apply: bool = True) -> AssignmentResult:
+        """Назначает свободные рейсы водителям компании без пересечений
+        
+        Между рейсами одного водителя остается не меньше min_rest.
+        При apply=False только возвращает план, не меняя назначения.
+        """
+        result = plan_assignments(self.get_unassigned_trips(), self.company.drivers, min_rest)
+        if apply:
+            for driver_id, trips in result.assigned.items():
+                self.company.get_driver_by_id(driver_id).assign_trips(trips)
+        return result
+    
+    def find_driver_conflicts(self, min_rest: timedelta = timedelta(0)) -> List[Conflict]:
+        """Отчет о пересечениях среди уже назначенных рейсов водителей"""
+        return find_conflicts(self.company.drivers, min_rest)
+    
+    def get_passenger_by_id(self, id: int) -> Optional[Passenger]:
+        return self.passengers.get_by_id(id)
+    
+    @property
+    def ledger(self) -> TicketLedger:
+        return self.passengers.ledger
+    
+    def find_ticket(self, ticket_id: int, passenger_id: Optional[int] = None) -> Optional[Tuple[Passenger, Ticket]]:
+        """Пассажир и билет по номеру билета за O(1)
+        
+        Номер, который в старых файлах повторяется у нескольких
+        пассажиров, ищется перебором; если он так и остался
+        неоднозначным, нужен passenger_id, иначе ValueError.
+        """
+        if passenger_id is not None:
+            passenger = self.get_passenger_by_id(passenger_id)
+            ticket = None if passenger is None else passenger.find_ticket(ticket_id)
+            return None if ticket is None else (passenger, ticket)
+        if self.ledger.is_shared(ticket_id):
+            found = [(passenger, ticket) for passenger in self.passengers
+                     for ticket in passenger.tickets if ticket.id == ticket_id]
+            if len(found) > 1:
+                raise ValueError(f"Билет {ticket_id} есть у нескольких пассажиров: укажите passenger_id")
+            return found[0] if found else None
+        ticket = self.ledger.get(ticket_id)
+        if ticket is None:
+            return None
+        passenger = self.get_passenger_by_id(ticket.passenger_id)
+        if passenger is None or passenger.find_ticket(ticket_id) is not ticket:
+            return None
+        return passenger, ticket
+    
+    def trip_capacity(self, trip: Trip) -> Optional[int]:
+        """Вместимость транспорта рейса; None, если транспорт не назначен"""
+        transport = None if trip.transport_id is None else self.company.get_transport_by_id(trip.transport_id)
+        return None if transport is None else transport.capacity
+    
+    def free_seats(self, trip: Trip) -> Optional[int]:
+        capacity = self.trip_capacity(trip)
+        return None if capacity is None else capacity - self.ledger.sold_seats(trip.id)
+    
+    def assign_transport(self, trip: Trip, transport: 'Transport'):
+        """Назначает рейсу транспорт, вмещающий уже проданные билеты"""
+        with self.ledger.trip_lock(trip.id):
+            if transport.capacity < self.ledger.sold_seats(trip.id):
+                raise ValueError(f"Транспорт {transport.id} не вмещает проданные на рейс {trip.id} билеты")
+            trip.assign_transport(transport)
+    
+    def sell_ticket(self, passenger: Passenger, trip: Trip, price: float) -> Ticket:
+        """Продает билет на рейс за O(1), если на нем есть свободное место
+        
+        Рейс без назначенного транспорта вместимостью не ограничен.
+        Безопасно вызывается из нескольких потоков: места одного рейса
+        проверяются и занимаются под его блокировкой, поэтому продать
+        больше мест, чем вмещает транспорт, нельзя. Метод не ждет событий
+        asyncio, так что задачи одного цикла тоже не пересекаются.
+        """
+        if passenger._ledger is not self.ledger:
+            raise ValueError(f"Пассажир {passenger.id} не зарегистрирован в системе")
+        with self.ledger.trip_lock(trip.id):
+            capacity = self.trip_capacity(trip)
+            if capacity is not None and self.ledger.sold_seats(trip.id) >= capacity:
+                raise ValueError(f"На рейс {trip.id} нет свободных мест")
+            return passenger.buy_ticket(trip, price)
+    
+    def cancel_ticket(self, ticket_id: int, passenger_id: Optional[int] = None):
+        """Отменяет билет по номеру за O(1) и освобождает место на рейсе
+        
+        passenger_id нужен только для номеров, повторяющихся у
+        нескольких пассажиров (см. find_ticket).
+        """
+        found = self.find_ticket(ticket_id, passenger_id)
+        if found is None:
+            emit_event(f"Билет {ticket_id} не найден")
+            return
+        passenger, ticket = found
+        passenger._cancel(ticket)
\ No newline at end of file
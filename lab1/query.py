@@ -0,0 +1,137 @@
+from itertools import chain
+from operator import attrgetter
+from typing import Any, Callable, Collection, Dict, Generic, Iterable, Iterator, List, Optional, Tuple, TypeVar, Union
+
+from indexes import AttributeIndex, IndexSet
+
+T = TypeVar("T")
+Key = Union[str, Callable[[Any], Any]]
+
+
+class Query(Generic[T]):
+    """Запрос к объектам одного вида: фильтр, проекция и группировка
+
+    Условия where и between по полям со вторичным индексом берут
+    кандидатов из самой маленькой подходящей группы индекса, а остальные
+    индексированные равенства проверяются принадлежностью к группе,
+    поэтому полный перебор нужен только без таких условий. Индексы
+    обновляются и мутаторами, и прямым присваиванием индексированных
+    атрибутов. Каждый вызов where/between/filter возвращает новый запрос.
+
+        system.query("transports").where(status="running", type=Tram).all()
+        system.query("tickets").where(issue_date=day, status="active").count()
+        week = set(system.query("trips").between("date", monday, sunday))
+        system.query("drivers").filter(lambda d: sum(t in week for t in d.assigned_trips) > 5).all()
+    """
+
+    def __init__(self, scan: Callable[[], Iterable[T]], indexes: Optional[IndexSet] = None):
+        self._scan = scan
+        self._indexes = indexes
+        self._equals: List[Tuple[str, Any]] = []
+        self._ranges: List[Tuple[str, Any, Any]] = []
+        self._predicates: List[Callable[[T], bool]] = []
+
+    def _copy(self) -> 'Query[T]':
+        query = Query(self._scan, self._indexes)
+        query._equals = list(self._equals)
+        query._ranges = list(self._ranges)
+        query._predicates = list(self._predicates)
+        return query
+
+    def _index(self, name: str) -> Optional[AttributeIndex]:
+        return None if self._indexes is None else self._indexes.get(name)
+
+    def _key(self, key: Key) -> Callable[[Any], Any]:
+        if callable(key):
+            return key
+        index = self._index(key)
+        # "type" and similar computed keys exist only as index keys
+        return attrgetter(key) if index is None else index.key
+
+    # --- условия ---
+
+    def where(self, **conditions: Any) -> 'Query[T]':
+        """Равенство атрибутов; type=Bus выбирает объекты ровно этого класса"""
+        query = self._copy()
+        query._equals.extend(conditions.items())
+        return query
+
+    def between(self, name: str, low: Any, high: Any) -> 'Query[T]':
+        """low <= значение <= high"""
+        query = self._copy()
+        query._ranges.append((name, low, high))
+        return query
+
+    def filter(self, predicate: Callable[[T], bool]) -> 'Query[T]':
+        query = self._copy()
+        query._predicates.append(predicate)
+        return query
+
+    # --- выполнение ---
+
+    def _plan(self) -> Tuple[Iterable[T], List[Callable[[T], bool]]]:
+        """Кандидаты из самой маленькой группы индекса и проверки остальных условий"""
+        best: Optional[List[Collection[T]]] = None
+        best_size = 0
+        checks: List[Tuple[int, Callable[[T], bool]]] = []
+        conditions = [(name, (value,)) for name, value in self._equals]
+        conditions += [(name, (low, high)) for name, low, high in self._ranges]
+        for position, (name, bounds) in enumerate(conditions):
+            index = self._index(name)
+            if index is None:
+                key = attrgetter(name)
+                if len(bounds) == 1:
+                    checks.append((position, lambda obj, key=key, value=bounds[0]: key(obj) == value))
+                else:
+                    checks.append((position, lambda obj, key=key, low=bounds[0], high=bounds[1]: low <= key(obj) <= high))
+                continue
+            groups = [index.get(bounds[0])] if len(bounds) == 1 else index.range(*bounds)
+            if len(groups) == 1:
+                checks.append((position, groups[0].__contains__))
+            else:
+                checks.append((position, lambda obj, key=index.key, low=bounds[0], high=bounds[1]: low <= key(obj) <= high))
+            size = sum(map(len, groups))
+            if best is None or size < best_size:
+                best, best_size, chosen = groups, size, position
+        if best is None:
+            return self._scan(), [check for _, check in checks] + self._predicates
+        # The chosen groups satisfy their own condition; they are copied, so
+        # mutating results while iterating is safe
+        candidates = list(chain.from_iterable(best))
+        return candidates, [check for position, check in checks if position != chosen] + self._predicates
+
+    def __iter__(self) -> Iterator[T]:
+        items, checks = self._plan()
+        for check in checks:
+            items = filter(check, items)
+        return iter(items)
+
+    def all(self) -> List[T]:
+        return list(self)
+
+    def first(self) -> Optional[T]:
+        return next(iter(self), None)
+
+    def count(self) -> int:
+        return sum(1 for _ in self)
+
+    def select(self, *keys: Key) -> List[Any]:
+        """Проекция: список значений для одного ключа, иначе список кортежей"""
+        getters = [self._key(key) for key in keys]
+        if len(getters) == 1:
+            return list(map(getters[0], self))
+        return [tuple(getter(obj) for getter in getters) for obj in self]
+
+    def group_by(self, key: Key) -> Dict[Any, List[T]]:
+        getter = self._key(key)
+        groups: Dict[Any, List[T]] = {}
+        for obj in self:
+            groups.setdefault(getter(obj), []).append(obj)
+        return groups
+
+    def count_by(self, key: Key) -> Dict[Any, int]:
+        """Число объектов по значениям ключа; без условий берется из индекса"""
+        index = None if callable(key) else self._index(key)
+        if index is not None and not (self._equals or self._ranges or self._predicates):
+            return index.counts()
+        return {value: len(group) for value, group in self.group_by(key).items()}
@@ -0,0 +1,109 @@
+import heapq
+from collections import deque
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Set, Tuple
+
+if TYPE_CHECKING:
+    from models import Route
+
+
+class StopGraph:
+    """Граф остановок всех маршрутов для планирования поездок
+
+    Узлы - названия остановок; соседние остановки маршрута соединены
+    ребром, вес которого равен длине маршрута, деленной на число
+    перегонов. Остановка с одним названием на нескольких маршрутах -
+    один узел, через который возможна пересадка. Ребра двунаправленные.
+    """
+
+    def __init__(self, routes: Iterable['Route'] = ()):
+        self.adjacency: Dict[str, Dict[str, float]] = {}
+        self.stop_routes: Dict[str, Set[int]] = {}
+        self.route_stops: Dict[int, List[str]] = {}
+        self._distances: Dict[str, Dict[str, float]] = {}
+        for route in routes:
+            self.add_route(route)
+
+    def add_route(self, route: 'Route'):
+        stops = list(route.stops)
+        self.route_stops[route.id] = stops
+        segment = route.length_km / (len(stops) - 1) if len(stops) > 1 else 0.0
+        for stop in stops:
+            self.adjacency.setdefault(stop, {})
+            self.stop_routes.setdefault(stop, set()).add(route.id)
+        for a, b in zip(stops, stops[1:]):
+            if a == b:
+                continue
+            # Parallel routes between the same stops keep the shortest segment
+            weight = min(segment, self.adjacency[a].get(b, segment))
+            self.adjacency[a][b] = weight
+            self.adjacency[b][a] = weight
+        self._distances.clear()
+
+    def _dijkstra(self, source: str, target: Optional[str] = None) -> Tuple[Dict[str, float], Dict[str, str]]:
+        distances = {source: 0.0}
+        previous: Dict[str, str] = {}
+        heap = [(0.0, source)]
+        done: Set[str] = set()
+        while heap:
+            distance, stop = heapq.heappop(heap)
+            if stop in done:
+                continue
+            done.add(stop)
+            if stop == target:
+                break
+            for neighbor, weight in self.adjacency[stop].items():
+                candidate = distance + weight
+                if candidate < distances.get(neighbor, float("inf")):
+                    distances[neighbor] = candidate
+                    previous[neighbor] = stop
+                    heapq.heappush(heap, (candidate, neighbor))
+        return distances, previous
+
+    def shortest_path(self, source: str, target: str) -> Optional[Tuple[float, List[str]]]:
+        """Кратчайший путь в км и список остановок; None, если пути нет"""
+        if source not in self.adjacency or target not in self.adjacency:
+            return None
+        distances, previous = self._dijkstra(source, target)
+        if target not in distances:
+            return None
+        path = [target]
+        while path[-1] != source:
+            path.append(previous[path[-1]])
+        path.reverse()
+        return distances[target], path
+
+    def distance(self, source: str, target: str) -> Optional[float]:
+        """Расстояние в км, из таблицы precompute при наличии"""
+        for a, b in ((source, target), (target, source)):
+            table = self._distances.get(a)
+            if table is not None:
+                return table.get(b)
+        result = self.shortest_path(source, target)
+        return None if result is None else result[0]
+
+    def precompute(self, sources: Iterable[str]):
+        """Сохраняет расстояния от популярных остановок до всех остальных"""
+        for source in sources:
+            if source in self.adjacency:
+                self._distances[source] = self._dijkstra(source)[0]
+
+    def min_transfers(self, source: str, target: str) -> Optional[int]:
+        """Минимальное число пересадок между маршрутами; None, если пути нет"""
+        if source not in self.stop_routes or target not in self.stop_routes:
+            return None
+        if source == target:
+            return 0
+        # Breadth-first search over routes: each step to a new route is one more transfer
+        target_routes = self.stop_routes[target]
+        seen = set(self.stop_routes[source])
+        queue = deque((route_id, 0) for route_id in seen)
+        while queue:
+            route_id, transfers = queue.popleft()
+            if route_id in target_routes:
+                return transfers
+            for stop in self.route_stops[route_id]:
+                for other in self.stop_routes[stop]:
+                    if other not in seen:
+                        seen.add(other)
+                        queue.append((other, transfers + 1))
+        return None
@@ -0,0 +1,77 @@
+import heapq
+from datetime import datetime, timedelta
+from typing import TYPE_CHECKING, Dict, Iterable, List, Tuple
+
+if TYPE_CHECKING:
+    from models import Driver, Trip
+
+
+class AssignmentResult:
+    """Результат автоматического назначения рейсов"""
+    def __init__(self):
+        self.assigned: Dict[int, List['Trip']] = {}
+        self.unassigned: List['Trip'] = []
+
+    @property
+    def assigned_count(self) -> int:
+        return sum(len(trips) for trips in self.assigned.values())
+
+
+class Conflict:
+    """Пара пересекающихся (с учетом отдыха) рейсов одного водителя"""
+    def __init__(self, driver: 'Driver', first: 'Trip', second: 'Trip'):
+        self.driver = driver
+        self.first = first
+        self.second = second
+
+    def __repr__(self) -> str:
+        return f"Conflict(driver={self.driver.id}, trips=({self.first.id}, {self.second.id}))"
+
+
+def _by_departure(trip: 'Trip') -> Tuple[datetime, int]:
+    return trip.departure_time, trip.id
+
+
+def plan_assignments(trips: Iterable['Trip'], drivers: Iterable['Driver'],
+                     min_rest: timedelta = timedelta(0)) -> AssignmentResult:
+    """Распределяет рейсы между водителями без пересечений за O(n log n)
+
+    Рейсы перебираются по времени отправления; куча водителей упорядочена
+    по моменту, когда водитель освобождается (прибытие последнего рейса
+    плюс min_rest). Рейс получает водитель, освободившийся раньше всех,
+    если он успевает к отправлению; иначе рейс остается без водителя.
+    Уже назначенные рейсы водителя не переносятся: новые рейсы ставятся
+    только после последнего из них. Метод ничего не меняет в моделях.
+    """
+    result = AssignmentResult()
+    heap: List[Tuple[datetime, int, 'Driver']] = []
+    for order, driver in enumerate(drivers):
+        free_at = max((trip.arrival_time + min_rest for trip in driver.assigned_trips), default=datetime.min)
+        heap.append((free_at, order, driver))
+    heapq.heapify(heap)
+
+    for trip in sorted(trips, key=_by_departure):
+        if heap and heap[0][0] <= trip.departure_time:
+            _, order, driver = heap[0]
+            heapq.heapreplace(heap, (trip.arrival_time + min_rest, order, driver))
+            result.assigned.setdefault(driver.id, []).append(trip)
+        else:
+            result.unassigned.append(trip)
+    return result
+
+
+def find_conflicts(drivers: Iterable['Driver'], min_rest: timedelta = timedelta(0)) -> List[Conflict]:
+    """Находит рейсы, начинающиеся раньше, чем водитель освободился после предыдущих
+
+    Для каждого рейса сообщается конфликт с рейсом, который держит
+    водителя дольше всех из начавшихся раньше.
+    """
+    conflicts = []
+    for driver in drivers:
+        busy_trip = None
+        for trip in sorted(driver.assigned_trips, key=_by_departure):
+            if busy_trip is not None and trip.departure_time < busy_trip.arrival_time + min_rest:
+                conflicts.append(Conflict(driver, busy_trip, trip))
+            if busy_trip is None or trip.arrival_time > busy_trip.arrival_time:
+                busy_trip = trip
+    return conflicts
@@ -0,0 +1,336 @@
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple, Union
+from xml.sax.saxutils import escape
+from models import *
+from timecodec import EPOCH, EPOCH_ORDINAL, MICROSECOND, decode_date, decode_datetime
+
+
+# Per scalar kind: JSON value, JSON value with epoch=True, parse from XML string
+# and parse from JSON value ("{}" is the expression being converted)
+SCALARS: Dict[str, Tuple[str, str, str, str]] = {
+    "int": ("{}", "{}", "int({})", "{}"),
+    "float": ("{}", "{}", "float({})", "{}"),
+    "str": ("{}", "{}", "{}", "{}"),
+    "date": ("{}.isoformat()", "({}.toordinal() - EPOCH_ORDINAL)", "decode_date({})", "decode_date({})"),
+    "datetime": ("{}.isoformat()", "(({} - EPOCH) // MICROSECOND)", "decode_datetime({})", "decode_datetime({})"),
+}
+
+
+# XML text of a scalar that needs no escaping, or of an escaped string
+XML_VALUES = {
+    "int": "str({})",
+    "float": "str({})",
+    "str": "escape_attrib({})",
+    "date": "{}.isoformat()",
+    "datetime": "{}.isoformat()",
+}
+
+# Same escaping as ElementTree applies to attribute values
+XML_ATTRIB_ENTITIES = {'"': "&quot;", "\r": "&#13;", "\n": "&#10;", "\t": "&#09;"}
+
+
+def escape_attrib(text: str) -> str:
+    return escape(text, XML_ATTRIB_ENTITIES)
+
+
+def text_element(tag: str, text: Optional[str]) -> str:
+    return f"<{tag}>{escape(text)}</{tag}>" if text else f"<{tag} />"
+
+
+def strings_element(tag: str, item: str, values: Iterable[Optional[str]]) -> str:
+    inner = "".join([text_element(item, value) for value in values])
+    return f"<{tag}>{inner}</{tag}>" if inner else f"<{tag} />"
+
+
+def refs_element(tag: str, item: str, objects: Iterable[Any]) -> str:
+    inner = "".join([f"<{item}>{obj.id}</{item}>" for obj in objects])
+    return f"<{tag}>{inner}</{tag}>" if inner else f"<{tag} />"
+
+
+def records_element(tag: str, to_xml: Callable[[Any], str], records: Iterable[Any]) -> str:
+    inner = "".join(map(to_xml, records))
+    return f"<{tag}>{inner}</{tag}>" if inner else f"<{tag} />"
+
+
+class Field:
+    """Поле записи в схеме
+
+    kind - один из SCALARS, "strings" (список строк), "refs" (список
+    объектов, записываемых по id) или вложенная Schema (список записей).
+    Скалярное поле в XML - атрибут, а при xml="text" - дочерний элемент
+    с текстом. Для списков item - тег элемента списка в XML, backref -
+    атрибут вложенной записи, получающий id владельца при загрузке.
+    Необязательное (optional) скалярное поле может быть None: в XML такой
+    атрибут не пишется, а в файлах без поля оно загружается как None.
+    """
+    def __init__(self, name: str, kind: Union[str, 'Schema'] = "str", xml: str = "attrib",
+                 item: Optional[str] = None, backref: Optional[str] = None, optional: bool = False):
+        if optional and xml != "attrib":
+            raise ValueError(f"Поле {name}: необязательным может быть только XML-атрибут")
+        self.name = name
+        self.kind = kind
+        self.xml = xml
+        self.item = item
+        self.backref = backref
+        self.optional = optional
+
+    def convert(self, template: str, value: str) -> str:
+        """Код преобразования value по шаблону; у необязательного поля None не преобразуется"""
+        code = template.format(value)
+        if self.optional and code != value:
+            code = f"(None if {value} is None else {code})"
+        return code
+
+    @property
+    def scalar(self) -> bool:
+        return isinstance(self.kind, str) and self.kind in SCALARS
+
+
+class Const:
+    """Постоянный ключ записи, например тип транспорта"""
+    def __init__(self, name: str, value: str):
+        self.name = name
+        self.value = value
+
+
+class Schema:
+    """Описание класса модели, по которому один раз генерируются функции
+
+    to_dict / to_dict_epoch / to_dicts / from_dict для JSON и to_xml / from_xml
+    для XML: доступ к полям записан в их коде напрямую, без циклов по
+    полям и проверок isinstance. init - поля, передаваемые конструктору
+    по порядку; остальные поля присваиваются после создания объекта.
+    """
+    def __init__(self, cls: type, tag: str, fields: List[Union[Field, Const]], init: Tuple[str, ...]):
+        self.cls = cls
+        self.tag = tag
+        self.fields = fields
+        self.init = init
+        namespace = {
+            "cls": cls, "EPOCH": EPOCH, "EPOCH_ORDINAL": EPOCH_ORDINAL,
+            "MICROSECOND": MICROSECOND, "decode_date": decode_date, "decode_datetime": decode_datetime,
+            "escape_attrib": escape_attrib, "text_element": text_element, "strings_element": strings_element,
+            "refs_element": refs_element, "records_element": records_element,
+        }
+        for field in self._fields():
+            if isinstance(field.kind, Schema):
+                namespace[f"{field.name}_schema"] = field.kind
+        exec(self._source(), namespace)
+        self.to_dict: Callable[[Any], Dict[str, Any]] = namespace["to_dict"]
+        self.to_dict_epoch: Callable[[Any], Dict[str, Any]] = namespace["to_dict_epoch"]
+        self.to_dicts: Callable[[Iterable[Any]], List[Dict[str, Any]]] = namespace["to_dicts"]
+        self.to_dicts_epoch: Callable[[Iterable[Any]], List[Dict[str, Any]]] = namespace["to_dicts_epoch"]
+        self.from_dict: Callable[[Dict[str, Any]], Any] = namespace["from_dict"]
+        self.to_xml: Callable[[Any], str] = namespace["to_xml"]
+        self.from_xml: Callable[[Any], Any] = namespace["from_xml"]
+
+    def encoder(self, epoch: bool = False) -> Callable[[Any], Dict[str, Any]]:
+        return self.to_dict_epoch if epoch else self.to_dict
+
+    def batch_encoder(self, epoch: bool = False) -> Callable[[Iterable[Any]], List[Dict[str, Any]]]:
+        return self.to_dicts_epoch if epoch else self.to_dicts
+
+    def _fields(self) -> List[Field]:
+        return [field for field in self.fields if isinstance(field, Field)]
+
+    # --- генерация кода ---
+
+    def _source(self) -> str:
+        return "\n".join([
+            self._to_dict_source("to_dict", epoch=False),
+            self._to_dict_source("to_dict_epoch", epoch=True),
+            self._from_dict_source(),
+            self._to_xml_source(),
+            self._from_xml_source(),
+        ])
+
+    def _dict_expr(self, var: str, epoch: bool) -> str:
+        """Выражение-словарь для объекта var; вложенные записи встраиваются"""
+        items = []
+        for field in self.fields:
+            if isinstance(field, Const):
+                items.append(f"{field.name!r}: {field.value!r}")
+                continue
+            value = f"{var}.{field.name}"
+            if field.scalar:
+                value = field.convert(SCALARS[field.kind][1 if epoch else 0], value)
+            elif field.kind == "strings":
+                value = f"list({value})"
+            elif field.kind == "refs":
+                value = f"[item.id for item in {value}]"
+            else:
+                item = f"{var}_{field.name}"
+                value = f"[{field.kind._dict_expr(item, epoch)} for {item} in {value}]"
+            items.append(f"{field.name!r}: {value}")
+        return f"{{{', '.join(items)}}}"
+
+    def _to_dict_source(self, name: str, epoch: bool) -> str:
+        expr = self._dict_expr("obj", epoch)
+        return (f"def {name}(obj):\n    return {expr}\n\n"
+                f"def {name.replace('to_dict', 'to_dicts')}(objs):\n    return [{expr} for obj in objs]\n")
+
+    def _construct(self, values: Dict[str, str]) -> List[str]:
+        """Строки тела from_*: создание объекта и присваивание остальных полей"""
+        lines = [f"    obj = cls({', '.join(values[name] for name in self.init)})"]
+        for field in self._fields():
+            if field.name in self.init or field.name not in values:
+                continue
+            lines.append(f"    obj.{field.name} = {values[field.name]}")
+            if field.backref:
+                lines.append(f"    for item in obj.{field.name}:")
+                lines.append(f"        item.{field.backref} = obj.id")
+        lines.append("    return obj")
+        return lines
+
+    def _from_dict_source(self) -> str:
+        values = {}
+        for field in self._fields():
+            value = f"data.get({field.name!r})" if field.optional else f"data[{field.name!r}]"
+            if field.scalar:
+                values[field.name] = field.convert(SCALARS[field.kind][3], value)
+            elif field.kind == "strings":
+                values[field.name] = value
+            elif isinstance(field.kind, Schema):
+                values[field.name] = f"list(map({field.name}_schema.from_dict, {value}))"
+        return "\n".join(["def from_dict(data):"] + self._construct(values)) + "\n"
+
+    def _to_xml_source(self) -> str:
+        # The output matches ElementTree.write: strings are escaped, numbers
+        # and dates are written as is, empty elements become <tag />
+        parts, children = [repr(f"<{self.tag}")], []
+        for field in self.fields:
+            if isinstance(field, Const):
+                parts.append(repr(f' {field.name}="{escape_attrib(field.value)}"'))
+            elif field.scalar and field.xml == "attrib" and field.optional:
+                value = XML_VALUES[field.kind].format(f"obj.{field.name}")
+                opening = repr(f' {field.name}="')
+                parts.append(f"('' if obj.{field.name} is None else {opening} + {value} + '\"')")
+            elif field.scalar and field.xml == "attrib":
+                parts.append(repr(f' {field.name}="'))
+                parts.append(XML_VALUES[field.kind].format(f"obj.{field.name}"))
+                parts.append(repr('"'))
+            elif field.scalar and field.kind == "str":
+                children.append(f"text_element({field.name!r}, obj.{field.name})")
+            elif field.scalar:
+                children.append(repr(f"<{field.name}>"))
+                children.append(XML_VALUES[field.kind].format(f"obj.{field.name}"))
+                children.append(repr(f"</{field.name}>"))
+            elif field.kind == "strings":
+                children.append(f"strings_element({field.name!r}, {field.item!r}, obj.{field.name})")
+            elif field.kind == "refs":
+                children.append(f"refs_element({field.name!r}, {field.item!r}, obj.{field.name})")
+            else:
+                children.append(f"records_element({field.name!r}, {field.name}_schema.to_xml, obj.{field.name})")
+        if children:
+            parts += [repr(">")] + children + [repr(f"</{self.tag}>")]
+        else:
+            parts.append(repr(" />"))
+        return f"def to_xml(obj):\n    return ''.join(({', '.join(parts)},))\n"
+
+    def _from_xml_source(self) -> str:
+        values = {}
+        for field in self._fields():
+            if field.scalar:
+                raw = f"get({field.name!r})" if field.xml == "attrib" else f"elem.find({field.name!r}).text"
+                values[field.name] = field.convert(SCALARS[field.kind][2], raw)
+            elif field.kind == "strings":
+                values[field.name] = f"[item.text for item in elem.find({field.name!r})]"
+            elif isinstance(field.kind, Schema):
+                values[field.name] = f"list(map({field.name}_schema.from_xml, elem.find({field.name!r})))"
+        return "\n".join(["def from_xml(elem):", "    get = elem.get"] + self._construct(values)) + "\n"
+
+
+class TypeDispatch(dict):
+    """Словарь класс -> схема; подкласс без своей схемы получает схему ближайшего предка"""
+    def __missing__(self, cls: type) -> Schema:
+        for base in cls.__mro__[1:]:
+            if base in self:
+                schema = self[cls] = self[base]
+                return schema
+        raise TypeError(f"Нет схемы для {cls.__name__}")
+
+
+TRANSPORT_FIELDS = [Field("id", "int"), Field("model"), Field("capacity", "int"), Field("speed", "float"), Field("status")]
+TRANSPORT_INIT = ("id", "model", "capacity", "speed")
+
+TRANSPORT_SCHEMAS = TypeDispatch()
+TRANSPORT_TYPES: Dict[str, Schema] = {}
+
+
+def register_transport(cls: type, type_name: str, *extra: Field) -> Schema:
+    """Добавляет вид транспорта в JSON и XML
+
+    extra - собственные поля класса, которые передаются конструктору
+    после общих полей Transport.
+    """
+    schema = Schema(cls, "transport", TRANSPORT_FIELDS + [Const("type", type_name)] + list(extra),
+                    TRANSPORT_INIT + tuple(field.name for field in extra))
+    TRANSPORT_SCHEMAS[cls] = schema
+    TRANSPORT_TYPES[type_name] = schema
+    return schema
+
+
+register_transport(Transport, "transport")
+register_transport(Bus, "bus", Field("route_number"))
+register_transport(Train, "train", Field("wagons", "int"))
+register_transport(Tram, "tram", Field("line_number"))
+
+TRIP = Schema(Trip, "trip", [
+    Field("id", "int"),
+    Field("date", "date"),
+    Field("departure_time", "datetime", xml="text"),
+    Field("arrival_time", "datetime", xml="text"),
+    Field("status"),
+    Field("transport_id", "int", optional=True),
+], ("id", "date", "departure_time", "arrival_time"))
+
+TICKET = Schema(Ticket, "ticket", [
+    Field("id", "int"),
+    Field("price", "float"),
+    Field("issue_date", "date"),
+    Field("status"),
+    Field("trip_id", "int", optional=True),
+], ("id", "price", "issue_date"))
+
+DRIVER = Schema(Driver, "driver", [
+    Field("id", "int"),
+    Field("name"),
+    Field("license_number"),
+    Field("assigned_trips", "refs", item="trip_id"),
+], ("id", "name", "license_number"))
+
+ROUTE = Schema(Route, "route", [
+    Field("id", "int"),
+    Field("number"),
+    Field("length_km", "float"),
+    Field("stops", "strings", item="stop"),
+], ("id", "number", "length_km"))
+
+PASSENGER = Schema(Passenger, "passenger", [
+    Field("id", "int"),
+    Field("full_name"),
+    Field("phone"),
+    Field("tickets", TICKET, backref="passenger_id"),
+], ("id", "full_name", "phone"))
+
+
+def transport_to_dict(transport: 'Transport') -> Dict[str, Any]:
+    return TRANSPORT_SCHEMAS[type(transport)].to_dict(transport)
+
+
+def transport_schema(type_name: Optional[str]) -> Schema:
+    schema = TRANSPORT_TYPES.get(type_name)
+    if schema is None:
+        raise ValueError(f"Неизвестный тип транспорта: {type_name}")
+    return schema
+
+
+def transport_from_dict(data: Dict[str, Any]) -> 'Transport':
+    return transport_schema(data.get("type")).from_dict(data)
+
+
+def transport_to_xml(transport: 'Transport') -> str:
+    return TRANSPORT_SCHEMAS[type(transport)].to_xml(transport)
+
+
+def transport_from_xml(elem) -> 'Transport':
+    return transport_schema(elem.get("type")).from_xml(elem)
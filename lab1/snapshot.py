@@ -0,0 +1,427 @@
+import gc
+import mmap
+import struct
+from array import array
+from collections.abc import Sequence
+from datetime import datetime, date
+from typing import Any, Callable, Dict, List, Optional
+from models import *
+from schema import TRANSPORT_SCHEMAS
+
+
+# Binary snapshot layout (little-endian):
+#   header     - magic, version, record counts, company fields
+#   transports - TRANSPORT records
+#   drivers    - DRIVER records, each pointing to a slice of assignments
+#   assignments- trip ids assigned to drivers
+#   routes     - ROUTE records, each pointing to a slice of stops
+#   stops      - string ids of stop names
+#   trips      - TRIP records
+#   passengers - PASSENGER records, each pointing to a slice of tickets
+#   tickets    - TICKET records
+#   strings    - (count + 1) byte offsets followed by the UTF-8 blob
+# Models, names, phones, stop names and statuses are stored once in the
+# string table and referenced by index; index 0 is reserved for None.
+# Optional ids (trip transport, ticket trip) store NONE_ID for None.
+
+MAGIC = b"TSYS"
+VERSION = 2
+NONE_SID = 0
+NONE_ID = -2 ** 63
+
+HEADER = struct.Struct("<4sHH9QqII")
+TRANSPORT = struct.Struct("<qBBIIidq")
+DRIVER = struct.Struct("<qIIII")
+ASSIGNMENT = struct.Struct("<q")
+ROUTE = struct.Struct("<qIdII")
+STOP = struct.Struct("<I")
+TRIP = struct.Struct("<qHBBHBBBBBIHBBBBBIIq")
+PASSENGER = struct.Struct("<qIIII")
+TICKET = struct.Struct("<qdHBBIq")
+STRING_OFFSET = struct.Struct("<Q")
+
+SECTIONS = [
+    ("transports", TRANSPORT),
+    ("drivers", DRIVER),
+    ("assignments", ASSIGNMENT),
+    ("routes", ROUTE),
+    ("stops", STOP),
+    ("trips", TRIP),
+    ("passengers", PASSENGER),
+    ("tickets", TICKET),
+]
+
+# Transport class -> (type code, name of the type-specific attribute)
+TRANSPORT_TYPES = {
+    Transport: (0, None),
+    Bus: (1, "route_number"),
+    Train: (2, "wagons"),
+    Tram: (3, "line_number"),
+}
+TRANSPORT_CLASSES = {code: (cls, attr) for cls, (code, attr) in TRANSPORT_TYPES.items()}
+
+EXTRA_STRING = 0
+EXTRA_INT = 1
+
+
+def transport_type(cls: type) -> tuple:
+    """Код типа и собственный атрибут класса транспорта в снимке
+
+    Класс сводится к классу своей схемы, как при записи в JSON и XML:
+    подкласс без своей схемы пишется как ближайший предок. Видам,
+    добавленным через register_transport, кода в снимке нет.
+    """
+    schema_cls = TRANSPORT_SCHEMAS[cls].cls
+    if schema_cls not in TRANSPORT_TYPES:
+        raise ValueError(f"Вид транспорта {schema_cls.__name__} не поддерживается бинарным снимком")
+    return TRANSPORT_TYPES[schema_cls]
+
+
+class SnapshotLayout:
+    """Смещения секций снимка, вычисляемые по счетчикам из заголовка"""
+
+    def __init__(self, buffer):
+        if len(buffer) < HEADER.size:
+            raise ValueError(f"Снимок обрезан: {len(buffer)} байт, а заголовок занимает {HEADER.size}")
+        fields = HEADER.unpack_from(buffer, 0)
+        magic, version = fields[0], fields[1]
+        if magic != MAGIC:
+            raise ValueError("Файл не является бинарным снимком транспортной системы")
+        if version != VERSION:
+            raise ValueError(f"Неподдерживаемая версия снимка: {version}")
+
+        self.counts: Dict[str, int] = {}
+        self.offsets: Dict[str, int] = {}
+        offset = HEADER.size
+        for (name, record), count in zip(SECTIONS, fields[3:11]):
+            self.counts[name] = count
+            self.offsets[name] = offset
+            offset += count * record.size
+
+        self.string_count = fields[11]
+        self.string_offsets = offset
+        self.string_blob = offset + (self.string_count + 1) * STRING_OFFSET.size
+        # A file cut short would otherwise fail later with struct.error or
+        # silently lose the records at its end
+        size = self.string_blob
+        if len(buffer) >= size:
+            size += STRING_OFFSET.unpack_from(buffer, self.string_blob - STRING_OFFSET.size)[0]
+        if len(buffer) < size:
+            raise ValueError(f"Снимок обрезан: {len(buffer)} байт из {size}")
+        self.company_id, self.company_name, self.company_address = fields[12:15]
+
+    def section(self, buffer, name: str):
+        """Возвращает срез буфера с записями секции без копирования"""
+        record = dict(SECTIONS)[name]
+        start = self.offsets[name]
+        return memoryview(buffer)[start:start + self.counts[name] * record.size]
+
+
+def write_snapshot(system: 'TransportSystem', f):
+    """Записывает систему в бинарный файл, открытый в режиме 'wb'"""
+    strings: Dict[Optional[str], int] = {None: NONE_SID}
+
+    def sid(value: Optional[str]) -> int:
+        index = strings.get(value)
+        if index is None:
+            index = strings[value] = len(strings)
+        return index
+
+    company = system.company
+    transports = []
+    types: Dict[type, tuple] = {}
+    for t in company.transports:
+        cls = type(t)
+        if cls not in types:
+            types[cls] = transport_type(cls)
+        code, attr = types[cls]
+        extra_kind, extra = EXTRA_STRING, NONE_SID
+        if attr is not None:
+            value = getattr(t, attr)
+            if isinstance(value, int):
+                extra_kind, extra = EXTRA_INT, value
+            else:
+                extra = sid(value)
+        transports.append(TRANSPORT.pack(t.id, code, extra_kind, sid(t.status), sid(t.model), t.capacity, t.speed, extra))
+
+    drivers = []
+    assignments = []
+    for d in company.drivers:
+        drivers.append(DRIVER.pack(d.id, sid(d.name), sid(d.license_number), len(assignments), len(d.assigned_trips)))
+        assignments.extend(ASSIGNMENT.pack(trip.id) for trip in d.assigned_trips)
+
+    routes = []
+    stops = []
+    for r in system.routes:
+        routes.append(ROUTE.pack(r.id, sid(r.number), r.length_km, len(stops), len(r.stops)))
+        stops.extend(STOP.pack(sid(stop)) for stop in r.stops)
+
+    trips = []
+    for t in system.trips:
+        d, dep, arr = t.date, t.departure_time, t.arrival_time
+        trips.append(TRIP.pack(
+            t.id, d.year, d.month, d.day,
+            dep.year, dep.month, dep.day, dep.hour, dep.minute, dep.second, dep.microsecond,
+            arr.year, arr.month, arr.day, arr.hour, arr.minute, arr.second, arr.microsecond,
+            sid(t.status), NONE_ID if t.transport_id is None else t.transport_id
+        ))
+
+    passengers = []
+    tickets = []
+    for p in system.passengers:
+        passengers.append(PASSENGER.pack(p.id, sid(p.full_name), sid(p.phone), len(tickets), len(p.tickets)))
+        for ticket in p.tickets:
+            d = ticket.issue_date
+            tickets.append(TICKET.pack(ticket.id, ticket.price, d.year, d.month, d.day, sid(ticket.status),
+                                       NONE_ID if ticket.trip_id is None else ticket.trip_id))
+
+    company_name, company_address = sid(company.name), sid(company.address)
+
+    encoded = [b""] + [s.encode("utf-8") for s in strings if s is not None]
+    string_offsets = array("Q", [0])
+    total = 0
+    for s in encoded:
+        total += len(s)
+        string_offsets.append(total)
+    if string_offsets.itemsize != STRING_OFFSET.size:
+        raise RuntimeError("Неподдерживаемый размер array('Q')")
+
+    f.write(HEADER.pack(
+        MAGIC, VERSION, 0,
+        len(transports), len(drivers), len(assignments), len(routes), len(stops),
+        len(trips), len(passengers), len(tickets), len(encoded),
+        company.id, company_name, company_address
+    ))
+    for records in (transports, drivers, assignments, routes, stops, trips, passengers, tickets):
+        f.write(b"".join(records))
+    f.write(string_offsets.tobytes())
+    f.write(b"".join(encoded))
+
+
+def read_strings(buffer, layout: SnapshotLayout) -> List[Optional[str]]:
+    offsets = array("Q")
+    offsets.frombytes(memoryview(buffer)[layout.string_offsets:layout.string_blob])
+    blob = bytes(memoryview(buffer)[layout.string_blob:layout.string_blob + offsets[-1]])
+    strings = [blob[offsets[i]:offsets[i + 1]].decode("utf-8") for i in range(layout.string_count)]
+    strings[NONE_SID] = None
+    return strings
+
+
+def read_snapshot(buffer, system: 'TransportSystem'):
+    """Заполняет пустую систему данными из буфера со снимком"""
+    # The cyclic GC would repeatedly rescan the freshly built object graph
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        _read_records(buffer, system)
+    finally:
+        if gc_enabled:
+            gc.enable()
+
+
+def transport_from_record(record: tuple, strings) -> 'Transport':
+    tid, code, extra_kind, status, model, capacity, speed, extra = record
+    if code:
+        cls, _ = TRANSPORT_CLASSES[code]
+        transport = cls(tid, strings[model], capacity, speed, extra if extra_kind == EXTRA_INT else strings[extra])
+    else:
+        transport = Transport(tid, strings[model], capacity, speed)
+    transport.status = strings[status]
+    return transport
+
+
+def trip_from_record(r: tuple, strings) -> 'Trip':
+    trip = Trip(r[0], date(r[1], r[2], r[3]), datetime(*r[4:11]), datetime(*r[11:18]))
+    trip.status = strings[r[18]]
+    trip.transport_id = None if r[19] == NONE_ID else r[19]
+    return trip
+
+
+def ticket_from_record(r: tuple, strings) -> 'Ticket':
+    ticket = Ticket(r[0], r[1], date(r[2], r[3], r[4]))
+    ticket.status = strings[r[5]]
+    ticket.trip_id = None if r[6] == NONE_ID else r[6]
+    return ticket
+
+
+def _read_records(buffer, system: 'TransportSystem'):
+    layout = SnapshotLayout(buffer)
+    strings = read_strings(buffer, layout)
+
+    company = system.company
+    company.id = layout.company_id
+    company.name = strings[layout.company_name]
+    company.address = strings[layout.company_address]
+
+    for record in TRANSPORT.iter_unpack(layout.section(buffer, "transports")):
+        company.transports.append(transport_from_record(record, strings))
+
+    for record in TRIP.iter_unpack(layout.section(buffer, "trips")):
+        system.trips.append(trip_from_record(record, strings))
+
+    assignments = [trip_id for (trip_id,) in ASSIGNMENT.iter_unpack(layout.section(buffer, "assignments"))]
+    for did, name, license_number, first, count in DRIVER.iter_unpack(layout.section(buffer, "drivers")):
+        driver = Driver(did, strings[name], strings[license_number])
+        for trip_id in assignments[first:first + count]:
+            trip = system.get_trip_by_id(trip_id)
+            if trip is not None:
+                driver.assigned_trips.append(trip)
+        company.drivers.append(driver)
+
+    stops = [strings[index] for (index,) in STOP.iter_unpack(layout.section(buffer, "stops"))]
+    for rid, number, length_km, first, count in ROUTE.iter_unpack(layout.section(buffer, "routes")):
+        route = Route(rid, strings[number], length_km)
+        route.stops = stops[first:first + count]
+        system.routes.append(route)
+
+    tickets = [ticket_from_record(record, strings) for record in TICKET.iter_unpack(layout.section(buffer, "tickets"))]
+    for pid, full_name, phone, first, count in PASSENGER.iter_unpack(layout.section(buffer, "passengers")):
+        passenger = Passenger(pid, strings[full_name], strings[phone])
+        passenger.tickets = tickets[first:first + count]
+        for ticket in passenger.tickets:
+            ticket.passenger_id = pid
+        system.passengers.append(passenger)
+
+
+class LazyStrings:
+    """Строки таблицы снимка, декодируемые при первом обращении"""
+
+    def __init__(self, buffer, layout: SnapshotLayout):
+        self._buffer = buffer
+        self._layout = layout
+        self._cache: Dict[int, Optional[str]] = {NONE_SID: None}
+
+    def __getitem__(self, index: int) -> Optional[str]:
+        value = self._cache.get(index, self)
+        if value is self:
+            start, end = struct.unpack_from("<2Q", self._buffer, self._layout.string_offsets + index * STRING_OFFSET.size)
+            blob = self._layout.string_blob
+            value = self._cache[index] = self._buffer[blob + start:blob + end].decode("utf-8")
+        return value
+
+
+class LazyRecords(Sequence):
+    """Последовательность объектов, создаваемых из записей снимка при обращении.
+    
+    Созданные объекты кэшируются, поэтому повторное обращение возвращает
+    тот же объект. Индекс по id строится при первом вызове get_by_id
+    по сырым записям, без создания объектов.
+    """
+
+    def __init__(self, buffer, offset: int, count: int, record: struct.Struct, build: Callable[[tuple], Any]):
+        self._buffer = buffer
+        self._offset = offset
+        self._count = count
+        self._record = record
+        self._build = build
+        self._cache: Dict[int, Any] = {}
+        self._positions: Optional[Dict[int, int]] = None
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self._count))]
+        if index < 0:
+            index += self._count
+        if not 0 <= index < self._count:
+            raise IndexError("Индекс записи вне диапазона")
+        obj = self._cache.get(index)
+        if obj is None:
+            record = self._record.unpack_from(self._buffer, self._offset + index * self._record.size)
+            obj = self._cache[index] = self._build(record)
+        return obj
+
+    def get_by_id(self, id: int) -> Optional[Any]:
+        if self._positions is None:
+            size = self._count * self._record.size
+            with memoryview(self._buffer)[self._offset:self._offset + size] as view:
+                self._positions = {record[0]: i for i, record in enumerate(self._record.iter_unpack(view))}
+        index = self._positions.get(id)
+        return None if index is None else self[index]
+
+    @property
+    def materialized(self) -> int:
+        """Число уже созданных объектов"""
+        return len(self._cache)
+
+
+class SnapshotReader:
+    """Read-only представление бинарного снимка через mmap.
+    
+    Открытие файла читает только заголовок; Trip, Passenger, Ticket и
+    остальные объекты создаются при обращении по индексу или id.
+    Атрибуты повторяют TransportSystem: company.transports,
+    company.drivers, routes, trips и passengers.
+    """
+
+    def __init__(self, filename: str):
+        self._file = open(filename, 'rb')
+        try:
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            self._layout = SnapshotLayout(self._mmap)
+        except Exception:
+            self.close()
+            raise
+        layout = self._layout
+        self._strings = LazyStrings(self._mmap, layout)
+
+        self.company = Company(layout.company_id, self._strings[layout.company_name], self._strings[layout.company_address])
+        self.company.transports = self._records("transports", TRANSPORT, self._build_transport)
+        self.company.drivers = self._records("drivers", DRIVER, self._build_driver)
+        self.routes = self._records("routes", ROUTE, self._build_route)
+        self.trips = self._records("trips", TRIP, self._build_trip)
+        self.passengers = self._records("passengers", PASSENGER, self._build_passenger)
+        self._tickets = self._records("tickets", TICKET, self._build_ticket)
+
+    def _records(self, name: str, record: struct.Struct, build: Callable[[tuple], Any]) -> LazyRecords:
+        return LazyRecords(self._mmap, self._layout.offsets[name], self._layout.counts[name], record, build)
+
+    def _unpack_slice(self, name: str, record: struct.Struct, first: int, count: int) -> List[tuple]:
+        start = self._layout.offsets[name] + first * record.size
+        return [record.unpack_from(self._mmap, start + i * record.size) for i in range(count)]
+
+    def _build_transport(self, record: tuple) -> 'Transport':
+        return transport_from_record(record, self._strings)
+
+    def _build_trip(self, record: tuple) -> 'Trip':
+        return trip_from_record(record, self._strings)
+
+    def _build_ticket(self, record: tuple) -> 'Ticket':
+        return ticket_from_record(record, self._strings)
+
+    def _build_driver(self, record: tuple) -> 'Driver':
+        did, name, license_number, first, count = record
+        driver = Driver(did, self._strings[name], self._strings[license_number])
+        for (trip_id,) in self._unpack_slice("assignments", ASSIGNMENT, first, count):
+            trip = self.trips.get_by_id(trip_id)
+            if trip is not None:
+                driver.assigned_trips.append(trip)
+        return driver
+
+    def _build_route(self, record: tuple) -> 'Route':
+        rid, number, length_km, first, count = record
+        route = Route(rid, self._strings[number], length_km)
+        route.stops = [self._strings[index] for (index,) in self._unpack_slice("stops", STOP, first, count)]
+        return route
+
+    def _build_passenger(self, record: tuple) -> 'Passenger':
+        pid, full_name, phone, first, count = record
+        passenger = Passenger(pid, self._strings[full_name], self._strings[phone])
+        passenger.tickets = self._tickets[first:first + count]
+        for ticket in passenger.tickets:
+            ticket.passenger_id = pid
+        return passenger
+
+    def close(self):
+        if getattr(self, "_mmap", None) is not None:
+            self._mmap.close()
+            self._mmap = None
+        self._file.close()
+
+    def __enter__(self) -> 'SnapshotReader':
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,1124 @@
+import io
+import json
+import os
+import pickle
+import random
+import sys
+import tempfile
+import threading
+import unittest
+from unittest import mock
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import redirect_stdout
+from datetime import datetime, date, timedelta
+
+from models import *
+import data_manager
+from data_manager import DataManager, JsonStreamReader
+from columnar import ColumnarStore
+from wal import ChangeLog
+from schema import TRANSPORT_SCHEMAS, TRANSPORT_TYPES, register_transport, Field
+from timecodec import decode_date, decode_dates, decode_datetime, decode_datetimes, to_epoch_days, to_epoch_us
+
+
+def make_system() -> TransportSystem:
+    system = TransportSystem()
+
+    system.company.transports.extend([
+        Bus(1, "Mercedes Citaro", 50, 60.0, "101"),
+        Train(2, "Ласточка", 400, 120.0, 5),
+        Tram(3, "Tatra T3", 80, 40.0, "3"),
+    ])
+    system.company.transports[0].status = "running"
+
+    for i in range(1, 6):
+        trip = Trip(i, date(2024, 1, 15), datetime(2024, 1, 15, 8 + i, 0), datetime(2024, 1, 15, 8 + i, 45))
+        system.trips.append(trip)
+    system.trips[0].status = "in_progress"
+
+    driver = Driver(1, "Иванов Иван", "AB123456")
+    driver.assigned_trips.extend(system.trips[:2])
+    system.company.drivers.append(driver)
+    system.company.drivers.append(Driver(2, "Петров Петр", "CD654321"))
+
+    route = Route(1, "101", 15.5)
+    route.stops = ["Центральный вокзал", "Университет", "Стадион"]
+    system.routes.append(route)
+
+    for i in range(1, 4):
+        passenger = Passenger(i, f"Пассажир {i}", f"+7999123456{i}")
+        for j in range(1, i + 1):
+            ticket = Ticket(j, 45.5 * j, date(2024, 1, 10 + j))
+            ticket.passenger_id = i
+            passenger.tickets.append(ticket)
+        system.passengers.append(passenger)
+    system.passengers[2].tickets[0].status = "cancelled"
+
+    return system
+
+
+def element_tree_xml(system: TransportSystem) -> ET.ElementTree:
+    """Дерево, которое строил save_to_xml до перехода на потоковую запись"""
+    root = ET.Element("transport_system")
+    company = system.company
+    company_elem = ET.SubElement(root, "company", id=str(company.id), name=company.name, address=company.address)
+
+    transports_elem = ET.SubElement(company_elem, "transports")
+    for transport in company.transports:
+        transport_elem = ET.SubElement(transports_elem, "transport", id=str(transport.id), model=transport.model,
+                                       capacity=str(transport.capacity), speed=str(transport.speed),
+                                       status=transport.status)
+        if isinstance(transport, Bus):
+            transport_elem.set("type", "bus")
+            transport_elem.set("route_number", transport.route_number)
+        elif isinstance(transport, Train):
+            transport_elem.set("type", "train")
+            transport_elem.set("wagons", str(transport.wagons))
+        elif isinstance(transport, Tram):
+            transport_elem.set("type", "tram")
+            transport_elem.set("line_number", transport.line_number)
+
+    drivers_elem = ET.SubElement(company_elem, "drivers")
+    for driver in company.drivers:
+        driver_elem = ET.SubElement(drivers_elem, "driver", id=str(driver.id), name=driver.name,
+                                    license_number=driver.license_number)
+        trips_elem = ET.SubElement(driver_elem, "assigned_trips")
+        for trip in driver.assigned_trips:
+            ET.SubElement(trips_elem, "trip_id").text = str(trip.id)
+
+    routes_elem = ET.SubElement(root, "routes")
+    for route in system.routes:
+        route_elem = ET.SubElement(routes_elem, "route", id=str(route.id), number=route.number,
+                                   length_km=str(route.length_km))
+        stops_elem = ET.SubElement(route_elem, "stops")
+        for stop in route.stops:
+            ET.SubElement(stops_elem, "stop").text = stop
+
+    trips_elem = ET.SubElement(root, "trips")
+    for trip in system.trips:
+        trip_elem = ET.SubElement(trips_elem, "trip", id=str(trip.id), date=trip.date.isoformat(), status=trip.status)
+        ET.SubElement(trip_elem, "departure_time").text = trip.departure_time.isoformat()
+        ET.SubElement(trip_elem, "arrival_time").text = trip.arrival_time.isoformat()
+
+    passengers_elem = ET.SubElement(root, "passengers")
+    for passenger in system.passengers:
+        passenger_elem = ET.SubElement(passengers_elem, "passenger", id=str(passenger.id),
+                                       full_name=passenger.full_name, phone=passenger.phone)
+        tickets_elem = ET.SubElement(passenger_elem, "tickets")
+        for ticket in passenger.tickets:
+            ET.SubElement(tickets_elem, "ticket", id=str(ticket.id), price=str(ticket.price),
+                          issue_date=ticket.issue_date.isoformat(), status=ticket.status)
+    return ET.ElementTree(root)
+
+
+class DataManagerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.system = make_system()
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.silence = redirect_stdout(io.StringIO())
+        self.silence.__enter__()
+        self.addCleanup(self.silence.__exit__, None, None, None)
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.tmpdir.name, name)
+
+
+class TestRegistry(unittest.TestCase):
+
+    def setUp(self):
+        self.system = make_system()
+        self.silence = redirect_stdout(io.StringIO())
+        self.silence.__enter__()
+        self.addCleanup(self.silence.__exit__, None, None, None)
+
+    def test_lookup_by_id(self):
+        self.assertEqual(self.system.company.get_transport_by_id(2).model, "Ласточка")
+        self.assertIs(self.system.get_trip_by_id(3), self.system.trips[2])
+        self.assertIs(self.system.get_passenger_by_id(2), self.system.passengers[1])
+        self.assertIsNone(self.system.get_route_by_id(99))
+
+    def test_remove_keeps_order_and_index(self):
+        company = self.system.company
+        company.remove_transport(2)
+        company.fire_driver(1)
+
+        self.assertEqual([t.id for t in company.transports], [1, 3])
+        self.assertIsNone(company.get_transport_by_id(2))
+        self.assertEqual(company.transports[1].id, 3)
+        self.assertEqual([d.id for d in company.drivers], [2])
+
+    def test_duplicate_ids_are_rejected(self):
+        company = self.system.company
+        with self.assertRaises(ValueError):
+            company.add_transport(Bus(1, "Дубликат", 10, 50.0, "1"))
+        with self.assertRaises(ValueError):
+            self.system.trips.extend([Trip(99, date(2024, 1, 1), datetime(2024, 1, 1, 8), datetime(2024, 1, 1, 9)),
+                                      self.system.trips[0]])
+        self.assertEqual(company.get_transport_by_id(1).model, "Mercedes Citaro")
+        self.assertIsNone(self.system.get_trip_by_id(99))
+
+        data = DataManager.to_dict(self.system)
+        data["passengers"].append(data["passengers"][0])
+        with self.assertRaises(ValueError):
+            DataManager._load_from_dict(data, TransportSystem())
+
+    def test_list_operations(self):
+        trips = self.system.trips
+        first, last = trips[0], trips[-1]
+        extra = Trip(50, date(2024, 1, 1), datetime(2024, 1, 1, 8), datetime(2024, 1, 1, 9))
+
+        trips.insert(1, extra)
+        self.assertIs(trips[1], extra)
+        self.assertEqual(trips.index(extra), 1)
+        self.assertIs(trips.pop(), last)
+        self.assertIsNone(trips.get_by_id(last.id))
+        self.assertEqual(trips, [first, extra] + list(trips)[2:])
+        self.assertIs(trips.pop(1), extra)
+        self.assertEqual(self.system.trips_running_at(datetime(2024, 1, 1, 8, 30)), [])
+        with self.assertRaises(ValueError):
+            trips.index(extra)
+
+    def test_removal_keeps_order_and_positions(self):
+        registry = Registry(Driver(i, f"Водитель {i}", f"L{i}") for i in range(10))
+        for i in [3, 0, 7]:
+            registry.remove_by_id(i)
+        self.assertEqual([d.id for d in registry], [1, 2, 4, 5, 6, 8, 9])
+        self.assertEqual((len(registry), registry[2].id, registry.index(registry.get_by_id(8))), (7, 4, 5))
+
+        for driver in list(registry)[:5]:
+            registry.remove(driver)
+        registry.append(Driver(10, "Новый", "L10"))
+        registry.insert(0, Driver(11, "Первый", "L11"))
+        self.assertEqual([d.id for d in registry], [11, 8, 9, 10])
+        self.assertEqual([registry.index(d) for d in registry], [0, 1, 2, 3])
+        self.assertEqual(registry.pop(1).id, 8)
+        self.assertEqual(registry.index(registry.get_by_id(10)), 2)
+
+    def test_driver_remove_trip(self):
+        driver = self.system.company.drivers[0]
+        driver.remove_trip(1)
+
+        self.assertEqual([t.id for t in driver.assigned_trips], [2])
+        self.assertIsNone(driver.get_trip_by_id(1))
+        self.assertIn(self.system.trips[1], driver.assigned_trips)
+
+    def test_loaders_fill_indexes(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, "system.xml")
+            DataManager.save_to_xml(self.system, filename)
+            loaded = TransportSystem()
+            DataManager.load_from_xml(filename, loaded, streaming=True)
+
+        self.assertIs(loaded.get_trip_by_id(2), loaded.company.get_driver_by_id(1).get_trip_by_id(2))
+        self.assertEqual(loaded.get_passenger_by_id(3).full_name, "Пассажир 3")
+
+
+class TestBulkOperations(unittest.TestCase):
+
+    def setUp(self):
+        self.sink = CountingSink()
+        self.addCleanup(set_event_sink, set_event_sink(self.sink))
+        self.company = Company(1, "Компания", "Адрес")
+
+    def test_add_transports_emits_once(self):
+        added = self.company.add_transports(Bus(i, f"Bus {i}", 40, 60.0, str(i)) for i in range(1, 101))
+
+        self.assertEqual(added, 100)
+        self.assertEqual(len(self.company.transports), 100)
+        self.assertEqual(self.sink.count, 1)
+
+    def test_batch_is_validated_before_insert(self):
+        self.company.hire_driver(Driver(1, "Иванов", "AB1"))
+        with self.assertRaises(ValueError):
+            self.company.hire_drivers([Driver(2, "Петров", "AB2"), Driver(1, "Сидоров", "AB3")])
+        with self.assertRaises(TypeError):
+            self.company.add_transports([Bus(1, "Bus", 40, 60.0, "1"), "not a transport"])
+
+        self.assertEqual([d.id for d in self.company.drivers], [1])
+        self.assertEqual(len(self.company.transports), 0)
+
+    def test_single_stop_is_validated(self):
+        route = Route(1, "101", 10.0)
+        for name in ["", None, 5]:
+            with self.assertRaises(ValueError):
+                route.add_stop(name)
+        self.assertEqual(len(route.stops), 0)
+        with self.assertRaises(TypeError):
+            EventSink()
+
+    def test_route_driver_passenger_batches(self):
+        route = Route(1, "101", 10.0)
+        route.add_stops(["A", "B", "C"])
+        with self.assertRaises(ValueError):
+            route.add_stops(["D", ""])
+        self.assertEqual(route.stops, ["A", "B", "C"])
+
+        trips = [Trip(i, date(2024, 1, 1), datetime(2024, 1, 1, i), datetime(2024, 1, 1, i, 30)) for i in range(1, 4)]
+        driver = Driver(1, "Иванов", "AB1")
+        driver.assign_trips(trips)
+        self.assertEqual([t.id for t in driver.assigned_trips], [1, 2, 3])
+
+        passenger = Passenger(1, "Пассажир", "+79990000000")
+        tickets = passenger.buy_tickets((trip, 10.0 * trip.id) for trip in trips)
+        self.assertEqual([t.id for t in tickets], [1, 2, 3])
+        with self.assertRaises(ValueError):
+            passenger.buy_tickets([(trips[0], 5.0), (trips[1], -1.0)])
+        self.assertEqual(len(passenger.tickets), 3)
+        self.assertEqual(self.sink.count, 3)
+
+    def test_logging_sink(self):
+        with self.assertLogs("transport", level="INFO") as logs, event_sink(LoggingSink()):
+            Bus(1, "Bus", 40, 60.0, "1").start()
+        self.assertEqual(logs.records[0].getMessage(), "Транспорт Bus запущен")
+
+
+class TestColumnarStore(unittest.TestCase):
+
+    def setUp(self):
+        self.system = make_system()
+        self.store = ColumnarStore.from_system(self.system)
+
+    def test_aggregates_match_object_model(self):
+        tickets = [t for p in self.system.passengers for t in p.tickets]
+        active = [t for t in tickets if t.status == "active"]
+
+        self.assertAlmostEqual(self.store.revenue(), sum(t.price for t in active))
+        self.assertAlmostEqual(self.store.revenue(status=None), sum(t.price for t in tickets))
+        self.assertEqual(self.store.revenue_by_day(), {date(2024, 1, 11): 91.0, date(2024, 1, 12): 182.0, date(2024, 1, 13): 136.5})
+        self.assertEqual(self.store.mean_trip_duration(), timedelta(minutes=45))
+        self.assertEqual(self.store.trips_by_day(), {date(2024, 1, 15): 5})
+        self.assertEqual(self.store.count_trips_by_status(), {"scheduled": 4, "in_progress": 1})
+        self.assertEqual(list(self.store.filter_trip_ids("in_progress")), [1])
+        self.assertEqual(list(self.store.filter_ticket_ids("unknown")), [])
+
+    def test_converts_back_to_objects(self):
+        trips = self.store.to_trips()
+        tickets = self.store.to_tickets()
+
+        self.assertEqual([DataManager._trip_to_dict(t) for t in trips],
+                         [DataManager._trip_to_dict(t) for t in self.system.trips])
+        self.assertEqual([t.status for t in tickets[3]], ["cancelled", "active", "active"])
+
+
+class TestTripIntervalIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.addCleanup(set_event_sink, set_event_sink(NullSink()))
+        self.rnd = random.Random(7)
+        self.start = datetime(2024, 1, 1)
+        self.system = TransportSystem()
+        self.system.trips.extend(self.make_trip(i) for i in range(1, 501))
+
+    def make_trip(self, trip_id: int) -> Trip:
+        departure = self.start + timedelta(minutes=self.rnd.randrange(0, 5000))
+        arrival = departure + timedelta(minutes=self.rnd.randrange(1, 300))
+        return Trip(trip_id, departure.date(), departure, arrival)
+
+    def brute_force(self, lo: datetime, hi: datetime) -> list:
+        trips = [t for t in self.system.trips if t.departure_time < hi and t.arrival_time > lo]
+        return sorted(trips, key=lambda t: (t.departure_time, t.id))
+
+    def check_queries(self):
+        for _ in range(50):
+            moment = self.start + timedelta(minutes=self.rnd.randrange(-100, 5400))
+            self.assertEqual(self.system.trips_running_at(moment), self.brute_force(moment, moment + timedelta(microseconds=1)))
+            end = moment + timedelta(minutes=self.rnd.randrange(1, 600))
+            self.assertEqual(self.system.trips_overlapping(moment, end), self.brute_force(moment, end))
+
+    def test_queries_match_full_scan(self):
+        self.check_queries()
+
+    def test_index_follows_mutations(self):
+        self.check_queries()
+        for round_number in range(1, 4):
+            for trip in self.rnd.sample(list(self.system.trips), 20):
+                departure = self.start + timedelta(minutes=self.rnd.randrange(0, 5000))
+                trip.update_times(departure, departure + timedelta(minutes=90))
+            for trip_id in self.rnd.sample([t.id for t in self.system.trips], 10):
+                self.system.trips.remove_by_id(trip_id)
+            self.system.trips.extend(self.make_trip(1000 * round_number + i) for i in range(self.rnd.randrange(5, 80)))
+            self.check_queries()
+
+    def test_touching_trips_do_not_overlap(self):
+        system = TransportSystem()
+        first = Trip(1, date(2024, 1, 1), datetime(2024, 1, 1, 8), datetime(2024, 1, 1, 9))
+        second = Trip(2, date(2024, 1, 1), datetime(2024, 1, 1, 9), datetime(2024, 1, 1, 10))
+        third = Trip(3, date(2024, 1, 1), datetime(2024, 1, 1, 8, 30), datetime(2024, 1, 1, 9, 30))
+        system.trips.extend([first, second, third])
+
+        self.assertEqual(system.get_overlapping_trips(first), [third])
+        self.assertEqual(system.trips_running_at(datetime(2024, 1, 1, 9)), [third, second])
+
+        system.trips.remove_by_id(3)
+        self.assertEqual(system.get_overlapping_trips(first), [])
+        self.assertIsNone(third._interval_index)
+
+
+class TestTripAssignment(unittest.TestCase):
+
+    def setUp(self):
+        self.addCleanup(set_event_sink, set_event_sink(NullSink()))
+        self.system = TransportSystem()
+        self.day = date(2024, 1, 1)
+        self.system.trips.extend(self.trip(i, 8 + i // 2, 50) for i in range(8))
+        self.system.company.hire_drivers([Driver(1, "Иванов", "AB1"), Driver(2, "Петров", "AB2")])
+
+    def trip(self, trip_id: int, hour: int, minutes: int) -> Trip:
+        departure = datetime(2024, 1, 1, hour)
+        return Trip(trip_id, self.day, departure, departure + timedelta(minutes=minutes))
+
+    def test_assigns_without_conflicts(self):
+        result = self.system.auto_assign_trips(min_rest=timedelta(minutes=10))
+
+        self.assertEqual(result.assigned_count, 8)
+        self.assertEqual(result.unassigned, [])
+        self.assertEqual(self.system.find_driver_conflicts(min_rest=timedelta(minutes=10)), [])
+        self.assertEqual(self.system.get_unassigned_trips(), [])
+
+    def test_leaves_trips_without_free_driver(self):
+        result = self.system.auto_assign_trips(min_rest=timedelta(minutes=15), apply=False)
+
+        self.assertEqual(result.assigned_count, 4)
+        self.assertEqual(len(result.unassigned), 4)
+        self.assertEqual(len(self.system.get_unassigned_trips()), 8)
+
+    def test_respects_existing_assignments(self):
+        driver = self.system.company.get_driver_by_id(1)
+        driver.assign_trip(self.system.trips[7])
+
+        result = self.system.auto_assign_trips()
+
+        # Driver 1 is busy until 11:50, so only driver 2 takes new trips
+        self.assertEqual([t.id for t in result.assigned[2]], [0, 2, 4, 6])
+        self.assertNotIn(1, result.assigned)
+        self.assertEqual([t.id for t in result.unassigned], [1, 3, 5])
+        self.assertEqual(self.system.find_driver_conflicts(), [])
+
+    def test_conflict_report(self):
+        driver = self.system.company.get_driver_by_id(1)
+        driver.assign_trips([self.system.trips[0], self.system.trips[1], self.system.trips[2]])
+
+        conflicts = self.system.find_driver_conflicts()
+
+        self.assertEqual([(c.first.id, c.second.id) for c in conflicts], [(0, 1)])
+        self.assertEqual(len(self.system.find_driver_conflicts(min_rest=timedelta(minutes=15))), 2)
+
+
+class TestStopSequence(unittest.TestCase):
+
+    def setUp(self):
+        self.addCleanup(set_event_sink, set_event_sink(NullSink()))
+
+    def test_behaves_like_list(self):
+        route = Route(1, "101", 10.0)
+        route.stops = ["A", "B", "A", "C"]
+        route.add_stop("D")
+
+        self.assertEqual(route.stops, ["A", "B", "A", "C", "D"])
+        self.assertEqual(route.stops[1:3], ["B", "A"])
+        self.assertEqual(route.stops[-1], "D")
+        self.assertEqual(route.get_stops_info(), "Маршрут 101: A, B, A, C, D")
+
+        route.remove_stop("A")
+        route.remove_stop("Нет такой")
+        self.assertEqual(list(route.stops), ["B", "A", "C", "D"])
+        self.assertIn("A", route.stops)
+        self.assertEqual(route.stops.count("A"), 1)
+
+        for name in ["B", "A", "C"]:
+            route.remove_stop(name)
+        self.assertEqual(route.stops, ["D"])
+        self.assertNotIn("A", route.stops)
+        self.assertEqual(len(route.stops), 1)
+
+    def test_names_are_shared_between_routes(self):
+        first, second = Route(1, "1", 1.0), Route(2, "2", 1.0)
+        first.stops = ["Общая " + "остановка"]
+        second.stops = ["Общая остановка"]
+
+        self.assertIs(next(iter(first.stops)), next(iter(second.stops)))
+
+    def test_list_operations(self):
+        stops = StopSequence(["A", "B", "C", "B"])
+        stops.remove("B")
+        stops[0] = "Z"
+        stops.insert(1, "Y")
+        self.assertEqual(stops.pop(0), "Z")
+        self.assertEqual(stops.pop(), "B")
+        self.assertEqual(stops, ["Y", "C"])
+        self.assertEqual(stops.count("B"), 0)
+        self.assertNotIn("A", stops)
+        self.assertEqual(pickle.loads(pickle.dumps(stops)), ["Y", "C"])
+        with self.assertRaises(TypeError):
+            stops[0:1] = ["A"]
+
+    def test_unused_names_are_released(self):
+        names = StopNames()
+        route = StopSequence(["A", "B", "A"], registry=names)
+        route.remove("B")
+        self.assertEqual(sorted(names.ids), ["A"])
+
+        other = StopSequence(["A", "C"], registry=names)
+        del route
+        self.assertEqual(sorted(names.ids), ["A", "C"])
+        del other
+        self.assertEqual(len(names), 0)
+        self.assertEqual({names.intern("D"), names.intern("E")}, {0, 1})
+
+    def test_formats_unchanged(self):
+        system = make_system()
+        system.routes[0].stops.remove("Университет")
+        self.assertEqual(DataManager._route_to_dict(system.routes[0])["stops"], ["Центральный вокзал", "Стадион"])
+
+
+class TestStopGraph(unittest.TestCase):
+
+    def setUp(self):
+        self.system = TransportSystem()
+        for route_id, number, length, stops in [
+            (1, "1", 4.0, ["A", "B", "C", "D", "E"]),
+            (2, "2", 1.0, ["B", "X", "D"]),
+            (3, "3", 9.0, ["E", "F", "G", "H"]),
+            (4, "4", 1.0, ["Y", "Z"]),
+        ]:
+            route = Route(route_id, number, length)
+            route.stops = stops
+            self.system.routes.append(route)
+        self.graph = self.system.build_stop_graph(hot_stops=["A"])
+
+    def test_shortest_path_uses_shortcut(self):
+        distance, path = self.graph.shortest_path("A", "E")
+
+        self.assertAlmostEqual(distance, 3.0)
+        self.assertEqual(path, ["A", "B", "X", "D", "E"])
+
+    def test_unreachable_and_unknown_stops(self):
+        self.assertIsNone(self.graph.shortest_path("A", "Z"))
+        self.assertIsNone(self.graph.distance("A", "Нет такой"))
+        self.assertIsNone(self.graph.min_transfers("A", "Y"))
+
+    def test_transfers_and_precomputed_distances(self):
+        self.assertEqual(self.graph.min_transfers("A", "D"), 0)
+        self.assertEqual(self.graph.min_transfers("X", "H"), 2)
+        self.assertAlmostEqual(self.graph.distance("H", "A"), 12.0)
+        self.assertIn("A", self.graph._distances)
+
+
+class TestQuery(DataManagerTestCase):
+
+    def test_transports_by_status_and_type(self):
+        transports = self.system.company.transports
+        transports[0].stop()
+        transports[2].start()
+        self.system.company.add_transport(Tram(4, "Tatra T6", 90, 45.0, "5"))
+
+        self.assertEqual(self.system.query("transports").where(status="running", type=Tram).all(), [transports[2]])
+        self.assertEqual(self.system.query("transports").where(type=Tram).select("id"), [3, 4])
+        self.assertEqual(self.system.query("transports").where(status="stopped").select("id"), [2, 1, 4])
+
+        transports[2].stop()
+        self.assertEqual(self.system.query("transports").count_by("status"), {"stopped": 4})
+        self.assertEqual(transports.indexes.get("status").counts(), {"stopped": 4})
+
+    def test_tickets_follow_mutators(self):
+        passenger = self.system.passengers[2]
+        tickets = self.system.query("tickets").where(issue_date=date(2024, 1, 12), status="active")
+        self.assertEqual([(t.passenger_id, t.id) for t in tickets], [(2, 2), (3, 2)])
+
+        passenger.cancel_ticket(2)
+        bought = passenger.buy_ticket(self.system.trips[0], 30.0)
+        self.assertEqual([(t.passenger_id, t.id) for t in tickets], [(2, 2)])
+        self.assertEqual(self.system.query("tickets").where(issue_date=date.today()).all(), [bought])
+
+        bought.cancel()
+        by_status = self.system.query("tickets").group_by("status")
+        self.assertEqual([t.id for t in by_status["cancelled"]], [1, 4])
+        self.assertEqual(len(by_status["active"]), 4)
+
+    def test_trips_by_date_and_driver_load(self):
+        self.system.add_trip(Trip(6, date(2024, 1, 20), datetime(2024, 1, 20, 8, 0), datetime(2024, 1, 20, 9, 0)))
+        self.system.trips[1].start_trip()
+        week = self.system.query("trips").between("date", date(2024, 1, 15), date(2024, 1, 21))
+
+        self.assertEqual(week.count(), 6)
+        self.assertEqual(week.where(status="in_progress").select("id"), [1, 2])
+        self.assertEqual(self.system.query("trips").between("date", date(2024, 1, 16), date(2024, 1, 31)).select("id"), [6])
+
+        in_week = set(week)
+        busy = self.system.query("drivers").filter(lambda d: sum(t in in_week for t in d.assigned_trips) > 1)
+        self.assertEqual(busy.select("id", "name"), [(1, "Иванов Иван")])
+
+    def test_plain_assignment_updates_indexes(self):
+        trip = self.system.trips[4]
+        trip.status = "completed"
+        trip.departure_time = datetime(2024, 2, 1, 10, 0)
+        trip.arrival_time = datetime(2024, 2, 1, 11, 0)
+        self.assertEqual(self.system.query("trips").where(status="completed").all(), [trip])
+        self.assertEqual(self.system.trips_overlapping(datetime(2024, 2, 1, 9, 0), datetime(2024, 2, 1, 12, 0)), [trip])
+
+        ticket = self.system.passengers[0].tickets[0]
+        ticket.status = "cancelled"
+        self.assertIn(ticket, self.system.query("tickets").where(status="cancelled").all())
+
+    def test_removed_objects_leave_indexes(self):
+        trip = self.system.trips[4]
+        self.system.trips.remove_by_id(5)
+        trip.finish_trip()
+        self.assertEqual(self.system.query("trips").where(date=date(2024, 1, 15)).count(), 4)
+        self.assertEqual(self.system.trips.indexes.get("status").counts(), {"scheduled": 3, "in_progress": 1})
+
+        copy = pickle.loads(pickle.dumps(self.system.passengers[1]))
+        self.assertIsNone(copy._ledger)
+        self.assertIsNone(copy.tickets[0]._indexes)
+        copy.tickets[0].cancel()
+        self.assertEqual(self.system.passengers[1].tickets[0].status, "active")
+
+        self.system.passengers.clear()
+        self.assertEqual(self.system.query("tickets").where(status="active").count(), 0)
+
+        with self.assertRaises(ValueError):
+            self.system.query("buses")
+
+
+class TestTicketLedger(DataManagerTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.trip = self.system.trips[1]
+        bus = Bus(7, "ПАЗ", 2, 60.0, "7")
+        self.system.company.add_transport(bus)
+        self.system.assign_transport(self.trip, bus)
+
+    def test_ids_are_unique_across_passengers(self):
+        first, second = self.system.passengers[0], self.system.passengers[1]
+        a = self.system.sell_ticket(first, self.trip, 50.0)
+        first.cancel_ticket(a.id)
+        b = self.system.sell_ticket(first, self.trip, 50.0)
+        c, d = second.buy_tickets([(self.trip, 10.0), (self.system.trips[2], 20.0)])
+
+        self.assertEqual([a.id, b.id, c.id, d.id], [4, 5, 6, 7])
+        self.assertEqual(self.system.find_ticket(6), (second, c))
+        self.assertIsNone(self.system.find_ticket(4))
+        self.assertEqual(c.trip_id, self.trip.id)
+
+    def test_passenger_tickets_are_registry(self):
+        passenger = self.system.passengers[0]
+        bought = passenger.buy_tickets([(self.system.trips[0], 10.0 + i) for i in range(6)])
+        for ticket in bought[::2]:
+            self.system.cancel_ticket(ticket.id)
+
+        self.assertEqual([t.id for t in passenger.tickets], [1] + [t.id for t in bought[1::2]])
+        self.assertIs(passenger.tickets.get_by_id(bought[1].id), bought[1])
+        self.assertIsNone(passenger.find_ticket(bought[0].id))
+        with self.assertRaises(ValueError):
+            passenger.tickets.append(Ticket(1, 5.0, date(2024, 1, 1)))
+
+    def test_shared_legacy_ids_need_passenger(self):
+        # make_system gives passenger i the tickets 1..i, as older files did
+        with self.assertRaises(ValueError):
+            self.system.cancel_ticket(2)
+        self.system.cancel_ticket(2, passenger_id=2)
+        self.assertEqual([t.id for t in self.system.passengers[1].tickets], [1])
+        self.assertEqual([t.id for t in self.system.passengers[2].tickets], [1, 2, 3])
+
+        passenger, ticket = self.system.find_ticket(3)
+        self.assertIs(ticket, self.system.passengers[2].tickets[2])
+        self.assertIsNone(self.system.find_ticket(3, passenger_id=1))
+        self.assertIsNone(self.system.find_ticket(3, passenger_id=99))
+
+    def test_ticket_without_passenger_is_not_found(self):
+        ticket = self.system.sell_ticket(self.system.passengers[0], self.trip, 50.0)
+        ticket.passenger_id = 99
+        self.assertIsNone(self.system.find_ticket(ticket.id))
+        self.system.cancel_ticket(ticket.id)
+        self.assertEqual(ticket.status, "active")
+
+    def test_capacity_is_checked_on_sale(self):
+        passenger = self.system.passengers[0]
+        tickets = [self.system.sell_ticket(passenger, self.trip, 50.0) for _ in range(2)]
+        with self.assertRaises(ValueError):
+            self.system.sell_ticket(passenger, self.trip, 50.0)
+
+        self.system.cancel_ticket(tickets[0].id)
+        self.assertEqual(self.system.free_seats(self.trip), 1)
+        tickets[1].cancel()
+        self.assertEqual(self.system.ledger.sold_seats(self.trip.id), 0)
+
+        self.system.sell_ticket(passenger, self.trip, 50.0)
+        self.system.sell_ticket(passenger, self.trip, 50.0)
+        with self.assertRaises(ValueError):
+            self.system.assign_transport(self.trip, Tram(8, "Tatra T3", 1, 40.0, "3"))
+        # A trip without transport is not limited
+        for _ in range(3):
+            self.system.sell_ticket(passenger, self.system.trips[0], 50.0)
+
+    def test_concurrent_sales_do_not_overbook(self):
+        passengers = list(self.system.passengers)
+        other = self.system.trips[2]
+        other.assign_transport(self.system.company.get_transport_by_id(1))
+
+        def sell(worker):
+            sold = []
+            for i in range(40):
+                trip = self.trip if i % 2 else other
+                try:
+                    sold.append(self.system.sell_ticket(passengers[(worker + i) % len(passengers)], trip, 50.0))
+                except ValueError:
+                    pass
+            return sold
+
+        interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        try:
+            with event_sink(NullSink()), ThreadPoolExecutor(8) as pool:
+                sold = [ticket for batch in pool.map(sell, range(8)) for ticket in batch]
+        finally:
+            sys.setswitchinterval(interval)
+
+        self.assertEqual(sum(ticket.trip_id == self.trip.id for ticket in sold), 2)
+        self.assertEqual(sum(ticket.trip_id == other.id for ticket in sold), 50)
+        self.assertEqual(len({ticket.id for ticket in sold}), len(sold))
+        self.assertEqual(self.system.free_seats(other), 0)
+
+    def test_ledger_is_rebuilt_on_load(self):
+        passenger = self.system.passengers[2]
+        self.system.sell_ticket(passenger, self.trip, 50.0)
+        for save, load, name in [(DataManager.save_to_json, DataManager.load_from_json, "system.json"),
+                                 (DataManager.save_to_xml, DataManager.load_from_xml, "system.xml"),
+                                 (DataManager.save_to_binary, DataManager.load_from_binary, "system.bin")]:
+            save(self.system, self.path(name))
+            loaded = TransportSystem()
+            load(self.path(name), loaded)
+            trip = loaded.get_trip_by_id(self.trip.id)
+            self.assertEqual((trip.transport_id, loaded.free_seats(trip)), (7, 1))
+            self.assertEqual(loaded.sell_ticket(loaded.passengers[0], trip, 50.0).id, 5)
+            with self.assertRaises(ValueError):
+                loaded.sell_ticket(loaded.passengers[0], trip, 50.0)
+
+
+class TestJsonStreaming(DataManagerTestCase):
+
+    def test_streaming_load_matches_full_load(self):
+        filename = self.path("system.json")
+        DataManager.save_to_json(self.system, filename)
+
+        loaded = TransportSystem()
+        DataManager.load_from_json(filename, loaded, streaming=True)
+
+        self.assertEqual(DataManager.to_dict(loaded), DataManager.to_dict(self.system))
+        driver = loaded.company.drivers[0]
+        self.assertIs(driver.assigned_trips[0], loaded.trips[0])
+
+    def test_small_chunks_split_values(self):
+        filename = self.path("system.json")
+        DataManager.save_to_json(self.system, filename)
+
+        loaded = TransportSystem()
+        with open(filename, "r", encoding="utf-8") as f:
+            DataManager._load_from_json_stream(f, loaded, chunk_size=7)
+
+        self.assertEqual(DataManager.to_dict(loaded), DataManager.to_dict(self.system))
+
+    def test_reader_iterates_arrays(self):
+        reader = JsonStreamReader(io.StringIO('{"a": [1, 23, {"b": null}], "c": 45}'), chunk_size=2)
+        result = {}
+        for key in reader.iter_object():
+            if key == "a":
+                result[key] = list(reader.iter_array())
+            else:
+                result[key] = reader.value()
+
+        self.assertEqual(result, {"a": [1, 23, {"b": None}], "c": 45})
+
+
+class TestXmlStreaming(DataManagerTestCase):
+
+    def test_output_matches_element_tree(self):
+        self.system.routes[0].stops.append('Дом "А" & <Б>')
+        filename = self.path("system.xml")
+        DataManager.save_to_xml(self.system, filename)
+
+        reference = self.path("reference.xml")
+        element_tree_xml(self.system).write(reference, encoding="utf-8", xml_declaration=True)
+
+        with open(filename, "rb") as streamed, open(reference, "rb") as expected:
+            self.assertEqual(streamed.read(), expected.read())
+
+    def test_xml_round_trip(self):
+        filename = self.path("system.xml")
+        DataManager.save_to_xml(self.system, filename)
+
+        loaded = TransportSystem()
+        DataManager.load_from_xml(filename, loaded)
+
+        self.assertEqual(DataManager.to_dict(loaded), DataManager.to_dict(self.system))
+
+    def test_streaming_load_matches_full_load(self):
+        filename = self.path("system.xml")
+        DataManager.save_to_xml(self.system, filename)
+
+        loaded = TransportSystem()
+        DataManager.load_from_xml(filename, loaded, streaming=True)
+
+        self.assertEqual(DataManager.to_dict(loaded), DataManager.to_dict(self.system))
+        driver = loaded.company.drivers[0]
+        self.assertEqual([t.id for t in driver.assigned_trips], [1, 2])
+        self.assertIs(driver.assigned_trips[1], loaded.trips[1])
+
+
+class Trolleybus(Transport):
+    __slots__ = ("route_number", "pantographs")
+
+    def __init__(self, id: int, model: str, capacity: int, speed: float, route_number: str, pantographs: int):
+        super().__init__(id, model, capacity, speed)
+        self.route_number = route_number
+        self.pantographs = pantographs
+
+
+class TestSchema(DataManagerTestCase):
+
+    def test_registered_transport_round_trip(self):
+        register_transport(Trolleybus, "trolleybus", Field("route_number"), Field("pantographs", "int"))
+        self.addCleanup(TRANSPORT_SCHEMAS.pop, Trolleybus)
+        self.addCleanup(TRANSPORT_TYPES.pop, "trolleybus")
+        self.system.company.transports.append(Trolleybus(4, "ЗиУ-9", 90, 50.0, "7", 2))
+
+        for save, load, name in [(DataManager.save_to_json, DataManager.load_from_json, "system.json"),
+                                 (DataManager.save_to_xml, DataManager.load_from_xml, "system.xml")]:
+            save(self.system, self.path(name))
+            loaded = TransportSystem()
+            load(self.path(name), loaded)
+            transport = loaded.company.transports[3]
+            self.assertIs(type(transport), Trolleybus)
+            self.assertEqual((transport.route_number, transport.pantographs), ("7", 2))
+            self.assertEqual(DataManager.to_dict(loaded), DataManager.to_dict(self.system))
+
+    def test_unregistered_subclass_uses_parent_schema(self):
+        class Minibus(Bus):
+            __slots__ = ()
+
+        self.addCleanup(TRANSPORT_SCHEMAS.pop, Minibus, None)
+        data = DataManager._transport_to_dict(Minibus(5, "ГАЗель", 18, 80.0, "12"))
+        self.assertEqual((data["type"], data["route_number"]), ("bus", "12"))
+
+    def test_unknown_type_is_rejected(self):
+        with self.assertRaises(ValueError):
+            DataManager._transport_from_dict({"type": "ufo", "id": 1})
+
+
+class TestBinarySnapshot(DataManagerTestCase):
+
+    def test_round_trip(self):
+        self.system.routes[0].stops.append(None)
+        self.system.company.transports.append(Train(4, "Сапсан", 600, 250.0, "10+1"))
+        filename = self.path("system.bin")
+        DataManager.save_to_binary(self.system, filename)
+
+        loaded = TransportSystem()
+        DataManager.load_from_binary(filename, loaded)
+
+        self.assertEqual(DataManager.to_dict(loaded), DataManager.to_dict(self.system))
+        self.assertIs(loaded.company.drivers[0].assigned_trips[1], loaded.trips[1])
+
+    def test_rejects_foreign_file(self):
+        filename = self.path("system.json")
+        DataManager.save_to_json(self.system, filename)
+
+        with self.assertRaises(ValueError):
+            DataManager.load_from_binary(filename, TransportSystem())
+
+    def test_rejects_truncated_file(self):
+        filename = self.path("system.bin")
+        DataManager.save_to_binary(self.system, filename)
+        with open(filename, "rb") as f:
+            data = f.read()
+
+        for size in [0, 10, len(data) // 2, len(data) - 1]:
+            with open(filename, "wb") as f:
+                f.write(data[:size])
+            with self.assertRaisesRegex(ValueError, "обрезан"):
+                DataManager.load_from_binary(filename, self.system)
+        self.assertEqual(len(self.system.passengers), 3)
+
+    def test_transport_types_follow_schemas(self):
+        class Minibus(Bus):
+            __slots__ = ()
+
+        self.addCleanup(TRANSPORT_SCHEMAS.pop, Minibus, None)
+        self.system.company.transports.append(Minibus(4, "ГАЗель", 18, 80.0, "12"))
+        filename = self.path("system.bin")
+        DataManager.save_to_binary(self.system, filename)
+        loaded = TransportSystem()
+        DataManager.load_from_binary(filename, loaded)
+        self.assertEqual(DataManager.to_dict(loaded), DataManager.to_dict(self.system))
+
+        register_transport(Trolleybus, "trolleybus", Field("route_number"), Field("pantographs", "int"))
+        self.addCleanup(TRANSPORT_SCHEMAS.pop, Trolleybus)
+        self.addCleanup(TRANSPORT_TYPES.pop, "trolleybus")
+        self.system.company.transports.append(Trolleybus(5, "ЗиУ-9", 90, 50.0, "7", 2))
+        with self.assertRaisesRegex(ValueError, "Trolleybus"):
+            DataManager.save_to_binary(self.system, filename)
+
+        directory = self.path("wal")
+        with self.assertRaises(ValueError):
+            ChangeLog(directory, self.system).start()
+        self.assertFalse([name for name in os.listdir(directory) if name.endswith(".tmp")])
+
+
+class TestSnapshotReader(DataManagerTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.filename = self.path("system.bin")
+        DataManager.save_to_binary(self.system, self.filename)
+
+    def test_matches_loaded_system(self):
+        with DataManager.open_snapshot(self.filename) as snapshot:
+            self.assertEqual(DataManager.to_dict(snapshot), DataManager.to_dict(self.system))
+
+    def test_materializes_on_access(self):
+        with DataManager.open_snapshot(self.filename) as snapshot:
+            self.assertEqual(len(snapshot.trips), 5)
+            self.assertEqual(snapshot.trips.materialized, 0)
+
+            trip = snapshot.trips.get_by_id(4)
+            self.assertEqual(trip.departure_time, datetime(2024, 1, 15, 12, 0))
+            self.assertIs(snapshot.trips[3], trip)
+            self.assertEqual(snapshot.trips.materialized, 1)
+
+            passenger = snapshot.passengers[-1]
+            self.assertEqual([t.status for t in passenger.tickets], ["cancelled", "active", "active"])
+            self.assertIsNone(snapshot.passengers.get_by_id(42))
+
+    def test_driver_trips_are_shared(self):
+        with DataManager.open_snapshot(self.filename) as snapshot:
+            driver = snapshot.company.drivers[0]
+            self.assertIs(driver.assigned_trips[1], snapshot.trips[1])
+
+
+class TestTimeCodec(DataManagerTestCase):
+
+    def test_epoch_json_round_trip(self):
+        self.system.trips[1].update_times(datetime(1969, 12, 31, 23, 59, 59, 500), datetime(2024, 1, 15, 10, 45))
+        filename = self.path("system.json")
+        DataManager.save_to_json(self.system, filename, epoch=True)
+        with open(filename, encoding="utf-8") as f:
+            data = json.load(f)
+        self.assertEqual(data["trips"][0]["departure_time"], 1705309200000000)
+        self.assertEqual(data["passengers"][0]["tickets"][0]["issue_date"], 19733)
+
+        loaded = TransportSystem()
+        DataManager.load_from_json(filename, loaded)
+        self.assertEqual(DataManager.to_dict(loaded), DataManager.to_dict(self.system))
+
+    def test_sharded_epoch_round_trip(self):
+        directory = self.path("shards")
+        DataManager.save_to_shards(self.system, directory, shards=2, workers=1, epoch=True)
+        loaded = TransportSystem()
+        DataManager.load_from_shards(directory, loaded, workers=1)
+        self.assertEqual(DataManager.to_dict(loaded), DataManager.to_dict(self.system))
+
+    def test_decoders_accept_both_formats(self):
+        moment = datetime(2024, 1, 15, 8, 30, 15, 250)
+        self.assertEqual(decode_datetime(to_epoch_us(moment)), moment)
+        self.assertEqual(decode_datetimes([to_epoch_us(moment), 0]), [moment, datetime(1970, 1, 1)])
+        self.assertEqual(decode_datetimes([moment.isoformat()]), [moment])
+        self.assertEqual(decode_dates(["2024-01-15", "2024-01-15"]), [date(2024, 1, 15)] * 2)
+        mixed = [to_epoch_us(moment), moment.isoformat()]
+        self.assertEqual(decode_datetimes(mixed), [moment] * 2)
+        self.assertEqual(decode_datetimes(mixed[::-1]), [moment] * 2)
+        self.assertEqual(decode_dates([to_epoch_days(moment.date()), "2024-01-15"]), [moment.date(), date(2024, 1, 15)])
+        self.assertEqual(decode_date(to_epoch_days(date(2024, 1, 16))), date(2024, 1, 16))
+        self.assertIs(decode_date("2024-01-16"), decode_date("2024-01-16"))
+
+    def test_repeated_dates_share_one_object(self):
+        filename = self.path("system.json")
+        DataManager.save_to_json(self.system, filename)
+        loaded = TransportSystem()
+        DataManager.load_from_json(filename, loaded)
+        self.assertIs(loaded.trips[0].date, loaded.trips[4].date)
+
+
+class TestShardedPersistence(DataManagerTestCase):
+
+    def test_round_trip_across_processes(self):
+        directory = self.path("shards")
+        DataManager.save_to_shards(self.system, directory, shards=3, workers=2)
+        self.assertEqual(sorted(os.listdir(directory))[:3], ["manifest.json", "passengers-000001-000.json", "passengers-000001-001.json"])
+
+        loaded = TransportSystem()
+        DataManager.load_from_shards(directory, loaded, workers=2)
+
+        self.assertEqual(DataManager.to_dict(loaded), DataManager.to_dict(self.system))
+        # Driver 1's trips 1 and 2 were written to different shards
+        self.assertIs(loaded.company.drivers[0].assigned_trips[1], loaded.trips[1])
+        self.assertEqual(loaded.trips_running_at(datetime(2024, 1, 15, 9, 30)), [loaded.trips[0]])
+        self.assertEqual(loaded.passengers[2].tickets[2].passenger_id, 3)
+
+    def test_stale_shards_are_removed(self):
+        directory = self.path("shards")
+        DataManager.save_to_shards(self.system, directory, shards=4, workers=1)
+        DataManager.save_to_shards(self.system, directory, shards=1, workers=1)
+        self.assertEqual(sorted(os.listdir(directory)),
+                         ["manifest.json", "passengers-000002-000.json", "transports-000002-000.json",
+                          "trips-000002-000.json"])
+
+    def test_failed_save_keeps_previous_copy(self):
+        directory = self.path("shards")
+        DataManager.save_to_shards(self.system, directory, shards=2, workers=1)
+        saved = DataManager.to_dict(self.system)
+        files = sorted(os.listdir(directory))
+
+        def write_then_fail(kind, items, filename, epoch=False):
+            write_shard(kind, items, filename, epoch)
+            if kind == "trips":
+                raise OSError("диск заполнен")
+
+        write_shard = DataManager._write_shard
+        self.system.trips[0].finish_trip()
+        with mock.patch.object(DataManager, "_write_shard", staticmethod(write_then_fail)):
+            with self.assertRaises(OSError):
+                DataManager.save_to_shards(self.system, directory, shards=2, workers=1)
+
+        self.assertEqual(sorted(os.listdir(directory)), files)
+        loaded = TransportSystem()
+        DataManager.load_from_shards(directory, loaded, workers=1)
+        self.assertEqual(DataManager.to_dict(loaded), saved)
+
+    def test_fork_is_not_used_with_other_threads(self):
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            pool.submit(lambda: None).result()
+            self.assertNotEqual(data_manager._shard_context().get_start_method(), "fork")
+
+    def test_pickled_trip_leaves_interval_index(self):
+        trip = pickle.loads(pickle.dumps(self.system.trips[0]))
+        self.assertEqual((trip.id, trip.departure_time, trip.status), (1, datetime(2024, 1, 15, 9, 0), "in_progress"))
+        self.assertIsNone(trip._interval_index)
+
+
+class TestChangeLog(DataManagerTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.directory = self.path("wal")
+
+    def mutate(self):
+        self.system.trips[1].start_trip()
+        self.system.trips[2].update_times(datetime(2024, 1, 15, 11, 30), datetime(2024, 1, 15, 12, 10))
+        self.system.passengers[1].cancel_ticket(1)
+        self.system.passengers[2].tickets[1].update_price(99.0)
+        self.system.passengers[0].buy_tickets([(self.system.trips[3], 30.0), (self.system.trips[4], 35.0)])
+        self.system.routes[0].add_stop("Парк")
+        self.system.routes[0].remove_stop("Университет")
+        self.system.company.hire_driver(Driver(3, "Сидоров Сидор", "EF000001"))
+        self.system.company.get_driver_by_id(3).assign_trip(self.system.trips[4])
+        self.system.company.transports[1].update_info("Ласточка-2", 450)
+        self.system.company.remove_transport(3)
+        self.system.add_trip(Trip(6, date(2024, 1, 16), datetime(2024, 1, 16, 8, 0), datetime(2024, 1, 16, 9, 0)))
+        self.system.add_passenger(Passenger(4, "Пассажир 4", "+79991234564"))
+
+    def recovered(self) -> TransportSystem:
+        system = TransportSystem()
+        ChangeLog(self.directory, system).recover()
+        return system
+
+    def test_recovery_replays_changes(self):
+        with ChangeLog(self.directory, self.system) as log:
+            self.mutate()
+        self.assertEqual(log.seq, 13)
+
+        recovered = self.recovered()
+        self.assertEqual(DataManager.to_dict(recovered), DataManager.to_dict(self.system))
+        self.assertIs(recovered.company.get_driver_by_id(3).assigned_trips[0], recovered.trips[4])
+        self.assertEqual(recovered.trips.intervals.overlapping(datetime(2024, 1, 15, 11, 30), datetime(2024, 1, 15, 11, 45)),
+                         [recovered.trips[2]])
+
+    def test_save_cost_follows_changes(self):
+        with ChangeLog(self.directory, self.system, snapshot_every=4):
+            self.mutate()
+        files = sorted(os.listdir(self.directory))
+        self.assertEqual(files, ["changes-000000000012.log", "snapshot-000000000012.bin"])
+        with open(os.path.join(self.directory, files[0]), encoding="utf-8") as f:
+            self.assertEqual([json.loads(line)["seq"] for line in f], [13])
+
+        recovered = TransportSystem()
+        self.assertEqual(ChangeLog(self.directory, recovered).recover(), 1)
+        self.assertEqual(DataManager.to_dict(recovered), DataManager.to_dict(self.system))
+
+    def test_only_changes_of_the_system_are_logged(self):
+        other = make_system()
+        outside = Trip(7, date(2024, 1, 17), datetime(2024, 1, 17, 8, 0), datetime(2024, 1, 17, 9, 0))
+        with ChangeLog(self.directory, self.system) as log:
+            other.trips[1].start_trip()
+            other.passengers[1].cancel_ticket(1)
+            outside.start_trip()
+            self.system.passengers[1].cancel_ticket(1)
+        self.assertEqual(log.seq, 1)
+
+        with open(os.path.join(self.directory, "changes-000000000000.log"), encoding="utf-8") as f:
+            entry = json.loads(f.read())
+        self.assertEqual((entry["entity"], entry["id"], entry["action"]), ("passenger", 2, "cancel_ticket"))
+        self.assertEqual(DataManager.to_dict(self.recovered()), DataManager.to_dict(self.system))
+
+    def test_snapshot_waits_for_sale_in_progress(self):
+        passenger, trip = self.system.passengers[0], self.system.trips[1]
+        attach = self.system.ledger.attach
+        entered, release = threading.Event(), threading.Event()
+
+        def slow_attach(ticket):
+            entered.set()
+            release.wait(5)
+            attach(ticket)
+
+        with ChangeLog(self.directory, self.system) as log:
+            with mock.patch.object(self.system.ledger, "attach", slow_attach):
+                sale = threading.Thread(target=self.system.sell_ticket, args=(passenger, trip, 50.0))
+                sale.start()
+                self.assertTrue(entered.wait(5))
+                snapshot = threading.Thread(target=log.checkpoint)
+                snapshot.start()
+                snapshot.join(0.2)
+                self.assertTrue(snapshot.is_alive())
+                release.set()
+                sale.join()
+                snapshot.join()
+
+        self.assertEqual(DataManager.to_dict(self.recovered()), DataManager.to_dict(self.system))
+
+    def test_torn_last_line_is_dropped(self):
+        with ChangeLog(self.directory, self.system):
+            self.system.trips[1].start_trip()
+            self.system.trips[1].finish_trip()
+        with open(os.path.join(self.directory, "changes-000000000000.log"), "ab") as f:
+            f.write(b'{"seq": 3, "entity": "trip", "id"')
+
+        system = TransportSystem()
+        log = ChangeLog(self.directory, system)
+        self.assertEqual(log.recover(), 2)
+        self.assertEqual(system.trips[1].status, "completed")
+        with log:
+            system.trips[2].start_trip()
+        self.assertEqual(self.recovered().trips[2].status, "in_progress")
+
+    def test_start_requires_recover_on_existing_log(self):
+        with ChangeLog(self.directory, self.system):
+            pass
+        with self.assertRaises(RuntimeError):
+            ChangeLog(self.directory, TransportSystem()).start()
+
+    def test_replay_is_not_logged_again(self):
+        with ChangeLog(self.directory, self.system):
+            self.system.trips[1].start_trip()
+        log = ChangeLog(self.directory, TransportSystem())
+        log.recover()
+        with log:
+            pass
+        with open(os.path.join(self.directory, "changes-000000000000.log"), encoding="utf-8") as f:
+            self.assertEqual(len(f.readlines()), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,98 @@
+from datetime import datetime, date, time, timedelta
+from itertools import repeat
+from typing import Any, Callable, List, Union
+
+
+EPOCH = datetime(1970, 1, 1)
+EPOCH_ORDINAL = EPOCH.toordinal()
+MICROSECOND = timedelta(microseconds=1)
+DAY_US = 86_400_000_000
+
+
+def to_epoch_us(moment: datetime) -> int:
+    """Микросекунды от 1970-01-01 (время без часового пояса)"""
+    return (moment - EPOCH) // MICROSECOND
+
+
+def from_epoch_us(value: int) -> datetime:
+    return EPOCH + timedelta(microseconds=value)
+
+
+def to_epoch_days(day: date) -> int:
+    """Дни от 1970-01-01"""
+    return day.toordinal() - EPOCH_ORDINAL
+
+
+def from_epoch_days(value: int) -> date:
+    return date.fromordinal(value + EPOCH_ORDINAL)
+
+
+def time_of_day(value: int) -> time:
+    """Время суток по числу микросекунд от полуночи"""
+    seconds, microseconds = divmod(value, 1_000_000)
+    minutes, seconds = divmod(seconds, 60)
+    hours, minutes = divmod(minutes, 60)
+    return time(hours, minutes, seconds, microseconds)
+
+
+class DecodeCache(dict):
+    """Кэш декодированных дат: ISO-строка или число от эпохи -> значение
+
+    Даты выдачи билетов и рейсов повторяются у тысяч записей, поэтому
+    каждое встреченное значение разбирается один раз, а дальше берется
+    из словаря; одинаковые даты к тому же становятся одним объектом.
+    Обращение cache[value] при попадании не вызывает Python-кода.
+    Когда кэш достигает max_size значений, он очищается.
+    """
+
+    def __init__(self, parse: Callable[[str], Any], from_epoch: Callable[[int], Any], max_size: int = 65536):
+        super().__init__()
+        self.parse = parse
+        self.from_epoch = from_epoch
+        self.max_size = max_size
+
+    def __missing__(self, value: Union[str, int]) -> Any:
+        if len(self) >= self.max_size:
+            self.clear()
+        result = self[value] = self.from_epoch(value) if type(value) is int else self.parse(value)
+        return result
+
+
+date_cache = DecodeCache(date.fromisoformat, from_epoch_days)
+time_cache = DecodeCache(time.fromisoformat, time_of_day)
+decode_date: Callable[[Union[str, int]], date] = date_cache.__getitem__
+
+
+def decode_datetime(value: Union[str, int]) -> datetime:
+    # Departure times rarely repeat, so a cache would mostly miss
+    return from_epoch_us(value) if type(value) is int else datetime.fromisoformat(value)
+
+
+def decode_dates(values: List[Union[str, int]]) -> List[date]:
+    """Декодирует колонку дат одного формата без Python-вызова на элемент"""
+    return list(map(date_cache.__getitem__, values))
+
+
+def decode_datetimes(values: List[Union[str, int]]) -> List[datetime]:
+    """Декодирует колонку времени без Python-вызова на элемент
+
+    Формат определяется по первому значению; если колонка смешанная,
+    каждое значение декодируется по своему типу.
+    """
+    try:
+        if values and type(values[0]) is int:
+            # Day and time of day repeat far more often than the whole value,
+            # so both halves come from caches
+            days, times = zip(*map(divmod, values, repeat(DAY_US)))
+            return list(map(datetime.combine, map(date_cache.__getitem__, days), map(time_cache.__getitem__, times)))
+        return list(map(datetime.fromisoformat, values))
+    except TypeError:
+        return list(map(decode_datetime, values))
+
+
+def encode_date(day: date, epoch: bool = False) -> Union[str, int]:
+    return to_epoch_days(day) if epoch else day.isoformat()
+
+
+def encode_datetime(moment: datetime, epoch: bool = False) -> Union[str, int]:
+    return to_epoch_us(moment) if epoch else moment.isoformat()
@@ -0,0 +1,300 @@
+import json
+import os
+import re
+from datetime import datetime, date
+from threading import RLock
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from models import *
+from data_manager import DataManager
+from snapshot import read_snapshot, write_snapshot
+from timecodec import decode_datetime
+
+
+SNAPSHOT_FILE = "snapshot-{:012d}.bin"
+CHANGES_FILE = "changes-{:012d}.log"
+FILE_PATTERN = re.compile(r"(snapshot|changes)-(\d{12})\.(bin|log)$")
+
+# Model objects in change arguments are logged in the same form as in JSON files
+ENCODERS: List[Tuple[type, Callable[[Any], Any]]] = [
+    (Transport, DataManager._transport_to_dict),
+    (Driver, DataManager._driver_to_dict),
+    (Route, DataManager._route_to_dict),
+    (Trip, DataManager._trip_to_dict),
+    (Passenger, DataManager._passenger_to_dict),
+    (Ticket, DataManager._ticket_to_dict),
+]
+
+
+def encode_value(value: Any) -> Any:
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, (list, tuple)):
+        return [encode_value(item) for item in value]
+    for cls, encode in ENCODERS:
+        if isinstance(value, cls):
+            return encode(value)
+    return value
+
+
+def address_of(target: Any) -> Tuple[str, Any]:
+    """Адрес объекта в системе: (вид сущности, ключ)"""
+    if isinstance(target, TransportSystem):
+        return "system", None
+    if isinstance(target, Company):
+        return "company", None
+    if isinstance(target, Transport):
+        return "transport", target.id
+    if isinstance(target, Driver):
+        return "driver", target.id
+    if isinstance(target, Route):
+        return "route", target.id
+    if isinstance(target, Trip):
+        return "trip", target.id
+    if isinstance(target, Passenger):
+        return "passenger", target.id
+    if isinstance(target, Ticket):
+        return "ticket", [target.passenger_id, target.id]
+    raise TypeError(f"Изменения {type(target).__name__} не журналируются")
+
+
+def resolve(system: 'TransportSystem', entity: str, key: Any) -> Optional[Any]:
+    """Находит объект по адресу из журнала; None, если его уже нет"""
+    if entity == "system":
+        return system
+    if entity == "company":
+        return system.company
+    if entity == "transport":
+        return system.company.get_transport_by_id(key)
+    if entity == "driver":
+        return system.company.get_driver_by_id(key)
+    if entity == "route":
+        return system.get_route_by_id(key)
+    if entity == "trip":
+        return system.get_trip_by_id(key)
+    if entity == "passenger":
+        return system.get_passenger_by_id(key)
+    if entity == "ticket":
+        passenger = system.get_passenger_by_id(key[0])
+        return None if passenger is None else passenger.find_ticket(key[1])
+    raise ValueError(f"Неизвестная сущность в журнале: {entity}")
+
+
+def _trips(system: 'TransportSystem', trip_ids: List[int]) -> List['Trip']:
+    return [trip for trip in map(system.get_trip_by_id, trip_ids) if trip is not None]
+
+
+def _driver(system: 'TransportSystem', driver_data: Dict[str, Any]) -> 'Driver':
+    driver = DataManager._driver_from_dict(driver_data)
+    driver.assigned_trips.extend(_trips(system, driver_data["assigned_trips"]))
+    return driver
+
+
+def _assign_trip(system: 'TransportSystem', driver: 'Driver', trip_id: int):
+    trip = system.get_trip_by_id(trip_id)
+    if trip is not None:
+        driver.assign_trip(trip)
+
+
+def _assign_transport(system: 'TransportSystem', trip: 'Trip', transport_id: int):
+    transport = system.company.get_transport_by_id(transport_id)
+    if transport is not None:
+        trip.assign_transport(transport)
+
+
+# Actions whose arguments are not plain JSON values; every other action is
+# replayed as getattr(target, action)(*args).
+REPLAY: Dict[str, Callable[..., None]] = {
+    "add_transport": lambda system, company, data: company.add_transport(DataManager._transport_from_dict(data)),
+    "add_transports": lambda system, company, items: company.add_transports(map(DataManager._transport_from_dict, items)),
+    "hire_driver": lambda system, company, data: company.hire_driver(_driver(system, data)),
+    "hire_drivers": lambda system, company, items: company.hire_drivers(_driver(system, data) for data in items),
+    "assign_trip": _assign_trip,
+    "assign_transport": _assign_transport,
+    "assign_trips": lambda system, driver, trip_ids: driver.assign_trips(_trips(system, trip_ids)),
+    "update_times": lambda system, trip, departure, arrival: trip.update_times(
+        decode_datetime(departure), decode_datetime(arrival)),
+    "add_route": lambda system, _, data: system.add_route(DataManager._route_from_dict(data)),
+    "add_trip": lambda system, _, data: system.add_trip(DataManager._trip_from_dict(data)),
+    "add_passenger": lambda system, _, data: system.add_passenger(DataManager._passenger_from_dict(data)),
+    "add_ticket": lambda system, passenger, data: passenger._append_tickets(
+        [DataManager._ticket_from_dict(data, passenger.id)]),
+    "add_tickets": lambda system, passenger, items: passenger._append_tickets(
+        DataManager._ticket_from_dict(data, passenger.id) for data in items),
+}
+
+
+class ChangeLog:
+    """Журнал изменений системы с периодическими снимками
+
+    Пока журнал запущен, каждая мутация моделей (start_trip, cancel_ticket,
+    add_stop, hire_driver, ...) дописывается в changes-N.log одной строкой
+    JSON, поэтому стоимость сохранения зависит от числа изменений, а не от
+    размера системы. Каждые snapshot_every изменений система целиком
+    записывается в бинарный снимок snapshot-N.bin (см. snapshot.py), а
+    журнал начинается заново. recover() загружает последний снимок и
+    повторяет записанные после него изменения.
+
+    Запись идет через глобальный получатель изменений (set_change_recorder),
+    поэтому одновременно может работать только один журнал. Изменения
+    объектов, не входящих в систему журнала (еще не добавленных или уже
+    удаленных, а также объектов другой системы), не записываются.
+    
+    Продажа и отмена билетов из нескольких потоков держат lock журнала
+    от изменения до его записи (см. models.change_lock), а снимок пишется
+    под тем же lock, поэтому в снимок не попадает изменение, которое
+    будет записано в журнал после него.
+    """
+
+    def __init__(self, directory: str, system: 'TransportSystem', snapshot_every: int = 10_000,
+                 sync: bool = False):
+        if snapshot_every <= 0:
+            raise ValueError("snapshot_every должен быть положительным")
+        self.directory = directory
+        self.system = system
+        self.snapshot_every = snapshot_every
+        self.sync = sync
+        self.seq = 0
+        self.snapshot_seq: Optional[int] = None
+        self._file = None
+        self._previous_recorder = None
+        self.lock = RLock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, template: str, seq: int) -> str:
+        return os.path.join(self.directory, template.format(seq))
+
+    def _files(self) -> Iterator[Tuple[str, int, str]]:
+        for name in os.listdir(self.directory):
+            match = FILE_PATTERN.match(name)
+            if match:
+                yield match.group(1), int(match.group(2)), os.path.join(self.directory, name)
+
+    def latest_snapshot(self) -> Optional[int]:
+        return max((seq for kind, seq, _ in self._files() if kind == "snapshot"), default=None)
+
+    # --- восстановление ---
+
+    def recover(self) -> int:
+        """Загружает последний снимок и повторяет журнал; возвращает число изменений
+
+        Незаконченная последняя строка журнала (сбой во время записи)
+        отбрасывается. Если снимков нет, система не меняется.
+        """
+        seq = self.latest_snapshot()
+        if seq is None:
+            return 0
+        with open(self._path(SNAPSHOT_FILE, seq), "rb") as f:
+            data = f.read()
+        previous = set_change_recorder(None)
+        try:
+            with event_sink(NullSink()):
+                DataManager._clear_system(self.system)
+                read_snapshot(data, self.system)
+                replayed = self._replay(seq)
+        finally:
+            set_change_recorder(previous)
+        self.snapshot_seq = seq
+        self.seq = seq + replayed
+        return replayed
+
+    def _replay(self, seq: int) -> int:
+        filename = self._path(CHANGES_FILE, seq)
+        if not os.path.exists(filename):
+            return 0
+        with open(filename, "rb") as f:
+            content = f.read()
+        complete = content.rfind(b"\n") + 1
+        replayed = 0
+        for line in content[:complete].splitlines():
+            entry = json.loads(line)
+            if entry["seq"] != seq + replayed + 1:
+                raise ValueError(f"Разрыв в журнале {filename}: ожидалось изменение {seq + replayed + 1}")
+            self.apply(entry)
+            replayed += 1
+        if complete < len(content):
+            with open(filename, "r+b") as f:
+                f.truncate(complete)
+        return replayed
+
+    def apply(self, entry: Dict[str, Any]):
+        """Повторяет одну запись журнала на системе"""
+        target = resolve(self.system, entry["entity"], entry["id"])
+        if target is None:
+            return
+        action, args = entry["action"], entry["args"]
+        replay = REPLAY.get(action)
+        if replay is not None:
+            replay(self.system, target, *args)
+        else:
+            getattr(target, action)(*args)
+
+    # --- запись ---
+
+    def start(self):
+        """Начинает запись изменений; без снимка сначала делает полный снимок"""
+        if self._file is not None:
+            return
+        if self.snapshot_seq is None:
+            if self.latest_snapshot() is not None:
+                raise RuntimeError(f"В {self.directory} уже есть снимок: сначала вызовите recover()")
+            self.checkpoint()
+        self._file = open(self._path(CHANGES_FILE, self.snapshot_seq), "ab")
+        self._previous_recorder = set_change_recorder(self)
+
+    def stop(self):
+        if self._file is None:
+            return
+        set_change_recorder(self._previous_recorder)
+        self._previous_recorder = None
+        self._file.close()
+        self._file = None
+
+    def __enter__(self) -> 'ChangeLog':
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+    def record(self, target: Any, action: str, args: tuple):
+        entity, key = address_of(target)
+        # Only objects of this system can be found again on replay
+        if resolve(self.system, entity, key) is not target:
+            return
+        args = encode_value(args)
+        # Sales may come from several threads; entries must keep their seq order
+        with self.lock:
+            self.seq += 1
+            entry = {"seq": self.seq, "entity": entity, "id": key, "action": action, "args": args}
+            self._file.write(json.dumps(entry, ensure_ascii=False).encode("utf-8") + b"\n")
+            self._file.flush()
+            if self.sync:
+                os.fsync(self._file.fileno())
+            if self.seq - self.snapshot_seq >= self.snapshot_every:
+                self.checkpoint()
+
+    def checkpoint(self):
+        """Записывает полный снимок и начинает новый журнал
+
+        Снимок пишется во временный файл и атомарно переименовывается,
+        поэтому сбой во время записи оставляет предыдущий снимок и журнал.
+        """
+        with self.lock:
+            filename = self._path(SNAPSHOT_FILE, self.seq)
+            try:
+                with open(filename + ".tmp", "wb") as f:
+                    write_snapshot(self.system, f)
+                    f.flush()
+                    os.fsync(f.fileno())
+            except BaseException:
+                os.remove(filename + ".tmp")
+                raise
+            os.replace(filename + ".tmp", filename)
+            self.snapshot_seq = self.seq
+            if self._file is not None:
+                self._file.close()
+                self._file = open(self._path(CHANGES_FILE, self.seq), "wb")
+            for kind, seq, path in list(self._files()):
+                if seq < self.snapshot_seq:
+                    os.remove(path)
@@ -0,0 +1,125 @@
+import os
+import random
+import re
+import tempfile
+import time
+import tracemalloc
+from typing import Iterable, List
+
+from regular import PhoneNumberExtractor
+
+
+# phone_pattern before the lookahead was added
+FOUR_PASS_PATTERN = re.compile(r'(?:\+7|8|7)?\s*[\(\-\s]*(\d{3})[\)\-\s]*\s*(\d{3})[\-\s]*(\d{2})[\-\s]*(\d{2})')
+
+
+WORDS = ["звоните", "контакты", "офис", "доставка", "<div class=\"phone\">", "</div>", "<a href=\"/about\">",
+         "</a>", "заказ", "номер", "2024", "с 9 до 18", "ул. Ленина, 15", "скидка 30%", "id=12345", "\n"]
+FORMATS = ["+7 ({}) {}-{}-{}", "8 ({}) {}-{}-{}", "{}-{}-{}-{}", "{}{}{}{}", "+7 {} {} {}{}", "8-{}-{}-{}-{}"]
+
+
+def make_corpus(size: int = 4_000_000, phone_every: int = 40, seed: int = 42) -> str:
+    """Текст размером около size символов: слова и разметка вперемешку с номерами разных форматов"""
+    rnd = random.Random(seed)
+    parts: List[str] = []
+    length = 0
+    while length < size:
+        if rnd.randrange(phone_every) == 0:
+            digits = (f"{rnd.randrange(900, 1000)}", f"{rnd.randrange(1000):03d}",
+                      f"{rnd.randrange(100):02d}", f"{rnd.randrange(100):02d}")
+            part = rnd.choice(FORMATS).format(*digits)
+        else:
+            part = rnd.choice(WORDS)
+        parts.append(part)
+        length += len(part) + 1
+    return " ".join(parts)
+
+
+def four_pass_extract(extractor: PhoneNumberExtractor, text: str) -> List[str]:
+    """Прежний вариант extract_phone_numbers: отдельный проход на каждый шаблон"""
+    phones = []
+    for match in FOUR_PASS_PATTERN.findall(text):
+        phones.append(f"+7 ({match[0]}) {match[1]}-{match[2]}-{match[3]}")
+    for pattern in extractor.alternative_patterns:
+        phones.extend(pattern.findall(text))
+    return list(set(phones))
+
+
+def timed(func, *args):
+    started = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - started, result
+
+
+def peak_memory(func, *args) -> int:
+    """Пик памяти Python-объектов при вызове"""
+    tracemalloc.start()
+    try:
+        func(*args)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def bench_single_pass(size: int = 4_000_000):
+    """Сравнивает один проход по тексту с четырьмя отдельными"""
+    extractor = PhoneNumberExtractor()
+    text = make_corpus(size)
+    before, expected = timed(four_pass_extract, extractor, text)
+    after, phones = timed(extractor.extract_phone_numbers, text)
+    print(f"Текст {len(text) / 1e6:.1f} млн символов, найдено {len(phones)} записей номеров")
+    print(f"Четыре прохода: {before:.3f} с, один проход: {after:.3f} с ({before / after:.1f}x)")
+    print(f"Результаты {'совпадают' if set(phones) == set(expected) else 'РАЗЛИЧАЮТСЯ'}")
+
+
+def bench_streaming(size: int = 10_000_000):
+    """Чтение файла целиком против потокового чтения кусками и через mmap"""
+    extractor = PhoneNumberExtractor()
+    with tempfile.TemporaryDirectory() as tmpdir:
+        filename = os.path.join(tmpdir, "corpus.txt")
+        with open(filename, "w", encoding="utf-8") as file:
+            file.write(make_corpus(size))
+
+        def whole():
+            with open(filename, encoding="utf-8") as file:
+                text = file.read()
+            return len(["+7" + "".join(match.groups()) for match in extractor.phone_pattern.finditer(text)])
+
+        def streamed(mode, use_mmap):
+            with open(filename, mode) as file:
+                return sum(1 for _ in extractor.iter_phone_numbers(file, use_mmap=use_mmap))
+
+        print(f"Файл {os.path.getsize(filename) / 1e6:.0f} МБ")
+        for name, func, args in [("file.read() целиком", whole, ()),
+                                 ("кусками, текст", streamed, ("r", False)),
+                                 ("кусками, байты", streamed, ("rb", False)),
+                                 ("mmap", streamed, ("rb", True))]:
+            elapsed, count = timed(func, *args)
+            peak = peak_memory(func, *args)
+            print(f"{name:<20} {elapsed:.3f} с, пик памяти {peak / 1e6:.1f} МБ, номеров {count}")
+
+
+def bench_parallel(workers: Iterable[int] = (1, 2, 4), files: int = 8, size: int = 4_000_000):
+    """Пропускная способность extract_from_files в зависимости от числа процессов"""
+    extractor = PhoneNumberExtractor()
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for i in range(files):
+            with open(os.path.join(tmpdir, f"page-{i}.html"), "w", encoding="utf-8") as file:
+                file.write(make_corpus(size, seed=i))
+        total = sum(os.path.getsize(os.path.join(tmpdir, name)) for name in os.listdir(tmpdir))
+        print(f"Файлов {files}, всего {total / 1e6:.0f} МБ, ядер {os.cpu_count()}")
+        baseline = None
+        for count in workers:
+            elapsed, phones = timed(extractor.extract_from_files, [tmpdir], count, size // 2)
+            baseline = baseline or elapsed
+            print(f"Процессов {count}: {elapsed:.3f} с, {total / elapsed / 1e6:.1f} МБ/с "
+                  f"({baseline / elapsed:.1f}x), уникальных номеров {len(phones)}")
+
+
+if __name__ == "__main__":
+    print("\n=== ОДИН ПРОХОД ПО ТЕКСТУ ===")
+    bench_single_pass()
+    print("\n=== ПОТОКОВОЕ ЧТЕНИЕ ===")
+    bench_streaming()
+    print("\n=== ПАРАЛЛЕЛЬНАЯ ОБРАБОТКА ФАЙЛОВ ===")
+    bench_parallel()
@@ -0,0 +1,127 @@
+import json
+import sqlite3
+import threading
+from typing import Dict, List, NamedTuple, Optional
+
+
+class CachedPage(NamedTuple):
+    etag: Optional[str]
+    last_modified: Optional[str]
+    phones: List[str]
+
+    def request_headers(self) -> Dict[str, str]:
+        """Заголовки условного запроса: сервер ответит 304, если страница не менялась"""
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+class PhoneCache:
+    """Дисковый кэш страниц: url -> ETag, Last-Modified и найденные номера
+
+    Хранится в одном файле SQLite. Когда записей больше max_entries или
+    их суммарный размер больше max_bytes, удаляются давно не
+    использованные записи (LRU); использованием считаются get и put.
+    Запись больше max_bytes не сохраняется: ради нее пришлось бы удалить
+    весь кэш.
+    Объект можно использовать из нескольких потоков, но файл кэша не
+    должен одновременно открываться в нескольких процессах: число и
+    размер записей считаются в памяти.
+    """
+
+    def __init__(self, path: str, max_entries: int = 10_000, max_bytes: int = 64 << 20):
+        if max_entries <= 0 or max_bytes <= 0:
+            raise ValueError("max_entries и max_bytes должны быть положительными")
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        # A cache can afford to lose the last writes on a crash
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS pages (url TEXT PRIMARY KEY, etag TEXT, last_modified TEXT,"
+                         " phones TEXT NOT NULL, size INTEGER NOT NULL, used INTEGER NOT NULL)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS pages_used ON pages (used)")
+        self._count, self._bytes, last_used = self._db.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(MAX(used), 0) FROM pages").fetchone()
+        self._clock = last_used
+
+    def _tick(self) -> int:
+        self._clock += 1
+        return self._clock
+
+    def get(self, url: str) -> Optional[CachedPage]:
+        with self._lock:
+            row = self._db.execute("SELECT etag, last_modified, phones FROM pages WHERE url = ?", (url,)).fetchone()
+            if row is None:
+                return None
+            self._db.execute("UPDATE pages SET used = ? WHERE url = ?", (self._tick(), url))
+        return CachedPage(row[0], row[1], json.loads(row[2]))
+
+    def put(self, url: str, etag: Optional[str], last_modified: Optional[str], phones: List[str]):
+        phones_json = json.dumps(phones, ensure_ascii=False)
+        size = len(url) + len(etag or "") + len(last_modified or "") + len(phones_json)
+        with self._lock:
+            if size > self.max_bytes:
+                # The old entry describes an older version of the page
+                self._forget(url)
+                return
+            count, total = self._count, self._bytes
+            self._db.execute("BEGIN")
+            try:
+                self._forget(url)
+                self._db.execute("INSERT INTO pages VALUES (?, ?, ?, ?, ?, ?)",
+                                 (url, etag, last_modified, phones_json, size, self._tick()))
+                self._count += 1
+                self._bytes += size
+                self._evict()
+                self._db.execute("COMMIT")
+            except BaseException:
+                if self._db.in_transaction:
+                    self._db.execute("ROLLBACK")
+                self._count, self._bytes = count, total
+                raise
+
+    def discard(self, url: str):
+        with self._lock:
+            self._forget(url)
+
+    def _forget(self, url: str):
+        row = self._db.execute("SELECT size FROM pages WHERE url = ?", (url,)).fetchone()
+        if row is not None:
+            self._db.execute("DELETE FROM pages WHERE url = ?", (url,))
+            self._count -= 1
+            self._bytes -= row[0]
+
+    def _evict(self):
+        if self._count <= self.max_entries and self._bytes <= self.max_bytes:
+            return
+        victims = []
+        for url, size in self._db.execute("SELECT url, size FROM pages ORDER BY used"):
+            if self._count <= self.max_entries and self._bytes <= self.max_bytes:
+                break
+            victims.append((url,))
+            self._count -= 1
+            self._bytes -= size
+        self._db.executemany("DELETE FROM pages WHERE url = ?", victims)
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __contains__(self, url: str) -> bool:
+        with self._lock:
+            return self._db.execute("SELECT 1 FROM pages WHERE url = ?", (url,)).fetchone() is not None
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def __enter__(self) -> 'PhoneCache':
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
@@ -1,9 +1,24 @@
+import sys
+
 from regular import PhoneNumberExtractor
 
 
 if __name__ == "__main__":
 
     extractor = PhoneNumberExtractor()
+
+    # =-=-Поиск телефонов в файлах из командной строки ("-" - stdin)-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=
+
+    if len(sys.argv) > 1:
+        for path in sys.argv[1:]:
+            if path == "-":
+                for phone in extractor.iter_phone_numbers(sys.stdin.buffer):
+                    print(phone)
+                continue
+            with open(path, "rb") as file:
+                for phone in extractor.iter_phone_numbers(file, use_mmap=True):
+                    print(phone)
+        sys.exit()
     
     # =-=-Поиск телефонов по URL-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=
 
@@ -43,6 +58,5 @@ if __name__ == "__main__":
     
 
     with open("phone.txt","r") as file:
-        file_phones = extractor.extract_phone_numbers(file.read())
-        for phone in file_phones:
+        for phone in extractor.iter_phone_numbers(file):
             print(f"{phone}")
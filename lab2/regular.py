@@ -1,15 +1,80 @@
+import asyncio
+import io
+import mmap
+import os
 import re
 import requests
-from typing import List, Tuple
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, BinaryIO, Dict, Iterable, Iterator, List, Optional, Pattern, TextIO, Tuple, Union
+from urllib.parse import urlsplit
+
+from http_cache import CachedPage, PhoneCache
 import unittest
 from unittest.mock import patch, Mock
 
+# How far past a phone_pattern match an alternative match starting inside it may end
+ALTERNATIVE_OVERHANG = 32
+# Characters at the end of a chunk that are scanned again with the next chunk;
+# longer than any number the patterns match unless it contains long whitespace runs
+CHUNK_OVERLAP = 64
+DEFAULT_CHUNK_SIZE = 1 << 20
+# Files larger than this are split at line boundaries between worker processes
+DEFAULT_SPLIT_SIZE = 8 << 20
+# Responses worth another attempt in get_phones_from_urls
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+
+def iter_files(paths: Iterable[str]) -> Iterator[str]:
+    """Файлы по списку путей; каталоги обходятся рекурсивно в порядке имен"""
+    for path in paths:
+        if not os.path.isdir(path):
+            yield path
+            continue
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for name in sorted(files):
+                yield os.path.join(root, name)
+
+
+def file_ranges(paths: Iterable[str], split_size: int = DEFAULT_SPLIT_SIZE) -> Iterator[Tuple[str, int, int]]:
+    """Делит файлы на диапазоны байт (путь, начало, конец) около split_size, заканчивающиеся концом строки"""
+    for path in iter_files(paths):
+        size = os.path.getsize(path)
+        if size == 0:
+            continue
+        if size <= split_size:
+            yield path, 0, size
+            continue
+        with open(path, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            start = 0
+            while start < size:
+                newline = mapped.find(b"\n", min(start + split_size, size) - 1)
+                end = size if newline < 0 else newline + 1
+                yield path, start, end
+                start = end
+
+
+def scan_file_range(pattern: Pattern[bytes], path: str, start: int, end: int) -> List[str]:
+    """Нормализованные номера диапазона файла без повторов в порядке появления"""
+    with open(path, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        return list(dict.fromkeys("+7" + b"".join(match.groups()).decode()
+                                  for match in pattern.finditer(mapped, start, end)))
+
 class PhoneNumberExtractor:
     """Класс для извлечения и проверки телефонных номеров"""
     
-    def __init__(self):
+    def __init__(self, cache: Optional[PhoneCache] = None):
+        # Pages already scanned by get_phones_from_url(s); they are requested
+        # conditionally and, if unchanged, answered from the cache
+        self.cache = cache
+        
+        # Matches exactly what (?:\+7|8|7)?\s*[\(\-\s]*(\d{3})[\)\-\s]*\s*(\d{3})... does:
+        # the lookahead rejects positions that cannot start a number before the
+        # pattern is tried, and "\s*[...\s]*" pairs are merged into one run so
+        # they do not backtrack into each other on long whitespace
         self.phone_pattern = re.compile(
-            r'(?:\+7|8|7)?\s*[\(\-\s]*(\d{3})[\)\-\s]*\s*(\d{3})[\-\s]*(\d{2})[\-\s]*(\d{2})'
+            r'(?=[+(\-\s]*\d)(?:\+7|8|7)?[\(\-\s]*(\d{3})[\)\-\s]*(\d{3})[\-\s]*(\d{2})[\-\s]*(\d{2})'
         )
         
         self.alternative_patterns = [
@@ -20,21 +85,108 @@ class PhoneNumberExtractor:
 
             re.compile(r'\d{3}[\-\s]?\d{3}[\-\s]?\d{2}[\-\s]?\d{2}'),
         ]
+        
+        # For binary files and mmap; \d and \s match only ASCII there
+        self.phone_pattern_bytes = re.compile(self.phone_pattern.pattern.encode())
     
-    def extract_phone_numbers(self, text: str) -> List[str]:
-        """Извлекает все телефонные номера из текста"""
-        phones = []
+    def scan_phone_numbers(self, text: str) -> Iterator[str]:
+        """Находит номера за один проход по тексту в порядке их появления
         
-        matches = self.phone_pattern.findall(text)
-        for match in matches:
-            phone = f"+7 ({match[0]}) {match[1]}-{match[2]}-{match[3]}"
-            phones.append(phone)
+        Для каждого совпадения phone_pattern выдает номер в виде
+        "+7 (XXX) XXX-XX-XX", а затем записи альтернативных форматов,
+        которые начинаются внутри этого совпадения. Повторы не убираются.
+        """
+        # Text matched by an alternative pattern at some position is matched
+        # by phone_pattern there too, so every alternative match starts inside
+        # a phone_pattern match. Each alternative keeps its own position to
+        # find the same non-overlapping matches as a separate scan would
+        searches = [pattern.search for pattern in self.alternative_patterns]
+        positions = [0] * len(searches)
+        for match in self.phone_pattern.finditer(text):
+            start, end = match.span()
+            yield "+7 (%s) %s-%s-%s" % match.groups()
+            found = []
+            for i, search in enumerate(searches):
+                alternative = search(text, max(positions[i], start), end + ALTERNATIVE_OVERHANG)
+                while alternative is not None and alternative.start() < end:
+                    found.append(alternative)
+                    positions[i] = alternative.end()
+                    alternative = search(text, positions[i], end + ALTERNATIVE_OVERHANG)
+            if found:
+                found.sort(key=re.Match.start)
+                yield from (alternative.group() for alternative in found)
+    
+    def extract_phone_numbers(self, text: str) -> List[str]:
+        """Извлекает все телефонные номера из текста без повторов в порядке появления"""
+        return list(dict.fromkeys(self.scan_phone_numbers(text)))
+    
+    def iter_phone_numbers(self, fileobj: Union[TextIO, BinaryIO], chunk_size: int = DEFAULT_CHUNK_SIZE,
+                           use_mmap: bool = False) -> Iterator[str]:
+        """Лениво выдает нормализованные номера ("+7XXXXXXXXXX") из файла или stdin
         
-        for pattern in self.alternative_patterns:
-            matches = pattern.findall(text)
-            phones.extend(matches)
+        Файл читается кусками по chunk_size символов (байт), конец куска
+        просматривается еще раз вместе со следующим, поэтому номер на
+        границе кусков не теряется, а память не зависит от размера файла.
+        Номер выдается при каждой встрече, повторы не убираются.
+        С use_mmap обычный файл отображается в память и просматривается
+        целиком без чтения кусками; если отобразить его нельзя (pipe,
+        пустой файл), используется чтение кусками.
+        """
+        if chunk_size <= 0:
+            raise ValueError("chunk_size должен быть положительным")
+        if use_mmap:
+            try:
+                mapped = mmap.mmap(fileobj.fileno(), 0, access=mmap.ACCESS_READ)
+            except (AttributeError, io.UnsupportedOperation, OSError, ValueError):
+                mapped = None
+            if mapped is not None:
+                with mapped:
+                    for match in self.phone_pattern_bytes.finditer(mapped):
+                        yield "+7" + b"".join(match.groups()).decode()
+                return
+        yield from self._iter_chunks(fileobj, chunk_size)
+    
+    def extract_from_files(self, paths: Iterable[str], workers: Optional[int] = None,
+                           split_size: int = DEFAULT_SPLIT_SIZE) -> List[str]:
+        """Нормализованные номера из файлов и каталогов, найденные в пуле процессов
         
-        return list(set(phones))
+        Файлы больше split_size делятся по границам строк, каждый диапазон
+        просматривается отдельным заданием, а результаты объединяются без
+        повторов в порядке файлов и появления в них. Номер, разорванный
+        переводом строки на границе диапазонов, не находится. По умолчанию
+        процессов столько же, сколько ядер.
+        """
+        if split_size <= 0:
+            raise ValueError("split_size должен быть положительным")
+        jobs = list(file_ranges(paths, split_size))
+        if workers is None:
+            workers = os.cpu_count() or 1
+        if workers <= 1 or len(jobs) <= 1:
+            results = [scan_file_range(self.phone_pattern_bytes, *job) for job in jobs]
+        else:
+            with ProcessPoolExecutor(max_workers=min(workers, len(jobs))) as pool:
+                patterns = [self.phone_pattern_bytes] * len(jobs)
+                results = list(pool.map(scan_file_range, patterns, *zip(*jobs)))
+        return list(dict.fromkeys(phone for phones in results for phone in phones))
+    
+    def _iter_chunks(self, fileobj: Union[TextIO, BinaryIO], chunk_size: int) -> Iterator[str]:
+        buffer = fileobj.read(chunk_size)
+        binary = isinstance(buffer, bytes)
+        pattern = self.phone_pattern_bytes if binary else self.phone_pattern
+        while buffer:
+            chunk = fileobj.read(chunk_size)
+            # A match that comes too close to the end of the buffer might be
+            # found differently once more text arrives, so it waits for it
+            limit = len(buffer) - CHUNK_OVERLAP if chunk else len(buffer)
+            carry = max(limit, 0)
+            for match in pattern.finditer(buffer):
+                if match.end() > limit:
+                    carry = min(carry, match.start())
+                    break
+                groups = b"".join(match.groups()).decode() if binary else "".join(match.groups())
+                yield "+7" + groups
+                carry = max(carry, match.end())
+            buffer = buffer[carry:] + chunk if chunk else chunk
     
     def validate_phone_number(self, phone: str) -> bool:
         """Проверяет корректность телефонного номера"""
@@ -67,17 +219,108 @@ class PhoneNumberExtractor:
     def get_phones_from_url(self, url: str) -> List[str]:
         """Получает телефонные номера с веб-страницы"""
         try:
-            response = requests.get(url, timeout=10)
+            cached = self._cached(url)
+            if cached is None:
+                response = requests.get(url, timeout=10)
+            else:
+                response = requests.get(url, timeout=10, headers=cached.request_headers())
+                if response.status_code == 304:
+                    return list(cached.phones)
             response.raise_for_status()
             
-
-            phones = self.extract_phone_numbers(response.text)
-            
-
-            valid_phones = [phone for phone in phones if self.validate_phone_number(phone)]
-            
-            return valid_phones
+            return self._page_phones(url, response.text, response.headers)
             
         except Exception as e:
             print(f"Ошибка при загрузке страницы: {e}")
-            return []
\ No newline at end of file
+            return []
+    
+    def _valid_phones(self, text: str) -> List[str]:
+        phones = self.extract_phone_numbers(text)
+        return [phone for phone in phones if self.validate_phone_number(phone)]
+    
+    def _cached(self, url: str) -> Optional[CachedPage]:
+        return None if self.cache is None else self.cache.get(url)
+    
+    def _page_phones(self, url: str, text: str, headers) -> List[str]:
+        """Номера загруженной страницы; запоминаются в кэше, если ее можно проверить условным запросом"""
+        phones = self._valid_phones(text)
+        if self.cache is not None:
+            etag, last_modified = headers.get("ETag"), headers.get("Last-Modified")
+            if etag or last_modified:
+                self.cache.put(url, etag, last_modified, phones)
+            else:
+                self.cache.discard(url)
+        return phones
+    
+    async def get_phones_from_urls(self, urls: Iterable[str], concurrency: int = 10, per_host: int = 4,
+                                   timeout: float = 10, retries: int = 2, backoff: float = 0.5) -> Dict[str, List[str]]:
+        """Получает номера с многих страниц параллельно: url -> номера, как у get_phones_from_url
+        
+        Одновременно загружается не больше concurrency страниц и не больше
+        per_host с одного хоста. requests.Session не потокобезопасна, поэтому
+        у каждого потока пула своя Session, через которую соединения с
+        хостом переиспользуются (keep-alive). Ошибка
+        соединения, тайм-аут и ответы из RETRY_STATUSES повторяются до
+        retries раз с паузой backoff, 2 * backoff, ... Блокирующие запросы
+        и поиск номеров выполняются в пуле потоков, а не в цикле событий.
+        Страница, которую загрузить не удалось, дает пустой список.
+        Кэш страниц используется так же, как в get_phones_from_url.
+        """
+        if concurrency <= 0 or per_host <= 0:
+            raise ValueError("concurrency и per_host должны быть положительными")
+        urls = list(urls)
+        loop = asyncio.get_running_loop()
+        limit = asyncio.Semaphore(concurrency)
+        host_limits: Dict[str, asyncio.Semaphore] = {}
+        local = threading.local()
+        sessions: List[requests.Session] = []
+        
+        def thread_session() -> requests.Session:
+            session = getattr(local, "session", None)
+            if session is None:
+                session = local.session = requests.Session()
+                adapter = requests.adapters.HTTPAdapter(pool_connections=concurrency, pool_maxsize=concurrency)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                sessions.append(session)
+            return session
+        
+        def fetch(url: str) -> Tuple[int, str, Optional[CachedPage], Any]:
+            cached = self._cached(url)
+            headers = None if cached is None else cached.request_headers()
+            with thread_session().get(url, timeout=timeout, headers=headers) as response:
+                # Reading the body first lets the connection go back to the pool
+                text = response.text
+                if response.status_code not in RETRY_STATUSES:
+                    response.raise_for_status()
+                return response.status_code, text, cached, response.headers
+        
+        async def load(pool: ThreadPoolExecutor, url: str) -> List[str]:
+            host_limit = host_limits.setdefault(urlsplit(url).netloc, asyncio.Semaphore(per_host))
+            for attempt in range(retries + 1):
+                try:
+                    # The host slot is taken first, so waiting for it does not hold a global slot
+                    async with host_limit, limit:
+                        status, text, cached, headers = await loop.run_in_executor(pool, fetch, url)
+                    if status == 304 and cached is not None:
+                        return list(cached.phones)
+                    if status not in RETRY_STATUSES:
+                        return await loop.run_in_executor(pool, self._page_phones, url, text, headers)
+                    error: Exception = requests.HTTPError(f"{status} для {url}")
+                except (requests.ConnectionError, requests.Timeout) as e:
+                    error = e
+                except Exception as e:
+                    print(f"Ошибка при загрузке страницы: {e}")
+                    return []
+                if attempt < retries:
+                    await asyncio.sleep(backoff * 2 ** attempt)
+            print(f"Ошибка при загрузке страницы: {error}")
+            return []
+        
+        try:
+            with ThreadPoolExecutor(concurrency) as pool:
+                results = await asyncio.gather(*(load(pool, url) for url in urls))
+        finally:
+            for session in sessions:
+                session.close()
+        return dict(zip(urls, results))
\ No newline at end of file
@@ -1,6 +1,16 @@
+import io
+import os
+import requests
+import sqlite3
+import tempfile
+import threading
+import time
 import unittest
+from contextlib import redirect_stdout
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from unittest.mock import patch, Mock
 from regular import PhoneNumberExtractor
+from http_cache import PhoneCache
 
 
 class TestPhoneNumberExtractor(unittest.TestCase):
@@ -25,6 +35,48 @@ class TestPhoneNumberExtractor(unittest.TestCase):
         self.assertIn("9991234567", result)
         self.assertIn("+7(999)1234567", result)
 
+    def test_extract_in_document_order(self):
+        text = "Еще: 495-123-45-67, 8 (916) 123-45-67 и снова 495-123-45-67; 71234567890"
+        result = self.extractor.extract_phone_numbers(text)
+
+        self.assertEqual(result, [
+            "+7 (495) 123-45-67", "495-123-45-67",
+            "+7 (916) 123-45-67", "8 (916) 123-45-67",
+            "+7 (712) 345-67-89", "7123456789",
+        ])
+
+    # --- iter_phone_numbers ---
+    def test_iter_phone_numbers_across_chunks(self):
+        text = "Звоните: +7 (999) 123-45-67, 8 916 765 43 21 или 495-111-22-33. " * 5
+        expected = ["+79991234567", "+79167654321", "+74951112233"] * 5
+
+        for chunk_size in (1, 7, 64, 1 << 20):
+            self.assertEqual(list(self.extractor.iter_phone_numbers(io.StringIO(text), chunk_size)), expected)
+        self.assertEqual(list(self.extractor.iter_phone_numbers(io.BytesIO(text.encode()), 5)), expected)
+
+    def test_iter_phone_numbers_mmap(self):
+        with tempfile.TemporaryFile() as file:
+            file.write("Тел.: 8 (916) 765-43-21\n+7 999 1234567".encode())
+            file.seek(0)
+            result = list(self.extractor.iter_phone_numbers(file, use_mmap=True))
+
+        self.assertEqual(result, ["+79167654321", "+79991234567"])
+        # A stream without a file descriptor is read in chunks
+        self.assertEqual(list(self.extractor.iter_phone_numbers(io.StringIO("8 916 765 43 21"), use_mmap=True)),
+                         ["+79167654321"])
+
+    def test_extract_from_files(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            os.mkdir(os.path.join(tmpdir, "pages"))
+            with open(os.path.join(tmpdir, "a.txt"), "w", encoding="utf-8") as file:
+                file.write("Офис: 8 (916) 765-43-21\n" * 50 + "Склад: 495-111-22-33\n")
+            with open(os.path.join(tmpdir, "pages", "b.html"), "w", encoding="utf-8") as file:
+                file.write("<p>+7 (495) 111-22-33</p>\n<p>+7 999 1234567</p>\n")
+
+            for workers in (1, 2):
+                result = self.extractor.extract_from_files([tmpdir], workers=workers, split_size=100)
+                self.assertEqual(result, ["+79167654321", "+74951112233", "+79991234567"])
+
     # --- validate_phone_number ---
     def test_validate_phone_number(self):
         self.assertTrue(self.extractor.validate_phone_number("+7 (999) 123-45-67"))
@@ -70,6 +122,25 @@ class TestPhoneNumberExtractor(unittest.TestCase):
         self.assertEqual(result, ["+7 (999) 111-22-33"])
         mock_get.assert_called_once_with("http://example.com", timeout=10)
 
+    @patch("regular.requests.get")
+    def test_get_phones_from_url_cached(self, mock_get):
+        page = Mock(status_code=200, text="Наш телефон: +7 (999) 111-22-33", headers={"ETag": '"v1"'})
+        mock_get.return_value = page
+        with tempfile.TemporaryDirectory() as tmpdir, PhoneCache(os.path.join(tmpdir, "cache.db")) as cache:
+            extractor = PhoneNumberExtractor(cache)
+            self.assertEqual(extractor.get_phones_from_url("http://example.com"), ["+7 (999) 111-22-33"])
+
+            mock_get.return_value = Mock(status_code=304, headers={})
+            with patch.object(extractor, "extract_phone_numbers") as extract:
+                self.assertEqual(extractor.get_phones_from_url("http://example.com"), ["+7 (999) 111-22-33"])
+            extract.assert_not_called()
+            mock_get.assert_called_with("http://example.com", timeout=10, headers={"If-None-Match": '"v1"'})
+
+            # A page without validators cannot be revalidated and leaves the cache
+            mock_get.return_value = Mock(status_code=200, text="нет номеров", headers={})
+            self.assertEqual(extractor.get_phones_from_url("http://example.com"), [])
+            self.assertNotIn("http://example.com", cache)
+
     @patch("regular.requests.get")
     def test_get_phones_from_url_error(self, mock_get):
         mock_get.side_effect = Exception("Network error")
@@ -79,5 +150,166 @@ class TestPhoneNumberExtractor(unittest.TestCase):
         self.assertEqual(result, [])
 
 
+class TestPhoneCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "cache.db")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_least_recently_used_entries_are_evicted(self):
+        with PhoneCache(self.path, max_entries=2) as cache:
+            cache.put("a", '"1"', None, ["+7 (999) 111-22-33"])
+            cache.put("b", None, "Mon, 01 Jan 2024 00:00:00 GMT", [])
+            cache.get("a")
+            cache.put("c", '"3"', None, [])
+            self.assertEqual((len(cache), "a" in cache, "b" in cache), (2, True, False))
+
+        with PhoneCache(self.path, max_entries=2, max_bytes=40) as cache:
+            self.assertEqual(cache.get("a").request_headers(), {"If-None-Match": '"1"'})
+            cache.put("d", '"4"', None, ["+7 (999) 444-55-66"])
+            self.assertEqual([url for url in "acd" if url in cache], ["d"])
+            self.assertEqual(cache.get("d").phones, ["+7 (999) 444-55-66"])
+
+    def test_oversized_entry_is_not_stored(self):
+        with PhoneCache(self.path, max_bytes=60) as cache:
+            cache.put("a", '"1"', None, ["+7 (999) 111-22-33"])
+            cache.put("b", '"1"', None, ["+7 (999) 111-22-33"] * 5)
+            self.assertEqual((len(cache), "a" in cache, "b" in cache), (1, True, False))
+
+    def test_failed_put_is_rolled_back(self):
+        with PhoneCache(self.path, max_entries=1) as cache:
+            cache.put("a", '"1"', None, ["+7 (999) 111-22-33"])
+            with patch.object(cache, "_evict", side_effect=sqlite3.OperationalError("disk I/O error")):
+                with self.assertRaises(sqlite3.OperationalError):
+                    cache.put("b", '"2"', None, [])
+            self.assertEqual((len(cache), "a" in cache, "b" in cache), (1, True, False))
+            cache.put("c", '"3"', None, [])
+            self.assertEqual((len(cache), "a" in cache, "c" in cache), (1, False, True))
+
+
+class PageHandler(BaseHTTPRequestHandler):
+    """Локальный сервер для get_phones_from_urls: /page/N, /slow/N, /flaky, /missing, /etag"""
+    protocol_version = "HTTP/1.1"
+    lock = threading.Lock()
+    in_flight = 0
+    max_in_flight = 0
+    flaky_calls = 0
+    not_modified = 0
+    clients = set()
+
+    def do_GET(self):
+        cls = type(self)
+        with cls.lock:
+            cls.clients.add(self.client_address)
+            cls.in_flight += 1
+            cls.max_in_flight = max(cls.max_in_flight, cls.in_flight)
+        try:
+            status, body = 200, f"<p>Тел.: +7 (999) 000-00-{self.path.rsplit('/', 1)[-1].zfill(2)}</p>"
+            if self.path.startswith("/slow/"):
+                time.sleep(0.05)
+            elif self.path == "/flaky":
+                with cls.lock:
+                    cls.flaky_calls += 1
+                    if cls.flaky_calls == 1:
+                        status = 503
+                body = "<p>+7 (495) 111-22-33</p>"
+            elif self.path == "/missing":
+                status, body = 404, "нет"
+            elif self.path == "/etag":
+                body = "<p>+7 (812) 555-66-77</p>"
+                if self.headers.get("If-None-Match") == '"v1"':
+                    with cls.lock:
+                        cls.not_modified += 1
+                    status, body = 304, ""
+        finally:
+            with cls.lock:
+                cls.in_flight -= 1
+        data = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("ETag", '"v1"')
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestGetPhonesFromUrls(unittest.IsolatedAsyncioTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), PageHandler)
+        cls.base = f"http://127.0.0.1:{cls.server.server_address[1]}"
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.extractor = PhoneNumberExtractor()
+        PageHandler.max_in_flight = PageHandler.flaky_calls = PageHandler.not_modified = 0
+        PageHandler.clients = set()
+
+    async def test_pages_retries_and_errors(self):
+        urls = [f"{self.base}/page/{i}" for i in range(10)] + [f"{self.base}/flaky", f"{self.base}/missing"]
+        with redirect_stdout(io.StringIO()):
+            result = await self.extractor.get_phones_from_urls(urls, concurrency=2, backoff=0.01)
+
+        self.assertEqual(list(result), urls)
+        self.assertEqual(result[f"{self.base}/page/7"], ["+7 (999) 000-00-07"])
+        self.assertEqual(result[f"{self.base}/flaky"], ["+7 (495) 111-22-33"])
+        self.assertEqual(PageHandler.flaky_calls, 2)
+        self.assertEqual(result[f"{self.base}/missing"], [])
+        # Keep-alive: a connection per concurrent request, not per page
+        self.assertLessEqual(len(PageHandler.clients), 2)
+
+    async def test_session_per_thread(self):
+        sessions = []
+
+        class TrackingSession(requests.Session):
+            def __init__(self):
+                super().__init__()
+                self.threads = set()
+                sessions.append(self)
+
+            def get(self, *args, **kwargs):
+                self.threads.add(threading.get_ident())
+                return super().get(*args, **kwargs)
+
+        urls = [f"{self.base}/slow/{i}" for i in range(12)]
+        with patch("regular.requests.Session", TrackingSession):
+            result = await self.extractor.get_phones_from_urls(urls, concurrency=3)
+
+        self.assertEqual(result[urls[11]], ["+7 (999) 000-00-11"])
+        self.assertLessEqual(len(sessions), 3)
+        self.assertEqual([len(session.threads) for session in sessions], [1] * len(sessions))
+        self.assertEqual(len({thread for session in sessions for thread in session.threads}), len(sessions))
+
+    async def test_per_host_limit(self):
+        urls = [f"{self.base}/slow/{i}" for i in range(8)]
+        result = await self.extractor.get_phones_from_urls(urls, concurrency=8, per_host=2)
+
+        self.assertEqual(result[urls[3]], ["+7 (999) 000-00-03"])
+        self.assertLessEqual(PageHandler.max_in_flight, 2)
+
+    async def test_unchanged_pages_come_from_cache(self):
+        urls = [f"{self.base}/etag", f"{self.base}/page/5"]
+        with tempfile.TemporaryDirectory() as tmpdir, PhoneCache(os.path.join(tmpdir, "cache.db")) as cache:
+            extractor = PhoneNumberExtractor(cache)
+            first = await extractor.get_phones_from_urls(urls)
+            second = await extractor.get_phones_from_urls(urls)
+
+        self.assertEqual(first, second)
+        self.assertEqual(second, {urls[0]: ["+7 (812) 555-66-77"], urls[1]: ["+7 (999) 000-00-05"]})
+        self.assertEqual(PageHandler.not_modified, 1)
+
+
 if __name__ == "__main__":
     unittest.main()